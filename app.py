@@ -1,11 +1,27 @@
+import time
+_RERUN_START = time.perf_counter()
+
 import streamlit as st
-import tensorflow as tf
 import numpy as np
-from PIL import Image
-import io
-import matplotlib.pyplot as plt
-import seaborn as sns
-import pandas as pd
+import os
+
+from jellyfish import embeddings, evaluation, exif, inference, ood, retrain, tiling, tta, video
+from jellyfish.cache import PredictionCache, content_key, file_fingerprint
+from jellyfish.charts import (ChartCache, confidence_histogram_spec, confusion_matrix_spec, history_counts_spec,
+                              training_history_spec, video_timeline_spec)
+from jellyfish.dedup import cluster_hashes, describe
+from jellyfish.history import HISTORY_DB, HistoryStore
+from jellyfish.images import ImageStore, build_pyramid, pick_width, reference_images
+from jellyfish.metrics import METRICS as LATENCY, timer
+from jellyfish.pipeline import PreprocessPipeline, classify_sources
+from jellyfish.registry import Deployment
+from jellyfish.report import make_thumbnail, write_html_report, write_report_zip
+from jellyfish.results import (SORT_ORDERS, build_result, collapse_bursts, filter_results, page_of, public_row,
+                               sort_results, top_predictions)
+from jellyfish.session import UploadSession
+from jellyfish.species import CLASS_NAMES, JELLYFISH_INFO, STING_RISK
+
+LATENCY.observe("app.imports", time.perf_counter() - _RERUN_START)
 
 # ── Page config ──────────────────────────────────────────────
 st.set_page_config(
@@ -163,74 +179,306 @@ header[data-testid="stHeader"] {
 </style>
 """, unsafe_allow_html=True)
 
-# ── Jellyfish info database ──────────────────────────────────
-JELLYFISH_INFO = {
-    "Moon_jellyfish": {
-        "emoji": "🌙",
-        "scientific": "Aurelia aurita",
-        "habitat": "Worldwide oceans",
-        "size": "Up to 40cm bell diameter",
-        "fun_fact": "The most common jellyfish worldwide. The four pink/purple rings visible through their translucent bell are their reproductive organs.",
-        "danger": "Harmless ✅"
-    },
-    "barrel_jellyfish": {
-        "emoji": "🪼",
-        "scientific": "Rhizostoma pulmo",
-        "habitat": "Atlantic Ocean, Mediterranean Sea",
-        "size": "Up to 90cm bell diameter",
-        "fun_fact": "One of the largest jellyfish in UK waters, they are harmless to humans and are actually a food source for leatherback sea turtles.",
-        "danger": "Low ✅"
-    },
-    "blue_jellyfish": {
-        "emoji": "💙",
-        "scientific": "Cyanea lamarckii",
-        "habitat": "North Atlantic, North Sea",
-        "size": "Up to 30cm bell diameter",
-        "fun_fact": "Their vivid blue or yellow colour fades as they age. They are most commonly spotted in summer months near UK coasts.",
-        "danger": "Mild sting ⚠️"
-    },
-    "compass_jellyfish": {
-        "emoji": "🧭",
-        "scientific": "Chrysaora hysoscella",
-        "habitat": "Eastern Atlantic, Mediterranean",
-        "size": "Up to 30cm bell diameter",
-        "fun_fact": "Named after the brown compass-like markings on their bell. They are an active predator, catching small fish and crustaceans.",
-        "danger": "Moderate sting ⚠️"
-    },
-    "lions_mane_jellyfish": {
-        "emoji": "🦁",
-        "scientific": "Cyanea capillata",
-        "habitat": "Arctic, North Atlantic, North Pacific",
-        "size": "Up to 2m bell — world's largest jellyfish!",
-        "fun_fact": "The world's largest known jellyfish species. Their tentacles can extend over 30 meters — longer than a blue whale!",
-        "danger": "Strong sting 🔴"
-    },
-    "mauve_stinger_jellyfish": {
-        "emoji": "💜",
-        "scientific": "Pelagia noctiluca",
-        "habitat": "Mediterranean, Atlantic, Indo-Pacific",
-        "size": "Up to 10cm bell diameter",
-        "fun_fact": "They are bioluminescent — they glow blue-green at night when disturbed. Despite being small, their sting is surprisingly painful.",
-        "danger": "Painful sting 🔴"
-    }
-}
-
 # ── Model loading ────────────────────────────────────────────
+# TensorFlow and the model load on a background thread so pages render immediately.
+# Set JELLYFISH_PRELOAD_MODEL=0 to defer loading until the Classifier first needs it.
+# JELLYFISH_MODELS="current=a.keras,candidate=b.keras" serves several versions at once,
+# shared per JELLYFISH_SERVING_MODE (single/ab/shadow/ensemble; see jellyfish.registry)
+MODEL_SPEC = os.environ.get("JELLYFISH_MODELS", "")
+
+def make_deployment():
+    return Deployment.from_spec(MODEL_SPEC, mode=os.environ.get("JELLYFISH_SERVING_MODE", "single"),
+                                split=float(os.environ.get("JELLYFISH_AB_SPLIT", "0.1")))
+
 @st.cache_resource
+def get_model_loader():
+    loader = inference.ModelLoader(load=make_deployment if MODEL_SPEC else None)
+    if os.environ.get("JELLYFISH_PRELOAD_MODEL", "1") != "0":
+        loader.start()
+    return loader
+
 def load_model():
+    if not model_loader.ready:
+        with st.spinner("🪼 Warming up the model…"):
+            model_loader.wait()
+    if model_loader.state == "failed":
+        st.error(f"⚠️ Model file not found. Please upload `{inference.model_path()}` to your repo. Error: {model_loader.error}")
+        return None
+    return model_loader.wait()
+
+# ── Prediction cache ─────────────────────────────────────────
+# Shared across sessions and reruns; set JELLYFISH_CACHE_DB to also persist to SQLite
+@st.cache_resource
+def get_prediction_cache():
+    return PredictionCache(
+        max_entries=int(os.environ.get("JELLYFISH_CACHE_SIZE", "4096")),
+        disk_path=os.environ.get("JELLYFISH_CACHE_DB") or None,
+    )
+
+@st.cache_resource
+def fingerprint_of(model_file):
+    # Model versions are never rewritten in place, so each file is hashed once
+    return make_deployment().fingerprint() if MODEL_SPEC else file_fingerprint(model_file)
+
+def model_fingerprint():
+    # Follows hot swaps: the file behind the model the loader is serving right now
+    # (a deployment's fingerprint covers every model file plus the mode, without loading anything)
+    return fingerprint_of(None if MODEL_SPEC else model_loader.model_file or inference.model_path())
+
+# ── Batched inference ────────────────────────────────────────
+@st.cache_resource
+def get_preprocess_pipeline():
+    return PreprocessPipeline()
+
+def rewound(f):
+    f.seek(0)
+    return f
+
+def classify_uploads(model, files, keys, detector=None, calibration=""):
+    """``(probs, ood_scores)``; scores are None unless an ``(embedder, detector)`` pair is given.
+
+    ``calibration`` is the fingerprint of the detector's calibration file.
+    """
+    if not keys:
+        # e.g. every new upload was a near-duplicate of one already classified
+        return (np.empty((0, len(CLASS_NAMES)), dtype=np.float32),
+                None if detector is None else np.empty((0, len(ood.SCORES)), dtype=np.float32))
+    # Repeat uploads are answered from the cache without touching TensorFlow;
+    # misses are decoded straight from the uploaded files by the worker pool
+    cache = get_prediction_cache()
+    if detector is None:
+        return cache.get_or_compute(
+            keys, lambda missing: classify_sources(model, [rewound(files[i]) for i in missing], get_preprocess_pipeline())
+        ), None
+    # Softmax and OOD scores come from the same forward pass and are cached as one row,
+    # keyed by the calibration too since the distance scores depend on its centroids
+    embedder, ood_detector = detector
+    rows = cache.get_or_compute([f"{k}:ood:{calibration[:12]}" for k in keys], lambda missing: np.concatenate(ood.classify_sources(
+        embedder, ood_detector, [rewound(files[i]) for i in missing], get_preprocess_pipeline()), axis=1))
+    rows = np.array(rows).reshape(len(keys), -1)
+    return rows[:, :len(CLASS_NAMES)], rows[:, len(CLASS_NAMES):]
+
+# ── Test-time augmentation ───────────────────────────────────
+TTA_LABELS = {"off": "Off", "auto": "Auto (low/moderate only)", "all": "All images"}
+TTA_MODE = os.environ.get("JELLYFISH_TTA", "off")
+
+def apply_tta(model, files, keys, probs, mode):
+    """``(probs, seconds per image)``; seconds is None where TTA was skipped and 0 for cache hits."""
+    probs = np.array(probs)
+    costs = [None] * len(files)
+    selected = tta.select(probs, mode)
+    if not selected:
+        return probs, costs
+    measured = {}
+
+    def compute(missing):
+        # Only the uncertain uploads are decoded again, then all their views share one predict per batch
+        picked = [files[selected[j]] for j in missing]
+        out = []
+        for batch in get_preprocess_pipeline().batches(range(len(picked)), source=lambda j: rewound(picked[j])):
+            if batch.errors:
+                raise batch.errors[0][1]
+            p, c = tta.predict_tta(model, batch.array)
+            out.append(p)
+            measured.update((missing[j], s) for j, s in zip(batch.keys, c))
+        return np.concatenate(out, axis=0)
+
+    refined = get_prediction_cache().get_or_compute([keys[i] + tta.tag() for i in selected], compute)
+    for j, i in enumerate(selected):
+        probs[i] = refined[j]
+        costs[i] = measured.get(j, 0.0)
+    return probs, costs
+
+# ── Near-duplicate bursts ────────────────────────────────────
+# Opt-in with JELLYFISH_DEDUP=1: uploads within JELLYFISH_DEDUP_DISTANCE bits (perceptual
+# hash) of another, with matching colours, share its result instead of being classified
+DEDUP = os.environ.get("JELLYFISH_DEDUP", "0") == "1"
+
+# ── Results history ──────────────────────────────────────────
+# Every classified upload is kept in JELLYFISH_HISTORY_DB (SQLite) for the History page;
+# set JELLYFISH_HISTORY_DB= (empty) to keep nothing
+@st.cache_resource
+def get_history():
+    return HistoryStore(HISTORY_DB) if HISTORY_DB else None
+
+# EXIF capture time and GPS position are read from each upload's header bytes on
+# their own threads while the batch is classified
+@st.cache_resource
+def get_exif_reader():
+    return exif.ExifReader()
+
+# ── Out-of-distribution scoring ──────────────────────────────
+# Active once `python -m jellyfish calibrate-ood DIR` has saved <model>.ood.npz for the
+# Keras model; set JELLYFISH_OOD=0 to skip it. Not used with a JELLYFISH_MODELS deployment:
+# its probabilities would have to come from the embedding model, bypassing A/B routing,
+# shadow scoring and ensembling
+OOD = os.environ.get("JELLYFISH_OOD", "1") != "0"
+
+def ood_enabled(model):
+    return OOD and not isinstance(model, Deployment)
+
+def ood_calibration_fingerprint(model):
+    return file_fingerprint(ood.calibration_path(model_loader.current()[1])) if ood_enabled(model) else ""
+
+@st.cache_resource(show_spinner=False)
+def get_ood(_model, model_hash, calibration_hash):
+    # calibration_hash reloads the detector when calibrate-ood rewrites <model>.ood.npz
+    if not ood_enabled(_model):
+        return None
+    model_file = model_loader.current()[1]
+    if not os.path.exists(ood.calibration_path(model_file)):
+        return None
+    try:
+        embedder = embeddings.EmbeddingModel(_model)
+    except ValueError:
+        return None
+    detector = ood.OODDetector.load(model_file, embedder.head)
+    return (embedder, detector) if detector is not None else None
+
+def classify_new_uploads(model, uploads, new_files, known, tta_mode):
+    """Classify ``new_files`` into session records; ``known`` are this session's up-to-date records."""
+    # Hashed from Streamlit's upload buffer in place, without copying the bytes
+    keys = [content_key(f.getbuffer(), model_fingerprint()) for f in new_files]
+    headers = get_exif_reader().submit(exif.head(f.getbuffer()) for f in new_files)
+    # Near-duplicates of an earlier upload (or of each other) reuse its result;
+    # only one file per cluster is decoded at full size and classified
+    if DEDUP:
+        hashes = [describe(rewound(f)) for f in new_files]
+        reps = cluster_hashes(hashes, [r.get("_phash") for r in known])
+    else:
+        hashes = [None] * len(new_files)
+        reps = list(range(len(known), len(known) + len(new_files)))
+    pool = known + [None] * len(new_files)
+    todo = [i for i, rep in enumerate(reps) if rep == len(known) + i]
+    todo_files, todo_keys = [new_files[i] for i in todo], [keys[i] for i in todo]
+    calibration = ood_calibration_fingerprint(model)
+    detector = get_ood(model, model_fingerprint(), calibration)
+    first_pass, scores = classify_uploads(model, todo_files, todo_keys, detector, calibration)
+    probs, tta_costs = apply_tta(model, todo_files, todo_keys, first_pass, tta_mode)
+    flags = detector[1].describe(scores) if detector else [None] * len(todo)
+    for i, p, first, cost, flag in zip(todo, probs, first_pass, tta_costs, flags):
+        record = build_result(new_files[i].name, p, key=keys[i], ood=flag, exif=headers[i].result())
+        record.update(_tta_mode=tta_mode, _model=model_fingerprint(), _tta_seconds=cost, _first_pass_confidence=float(np.max(first)),
+                      _phash=hashes[i], _burst=keys[i], _duplicate_of=None)
+        pool[len(known) + i] = record
+    for i, rep in enumerate(reps):
+        source = pool[rep]
+        if rep != len(known) + i:
+            record = build_result(new_files[i].name, source["_preds"], key=keys[i], ood=source["_ood"],
+                                  exif=headers[i].result())
+            record.update(_tta_mode=tta_mode, _model=model_fingerprint(),
+                          _first_pass_confidence=source["_first_pass_confidence"],
+                          _tta_seconds=None if source["_tta_seconds"] is None else 0.0,
+                          _phash=hashes[i], _burst=source["_burst"], _duplicate_of=source["Filename"])
+            pool[len(known) + i] = record
+        uploads.add(new_files[i].file_id, pool[len(known) + i])
+    history = get_history()
+    if history is not None:
+        # Re-classifying a known image (e.g. under a new TTA mode) is dropped by its content key
+        history.add(pool[len(known):], model_fingerprint()[:12])
+        history.flush()
+
+# ── Head retraining ──────────────────────────────────────────
+# Corrections plus any labelled folders in JELLYFISH_RETRAIN_DIRS (os.pathsep-separated) feed
+# `retrain.retrain`; backbone embeddings are cached in JELLYFISH_FEATURE_DB across runs
+RETRAIN_DIRS = [d for d in os.environ.get("JELLYFISH_RETRAIN_DIRS", "").split(os.pathsep) if d]
+
+@st.cache_resource
+def get_feature_cache():
+    return retrain.FeatureCache()
+
+def version_label(path):
+    if path is None:
+        return f"Original ({os.path.basename(inference.MODEL_PATH)})"
+    meta = retrain.read_sidecar(path) or {}
+    return (f"v{meta.get('version', 0):03d} · {meta.get('created', '')[:10]} · {meta.get('images', 0)} images · "
+            f"held-out {meta.get('parent_accuracy', 0) * 100:.1f}% → {meta.get('accuracy', 0) * 100:.1f}%")
+
+# ── Reference gallery ────────────────────────────────────────
+# samples/ (or JELLYFISH_GALLERY_DIR) is embedded once per model into a float16 index under
+# .cache/gallery; later starts memory-map it and only embed new or changed references
+@st.cache_resource(show_spinner=False)
+def get_gallery(_model, model_hash):
     try:
-        model = tf.keras.models.load_model("best_jellyfish_model.keras")
-        return model
-    except Exception as e:
-        st.error(f"⚠️ Model file not found. Please upload `best_jellyfish_model.keras` to your repo. Error: {e}")
+        embedder = embeddings.EmbeddingModel(_model)
+    except ValueError:
+        return None, None  # TFLite backend: no feature layer to search with
+    index = embeddings.GalleryIndex(embeddings.index_dir_for(model_hash))
+    embeddings.build_gallery(embedder, index)
+    return embedder, index
+
+def embed_uploads(embedder, files, records):
+    # Only records on screen are embedded, once each; the vector stays on the record as float16
+    todo = [(f, r) for f, r in zip(files, records) if "_embedding" not in r]
+    for batch in get_preprocess_pipeline().batches(todo, source=lambda item: rewound(item[0])):
+        if batch.keys:
+            vectors, _ = embedder.embed(batch.array)
+            for (_, r), v in zip(batch.keys, vectors):
+                r["_embedding"] = v.astype(np.float16)
+
+# ── Tiled counting ───────────────────────────────────────────
+def tile_uploads(model, files, records):
+    # All tiles of every upload on screen share predict calls; the merged result stays on the record
+    todo = [(f, r) for f, r in zip(files, records) if "_tiles" not in r]
+    # getvalue() rather than the shared file position, since tiles are cut on several threads
+    for (_, r), result, error in tiling.classify_tiled(model, todo, source=lambda item: item[0].getvalue()):
+        r["_tiles"] = result if error is None else None
+
+# ── Evaluation artifact ──────────────────────────────────────
+@st.cache_data(show_spinner=False)
+def _load_evaluation(model_hash, mtime):
+    return evaluation.load_artifact(model_hash)
+
+def load_evaluation():
+    # Keyed on the artifact's mtime so a fresh `python -m jellyfish evaluate` shows up without a restart
+    model_hash = model_fingerprint()
+    path = evaluation.artifact_path(model_hash)
+    if not os.path.exists(path):
         return None
+    return _load_evaluation(model_hash, os.path.getmtime(path))
+
+# ── Chart cache ──────────────────────────────────────────────
+@st.cache_resource
+def get_chart_cache():
+    return ChartCache()
+
+# ── Display images ───────────────────────────────────────────
+# Approximate CSS widths of the image slots in the wide layout, used to pick a variant
+COLUMN_PX = {"classifier": 360, "gallery": 400, "gallery_thumb": 90}
 
-# ── Preprocessing ────────────────────────────────────────────
-def preprocess_image(image: Image.Image):
-    img = image.convert("RGB")
-    img = img.resize((224, 224))
-    arr = np.array(img, dtype=np.float32) / 255.0
-    return np.expand_dims(arr, axis=0)
+@st.cache_resource
+def get_image_store():
+    return ImageStore()
+
+# ── Upload session ───────────────────────────────────────────
+# Compact per-upload records plus lazily made thumbnails/previews, capped by
+# JELLYFISH_SESSION_BUDGET_MB and spilled to a temp dir past that
+def get_upload_session():
+    if "uploads" not in st.session_state:
+        st.session_state["uploads"] = UploadSession()
+    return st.session_state["uploads"]
+
+def upload_thumbnail(uploads, f):
+    return uploads.blob(f.file_id, "thumbnail.jpg", lambda: make_thumbnail(rewound(f)))
+
+def upload_preview(uploads, f, width):
+    return uploads.blob(f.file_id, f"preview-{width}.webp", lambda: build_pyramid(rewound(f), (width,))[width])
+
+# Reports are capped by both budgets: the built file is read into memory while it is served
+REPORT_BUDGET_BYTES = int(os.environ.get("JELLYFISH_REPORT_BUDGET_MB", "50")) * 1024 * 1024
+
+def report_download(uploads, name, signature, write, icon, label, file_name, mime, stage):
+    # Built only when asked for, streamed into the session's spill directory and read back
+    # just to serve it; it is rebuilt once the uploads, model or TTA mode change
+    path = uploads.download(name, signature)
+    if path is None:
+        if not st.button(f"{icon} Prepare {label}", key=f"prepare-{name}", use_container_width=True):
+            return
+        with st.spinner(f"Building {label}…"), timer(stage):
+            path = uploads.download(name, signature, write)
+    with open(path, "rb") as f:
+        st.download_button(label=f"{icon} Download {label}", data=f.read(), file_name=file_name, mime=mime,
+                           use_container_width=True)
 
 # ── Sidebar Navigation ───────────────────────────────────────
 st.sidebar.markdown("""
@@ -243,9 +491,14 @@ st.sidebar.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+PAGES = ["🔍 Classifier", "📊 Model Performance", "🖼️ Species Gallery", "🎥 Video", "📜 History"]
+# Diagnostics stays hidden unless JELLYFISH_DIAGNOSTICS=1 or the URL has ?diagnostics=1
+if os.environ.get("JELLYFISH_DIAGNOSTICS") == "1" or st.query_params.get("diagnostics") == "1":
+    PAGES.append("🩺 Diagnostics")
+
 page = st.sidebar.radio(
     "Navigate",
-    ["🔍 Classifier", "📊 Model Performance", "🖼️ Species Gallery"],
+    PAGES,
     label_visibility="collapsed"
 )
 
@@ -257,17 +510,10 @@ st.sidebar.markdown("""
 st.markdown('<div class="hero-title">Jellyfish Classifier</div>', unsafe_allow_html=True)
 st.markdown('<div class="hero-sub">Deep Learning · MobileNetV2 · 6 Species</div>', unsafe_allow_html=True)
 
-model = load_model()
+model_loader = get_model_loader()
+if model_loader.state == "loading":
+    st.sidebar.caption("🔄 Model warming up…")
 
-# Class names — must match your training order!
-CLASS_NAMES = [
-    "Moon_jellyfish",
-    "barrel_jellyfish",
-    "blue_jellyfish",
-    "compass_jellyfish",
-    "lions_mane_jellyfish",
-    "mauve_stinger_jellyfish",
-]
 
 # ═══════════════════════════════════════════════
 # PAGE 1 — CLASSIFIER
@@ -295,144 +541,64 @@ if page == "🔍 Classifier":
     """, unsafe_allow_html=True)
 
     if uploaded_files:
-        results = []  # collect results for CSV
-
-        for uploaded_file in uploaded_files:
-            image = Image.open(uploaded_file)
-
-            # Pre-run prediction to collect results
-            if model is not None:
-                input_arr = preprocess_image(image)
-                preds = model.predict(input_arr, verbose=0)[0]
-                top_idx = int(np.argmax(preds))
-                top_class = CLASS_NAMES[top_idx]
-                confidence = float(preds[top_idx])
-                info = JELLYFISH_INFO.get(top_class, {})
-                results.append({
-                    "Filename": uploaded_file.name,
-                    "Predicted Species": top_class.replace('_', ' ').title(),
-                    "Confidence (%)": f"{confidence*100:.1f}",
-                    "Status": "LOW" if confidence < 0.60 else "MODERATE" if confidence < 0.80 else "HIGH",
-                    "Scientific Name": info.get('scientific', ''),
-                    "Habitat": info.get('habitat', ''),
-                    "Size": info.get('size', ''),
-                    "Sting Danger": info.get('danger', '').replace('✅','').replace('⚠️','').replace('🔴','').strip(),
-                    "Note": "Verify - may not be a supported species" if confidence < 0.60 else "Consider using a clearer image" if confidence < 0.80 else "OK",
-                    "_image": image,
-                    "_confidence_raw": confidence,
-                })
+        import pandas as pd
+
+        tta_mode = st.radio(
+            "🔁 Test-time augmentation", tta.MODES, index=tta.MODES.index(TTA_MODE), horizontal=True,
+            format_func=TTA_LABELS.get,
+            help=f"Averages {tta.DEFAULT_VIEWS} flipped, cropped and brightened views of each image. "
+                 "Auto only re-checks results below 80% confidence."
+        )
+        model = load_model()
+        uploads = get_upload_session()
+        uploads.retain([f.file_id for f in uploaded_files])
+
+        # Single inference stage — every upload goes through the network exactly once
+        results = []  # one prediction record per file, shared by the CSV and the cards below
+        if model is not None:
+            # Records from another TTA mode or from the model before a hot swap are stale
+            current = [f for f in uploaded_files if f.file_id in uploads
+                       and uploads.record(f.file_id)["_tta_mode"] == tta_mode
+                       and uploads.record(f.file_id).get("_model") == model_fingerprint()]
+            new_files = [f for f in uploaded_files if f not in current]
+            if new_files:
+                classify_new_uploads(model, uploads, new_files, [uploads.record(f.file_id) for f in current], tta_mode)
+            # Identical uploads can share one stored record, so each upload gets its own view
+            # carrying its name and position; cards find their file through it. Widget keys use
+            # the file_id, plus a repeat count for a file_id that appears more than once
+            seen = {}
+            results = []
+            for i, f in enumerate(uploaded_files):
+                seen[f.file_id] = seen.get(f.file_id, -1) + 1
+                results.append(dict(uploads.record(f.file_id), Filename=f.name, _upload=i,
+                                    _widget=f.file_id if not seen[f.file_id] else f"{f.file_id}-{seen[f.file_id]}"))
+
+        duplicates = sum(1 for r in results if r["_duplicate_of"])
+        collapse = False
+        if duplicates:
+            collapse = st.toggle(f"🧬 Collapse near-duplicate bursts ({duplicates} repeat frame"
+                                 f"{'s' if duplicates != 1 else ''} reused an earlier result)")
+        if collapse:
+            results = collapse_bursts(results)
 
         # ── Download buttons at TOP ──
         if results:
-            df = pd.DataFrame([{k: v for k, v in r.items() if not k.startswith('_')} for r in results])
+            df = pd.DataFrame([public_row(r) for r in results])
 
             # ── Generate HTML report ──
-            def generate_html_report(results):
-                import base64
-
-                def img_to_base64(img):
-                    buf = io.BytesIO()
-                    img.convert("RGB").save(buf, format="JPEG")
-                    return base64.b64encode(buf.getvalue()).decode()
-
-                rows_html = ""
-                for r in results:
-                    conf = r["_confidence_raw"]
-                    if conf < 0.60:
-                        row_bg = "background:#2d0a0a; border-left: 4px solid #e74c3c;"
-                        badge = f'<span style="background:#e74c3c;color:white;padding:3px 10px;border-radius:99px;font-size:0.75rem;">⚠️ Low {conf*100:.1f}%</span>'
-                    elif conf < 0.80:
-                        row_bg = "background:#2d1a00; border-left: 4px solid #e67e22;"
-                        badge = f'<span style="background:#e67e22;color:white;padding:3px 10px;border-radius:99px;font-size:0.75rem;">🔶 Moderate {conf*100:.1f}%</span>'
-                    else:
-                        row_bg = "background:#0a1628; border-left: 4px solid #7fffd4;"
-                        badge = f'<span style="background:#1a6b4a;color:#7fffd4;padding:3px 10px;border-radius:99px;font-size:0.75rem;">✅ High {conf*100:.1f}%</span>'
-
-                    img_b64 = img_to_base64(r["_image"])
-                    note = r.get("Note", "")
-                    note_html = f'<div style="color:#e67e22;font-size:0.75rem;margin-top:0.3rem;">{note}</div>' if note else ""
-
-                    rows_html += f"""
-                    <tr style="{row_bg}">
-                        <td style="padding:12px;"><img src="data:image/jpeg;base64,{img_b64}"
-                            style="width:90px;height:90px;object-fit:cover;border-radius:10px;"/></td>
-                        <td style="padding:12px;color:#a8c8e8;font-size:0.85rem;">{r['Filename']}</td>
-                        <td style="padding:12px;">
-                            <div style="color:#7fffd4;font-weight:700;font-size:0.95rem;">{r['Predicted Species']}</div>
-                            <div style="color:#7ecfea;font-size:0.78rem;font-style:italic;">{r['Scientific Name']}</div>
-                        </td>
-                        <td style="padding:12px;">{badge}{note_html}</td>
-                        <td style="padding:12px;color:#a8c8e8;font-size:0.82rem;">{r['Habitat']}</td>
-                        <td style="padding:12px;color:#a8c8e8;font-size:0.82rem;">{r['Sting Danger']}</td>
-                    </tr>"""
-
-                total = len(results)
-                low = sum(1 for r in results if r["_confidence_raw"] < 0.60)
-                moderate = sum(1 for r in results if 0.60 <= r["_confidence_raw"] < 0.80)
-                high = sum(1 for r in results if r["_confidence_raw"] >= 0.80)
-
-                return f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <title>Jellyfish Classification Report</title>
-    <style>
-        @import url('https://fonts.googleapis.com/css2?family=Syne:wght@700;800&family=DM+Sans:wght@300;400&display=swap');
-        body {{ background: linear-gradient(160deg,#020b18,#041e3a,#062d55);
-               min-height:100vh; font-family:'DM Sans',sans-serif; color:white; margin:0; padding:2rem; }}
-        h1 {{ font-family:'Syne',sans-serif; font-size:2rem; font-weight:800;
-              background:linear-gradient(135deg,#7fffd4,#00bfff,#a78bfa);
-              -webkit-background-clip:text; -webkit-text-fill-color:transparent; margin-bottom:0; }}
-        .sub {{ color:#7ecfea; letter-spacing:3px; text-transform:uppercase; font-size:0.78rem; margin-bottom:2rem; }}
-        .summary {{ display:flex; gap:1rem; margin-bottom:2rem; }}
-        .badge {{ padding:0.6rem 1.2rem; border-radius:12px; font-size:0.85rem; font-weight:600; }}
-        table {{ width:100%; border-collapse:separate; border-spacing:0 6px; }}
-        th {{ background:rgba(0,191,255,0.08); color:#00bfff; font-size:0.7rem;
-              letter-spacing:2px; text-transform:uppercase; padding:10px 12px; text-align:left; }}
-        td {{ vertical-align:middle; }}
-        .footer {{ text-align:center; color:#2a6fa8; font-size:0.75rem; margin-top:2rem; }}
-    </style>
-</head>
-<body>
-    <h1>🪼 Jellyfish Classification Report</h1>
-    <div class="sub">MobileNetV2 · Deep Learning · 6 Species</div>
-    <div class="summary">
-        <div class="badge" style="background:rgba(127,255,212,0.1);color:#7fffd4;border:1px solid #7fffd4;">
-            ✅ High Confidence: {high}
-        </div>
-        <div class="badge" style="background:rgba(230,126,34,0.1);color:#e67e22;border:1px solid #e67e22;">
-            🔶 Moderate: {moderate}
-        </div>
-        <div class="badge" style="background:rgba(231,76,60,0.1);color:#e74c3c;border:1px solid #e74c3c;">
-            ⚠️ Low Confidence: {low}
-        </div>
-        <div class="badge" style="background:rgba(0,191,255,0.1);color:#00bfff;border:1px solid #00bfff;">
-            📊 Total: {total}
-        </div>
-    </div>
-    <table>
-        <thead>
-            <tr>
-                <th>Image</th><th>Filename</th><th>Species</th>
-                <th>Confidence</th><th>Habitat</th><th>Sting Danger</th>
-            </tr>
-        </thead>
-        <tbody>{rows_html}</tbody>
-    </table>
-    <div class="footer">Generated by Jellyfish Classifier · MobileNetV2 · Streamlit 🪼</div>
-</body>
-</html>"""
-
-            html_report = generate_html_report(results)
-
-            col_html, col_csv, _ = st.columns([1, 1, 1])
+            # Thumbnails are built once per upload and reused across reruns
+            thumbnail = lambda r: upload_thumbnail(uploads, uploaded_files[r["_upload"]])
+            signature = (tta_mode, model_fingerprint(), collapse, *(f.file_id for f in uploaded_files))
+            budget = min(REPORT_BUDGET_BYTES, uploads.budget_bytes)
+
+            col_html, col_csv, col_zip = st.columns([1, 1, 1])
             with col_html:
-                st.download_button(
-                    label=f"📊 Download HTML Report ({len(results)} image{'s' if len(results) > 1 else ''})",
-                    data=html_report,
+                report_download(
+                    uploads, "html", signature, lambda f: write_html_report(results, thumbnail, f, budget),
+                    icon="📊", label=f"HTML Report ({len(results)} image{'s' if len(results) > 1 else ''})",
                     file_name="jellyfish_report.html",
                     mime="text/html",
-                    use_container_width=True
+                    stage="generate_html_report",
                 )
             with col_csv:
                 st.download_button(
@@ -442,22 +608,107 @@ if page == "🔍 Classifier":
                     mime="text/csv",
                     use_container_width=True
                 )
+            with col_zip:
+                # External-assets variant: report.html + thumbnails/ folder, no inline base64
+                report_download(
+                    uploads, "zip", signature, lambda f: write_report_zip(results, thumbnail, f, budget),
+                    icon="🗂️", label="Report + Thumbnails (.zip)",
+                    file_name="jellyfish_report.zip",
+                    mime="application/zip",
+                    stage="generate_html_report.zip",
+                )
+
+            cache_stats = get_prediction_cache().stats()
+            session_stats = uploads.stats()
+            st.caption(f"⚡ Prediction cache: {cache_stats['hits']} hits · {cache_stats['misses']} misses "
+                       f"({cache_stats['hit_rate']*100:.0f}% hit rate) · "
+                       f"Session: {session_stats['memory_bytes'] / 2**20:.1f} MB in memory, "
+                       f"{session_stats['spilled']} previews spilled to disk"
+                       + (f", {session_stats['download_bytes'] / 2**20:.1f} MB of reports"
+                          if session_stats["download_bytes"] else ""))
+            tta_costs = [r["_tta_seconds"] for r in results if r["_tta_seconds"] is not None]
+            if tta_costs:
+                st.caption(f"🔁 Test-time augmentation re-checked {len(tta_costs)} of {len(results)} images · "
+                           f"{1000 * sum(tta_costs) / len(tta_costs):.0f} ms per image "
+                           f"({sum(1 for c in tta_costs if c == 0)} from cache)")
 
         st.markdown('<hr class="ocean-divider">', unsafe_allow_html=True)
 
-        for uploaded_file in uploaded_files:
-            image = Image.open(uploaded_file)
-            info = JELLYFISH_INFO.get(CLASS_NAMES[int(np.argmax(model.predict(preprocess_image(image), verbose=0)[0]))], {})
-            preds = model.predict(preprocess_image(image), verbose=0)[0]
-            top_idx = int(np.argmax(preds))
-            top_class = CLASS_NAMES[top_idx]
-            confidence = float(preds[top_idx])
-            info = JELLYFISH_INFO.get(top_class, {})
-            image = Image.open(uploaded_file)
+        # ── Results view ──
+        # Filtering and sorting work on the compact records; detail cards are only
+        # built for the page on screen, so a rerun costs the same for 10 or 1,000 files
+        view = "Cards"
+        count_mode = False
+        if results:
+            col_species, col_band, col_sort, col_view = st.columns([1.4, 1.2, 1.1, 0.8])
+            with col_species:
+                species_filter = st.multiselect("Species", sorted({r["Predicted Species"] for r in results}),
+                                                placeholder="All species")
+            with col_band:
+                band_filter = st.multiselect("Confidence", ["HIGH", "MODERATE", "LOW", "OOD"], placeholder="All bands")
+            with col_sort:
+                sort_order = st.selectbox("Sort by", list(SORT_ORDERS))
+            with col_view:
+                view = st.radio("View", ["Cards", "Table"], horizontal=True)
+            shown = sort_results(filter_results(results, species_filter, band_filter), sort_order)
+            cards = [(uploaded_files[r["_upload"]], r) for r in shown]
+        else:
+            cards = [(f, None) for f in uploaded_files]
+
+        st.caption(f"{len(cards)} of {len(uploaded_files)} uploads shown")
+        if view == "Table":
+            # One virtualised grid element however many rows there are
+            st.dataframe(pd.DataFrame([public_row(r) for r in shown], columns=df.columns),
+                         hide_index=True, use_container_width=True, height=min(600, 38 + 35 * max(1, len(shown))))
+            cards = []
+        else:
+            col_size, col_page, col_count = st.columns([1, 2, 1])
+            with col_size:
+                page_size = st.selectbox("Per page", [10, 25, 50])
+            _, n_pages = page_of(cards, 1, page_size)
+            with col_page:
+                # max_value is part of the widget identity, so a new filter starts back on page 1
+                page_number = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1)
+            with col_count:
+                count_mode = st.toggle("🔲 Count jellyfish", disabled=model is None,
+                                       help="Classify overlapping tiles of each photo to label and count "
+                                            "several jellyfish in wide shots")
+            cards, _ = page_of(cards, page_number, page_size)
+
+        # Embeddings, tile counts and corrections are kept on the stored records across reruns
+        stored = [uploads.record(f.file_id) if r is not None else None for f, r in cards]
+        similar = [[] for _ in cards]
+        if cards and results:
+            with st.spinner("🔎 Indexing reference images…"):
+                embedder, gallery = get_gallery(model, model_fingerprint())
+            if gallery is not None and len(gallery):
+                embed_uploads(embedder, [f for f, _ in cards], stored)
+                similar = gallery.search(np.stack([r["_embedding"] for r in stored]), k=3)
+
+        if count_mode and cards and results:
+            with st.spinner("🔲 Counting jellyfish tile by tile…"):
+                tile_uploads(model, [f for f, _ in cards], stored)
+            page_counts = {}
+            for r in stored:
+                for species, n in (r["_tiles"] or {}).get("counts", {}).items():
+                    page_counts[species] = page_counts.get(species, 0) + n
+            st.caption(f"🔲 On this page: {tiling.count_summary(page_counts) or 'no confident regions'}")
+
+        for card, ((uploaded_file, r), record) in enumerate(zip(cards, stored)):
+            name = uploaded_file.name
+            info = {}
+            if r is not None:
+                preds = r["_preds"]
+                top_class = r["_top_class"]
+                confidence = r["_confidence_raw"]
+                info = r["_info"]
+                name = r["Filename"]
+                if r.get("_burst_size", 1) > 1:
+                    name += f" · +{r['_burst_size'] - 1} near-duplicates"
 
             st.markdown(f"""
             <div style="margin-top:1.5rem; margin-bottom:0.3rem;">
-                <span class="species-badge">📁 {uploaded_file.name}</span>
+                <span class="species-badge">📁 {name}</span>
             </div>
             """, unsafe_allow_html=True)
 
@@ -465,14 +716,40 @@ if page == "🔍 Classifier":
 
             with col1:
                 st.markdown('<div class="info-label">📷 Uploaded Image</div>', unsafe_allow_html=True)
-                st.image(image, use_container_width=True)
+                # Display-sized WebP decoded from the upload on first view, not the full-resolution image
+                if record is not None and record.get("_tiles") and count_mode:
+                    tiles = record["_tiles"]
+                    st.image(uploads.blob(uploaded_file.file_id, f"tiles-{pick_width(COLUMN_PX['classifier'])}.webp",
+                                          lambda: tiling.heatmap_overlay(uploaded_file.getvalue(), tiles,
+                                                                         pick_width(COLUMN_PX["classifier"]))),
+                             use_container_width=True)
+                    st.caption(f"🔲 {tiling.count_summary(tiles['counts']) or 'No confident regions'} · "
+                               f"{tiles['classified']} of {tiles['tiles']} tiles classified")
+                else:
+                    st.image(upload_preview(uploads, uploaded_file, pick_width(COLUMN_PX["classifier"])),
+                             use_container_width=True)
 
             with col2:
                 if model is not None:
                     st.markdown('<div class="info-label">🔍 Prediction</div>', unsafe_allow_html=True)
 
-                    # ── Confidence threshold warning ──
-                    if confidence < 0.60:
+                    # ── Out-of-distribution / confidence threshold warning ──
+                    if r["_ood"] and r["_ood"]["flagged"]:
+                        st.markdown(f"""
+                        <div style="background:rgba(167,139,250,0.1); border:1px solid rgba(167,139,250,0.4);
+                             border-radius:16px; padding:1.2rem 1.5rem; margin-top:1rem;">
+                            <div style="color:#a78bfa; font-family:'Syne',sans-serif;
+                                 font-size:1rem; font-weight:700; margin-bottom:0.3rem;">
+                                🛸 Unfamiliar Image
+                            </div>
+                            <div style="color:#a8c8e8; font-size:0.85rem;">
+                                This looks unlike the training images, even at
+                                <b style="color:#a78bfa">{confidence*100:.1f}%</b> confidence.
+                                It is probably not one of the 6 supported species.
+                            </div>
+                        </div>
+                        """, unsafe_allow_html=True)
+                    elif confidence < 0.60:
                         st.markdown(f"""
                         <div style="background:rgba(231,76,60,0.1); border:1px solid rgba(231,76,60,0.4);
                              border-radius:16px; padding:1.2rem 1.5rem; margin-top:1rem;">
@@ -509,15 +786,32 @@ if page == "🔍 Classifier":
                         <div class="result-confidence">Confidence: {confidence*100:.1f}%</div>
                     </div>
                     """, unsafe_allow_html=True)
+                    if r["_tta_seconds"] is not None:
+                        cost = "cached" if r["_tta_seconds"] == 0 else f"{r['_tta_seconds']*1000:.0f} ms"
+                        st.caption(f"🔁 TTA ×{tta.DEFAULT_VIEWS} · first pass {r['_first_pass_confidence']*100:.1f}% · {cost}")
 
                     st.markdown("<br>", unsafe_allow_html=True)
                     st.markdown('<div class="info-label">Top Predictions</div>', unsafe_allow_html=True)
-                    top3_idx = np.argsort(preds)[::-1][:3]
-                    for i in top3_idx:
-                        name = CLASS_NAMES[i].replace('_', ' ').title()
-                        prob = float(preds[i])
+                    for class_name, prob in top_predictions(preds):
+                        name = class_name.replace('_', ' ').title()
                         st.progress(prob, text=f"{name}  {prob*100:.1f}%")
 
+                    # ── Correction: the image is kept under JELLYFISH_CORRECTIONS_DIR/<true class>/
+                    # for the next head retraining (Model Performance page or `python -m jellyfish retrain`)
+                    if record.get("_corrected"):
+                        st.caption(f"✏️ Labelled {record['_corrected'].replace('_', ' ').title()} "
+                                   f"— used in the next retraining")
+                    with st.popover("✏️ Correct this prediction", use_container_width=True):
+                        true_label = st.selectbox("True species", CLASS_NAMES,
+                                                  index=CLASS_NAMES.index(record.get("_corrected") or top_class),
+                                                  format_func=lambda s: s.replace('_', ' ').title(),
+                                                  key=f"label-{r['_widget']}")
+                        if st.button("Save label", key=f"correct-{r['_widget']}"):
+                            retrain.save_correction(uploaded_file.getvalue(), uploaded_file.name, true_label,
+                                                    predicted=top_class, model=model_fingerprint()[:12])
+                            record["_corrected"] = true_label
+                            st.rerun()
+
             with col3:
                 if model is not None and info:
                     st.markdown('<div class="info-label">🔬 Species Info</div>', unsafe_allow_html=True)
@@ -546,6 +840,16 @@ if page == "🔍 Classifier":
                     </div>
                     """, unsafe_allow_html=True)
 
+                    if similar[card]:
+                        st.markdown('<div class="info-label" style="margin-top:0.8rem">🔎 Most Similar References</div>',
+                                    unsafe_allow_html=True)
+                        for col, (path, label, score) in zip(st.columns(3), similar[card]):
+                            with col:
+                                st.image(get_image_store().variant(path, pick_width(COLUMN_PX["gallery_thumb"])),
+                                         use_container_width=True)
+                                species = CLASS_NAMES[label].replace('_', ' ').title() if label is not None else "Unlabelled"
+                                st.caption(f"{species} · {score*100:.0f}%")
+
             st.markdown('<hr class="ocean-divider">', unsafe_allow_html=True)
 
     else:
@@ -568,10 +872,13 @@ if page == "🔍 Classifier":
 # PAGE 2 — MODEL PERFORMANCE
 # ═══════════════════════════════════════════════
 elif page == "📊 Model Performance":
-
     st.markdown('<div class="hero-title">Model Performance</div>', unsafe_allow_html=True)
     st.markdown('<div class="hero-sub">Confusion Matrix · Classification Report · Training History</div>', unsafe_allow_html=True)
 
+    # Static charts are rendered once and served as cached PNG bytes; interactive ones render in the browser
+    interactive_charts = st.toggle("Interactive charts",
+                                   value=os.environ.get("JELLYFISH_INTERACTIVE_CHARTS") == "1")
+
     # ── Real values from your test set ──
     CM = np.array([
         [6, 0, 0, 0, 0, 0],
@@ -593,6 +900,21 @@ elif page == "📊 Model Performance":
         {"name": "Lion's Mane",         "emoji": "🦁", "precision": 0.80, "recall": 1.00, "f1": 0.89, "support": 8},
         {"name": "Mauve Stinger",       "emoji": "💜", "precision": 1.00, "recall": 0.86, "f1": 0.92, "support": 7},
     ]
+    MACRO = {"precision": 0.92, "recall": 0.90, "f1": 0.90, "support": 40}
+
+    # ── Live results for the loaded model, if `python -m jellyfish evaluate` has been run ──
+    live_eval = load_evaluation()
+    if live_eval:
+        CM = np.array(live_eval["confusion_matrix"])
+        METRICS = [{**m, **{k: c[k] for k in ("precision", "recall", "f1", "support")}}
+                   for m, c in zip(METRICS, live_eval["per_class"])]
+        MACRO = live_eval["macro_avg"]
+        calib = live_eval["calibration"]
+        st.caption(f"📡 Live evaluation of `{live_eval['model']}` on {live_eval['images']} images "
+                   f"({live_eval['created'][:10]}) · ECE {calib['ece']:.3f} · NLL {calib['nll']:.3f} · Brier {calib['brier']:.3f}")
+    else:
+        st.caption("Showing reference results from training. Run `python -m jellyfish evaluate DIR` "
+                   "to evaluate the loaded model on your own labelled images.")
 
     # ── Summary stats ──
     total = CM.sum()
@@ -621,33 +943,11 @@ elif page == "📊 Model Performance":
     with col_left:
         st.markdown('<div class="info-label">🔢 Confusion Matrix</div>', unsafe_allow_html=True)
 
-        fig, ax = plt.subplots(figsize=(7, 5))
-        fig.patch.set_facecolor("#041e3a")
-        ax.set_facecolor("#041e3a")
-
-        sns.heatmap(
-            CM, annot=True, fmt="d", ax=ax,
-            cmap=sns.color_palette("Blues", as_cmap=True),
-            linewidths=0.5, linecolor="#062d55",
-            xticklabels=DISPLAY_NAMES,
-            yticklabels=DISPLAY_NAMES,
-            cbar_kws={"shrink": 0.8}
-        )
-
-        ax.set_xlabel("Predicted", color="#7ecfea", fontsize=10, labelpad=10)
-        ax.set_ylabel("Actual", color="#7ecfea", fontsize=10, labelpad=10)
-        ax.tick_params(colors="#7ecfea", labelsize=8)
-        plt.xticks(rotation=30, ha="right")
-        plt.yticks(rotation=0)
-
-        # Color the colorbar
-        cbar = ax.collections[0].colorbar
-        cbar.ax.yaxis.set_tick_params(color="#7ecfea")
-        plt.setp(cbar.ax.yaxis.get_ticklabels(), color="#7ecfea")
-
-        plt.tight_layout()
-        st.pyplot(fig)
-        plt.close()
+        cm_data = {"matrix": CM.tolist(), "labels": DISPLAY_NAMES}
+        if interactive_charts:
+            st.vega_lite_chart(confusion_matrix_spec(cm_data), use_container_width=True)
+        else:
+            st.image(get_chart_cache().get("confusion_matrix", cm_data), use_container_width=True)
 
     # ── Classification Report ──
     with col_right:
@@ -689,16 +989,16 @@ elif page == "📊 Model Performance":
             """, unsafe_allow_html=True)
 
         # Macro avg
-        st.markdown("""
+        st.markdown(f"""
         <div style="margin-top:0.8rem; padding:0.6rem 0.8rem;
              background:rgba(0,191,255,0.05); border:1px solid rgba(0,191,255,0.2);
              border-radius:10px; display:grid;
              grid-template-columns:1.4fr 0.8fr 0.8fr 0.8fr 0.7fr; gap:0.3rem;">
             <span style="color:#7ecfea; font-size:0.82rem; font-weight:600">Macro Avg</span>
-            <span style="text-align:center; color:#7fffd4; font-size:0.82rem; font-weight:600">92%</span>
-            <span style="text-align:center; color:#7fffd4; font-size:0.82rem; font-weight:600">90%</span>
-            <span style="text-align:center; color:#7fffd4; font-size:0.82rem; font-weight:600">90%</span>
-            <span style="text-align:center; color:#7ecfea; font-size:0.82rem">40</span>
+            <span style="text-align:center; color:#7fffd4; font-size:0.82rem; font-weight:600">{MACRO['precision']*100:.0f}%</span>
+            <span style="text-align:center; color:#7fffd4; font-size:0.82rem; font-weight:600">{MACRO['recall']*100:.0f}%</span>
+            <span style="text-align:center; color:#7fffd4; font-size:0.82rem; font-weight:600">{MACRO['f1']*100:.0f}%</span>
+            <span style="text-align:center; color:#7ecfea; font-size:0.82rem">{MACRO['support']}</span>
         </div>
         """, unsafe_allow_html=True)
 
@@ -707,12 +1007,6 @@ elif page == "📊 Model Performance":
     # ═══════════════════════════════════════════════
     st.markdown("<br>", unsafe_allow_html=True)
     st.markdown('<div class="info-label">📈 Training History</div>', unsafe_allow_html=True)
-    st.markdown("""
-    <p style="color:#2a6fa8; font-size:0.78rem; letter-spacing:1px; margin-bottom:1rem;">
-        Phase 1 = frozen base (epochs 1–20) · Phase 2 = fine-tuning (epochs 21–26)
-    </p>
-    """, unsafe_allow_html=True)
-
     # Phase 1 — frozen base (~20 epochs)
     p1_train_acc  = [0.50, 0.72, 0.83, 0.88, 0.90, 0.91, 0.92, 0.93, 0.94, 0.94,
                      0.95, 0.95, 0.96, 0.96, 0.96, 0.97, 0.97, 0.97, 0.97, 0.97]
@@ -736,41 +1030,85 @@ elif page == "📊 Model Performance":
     epochs         = list(range(1, len(all_train_acc) + 1))
     phase2_start   = len(p1_train_acc) + 1
 
-    fig2, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 4))
-    fig2.patch.set_facecolor("#041e3a")
-
-    for ax in [ax1, ax2]:
-        ax.set_facecolor("#041e3a")
-        ax.tick_params(colors="#7ecfea", labelsize=8)
-        ax.spines[:].set_color("#062d55")
-        ax.grid(color="#062d55", linewidth=0.5)
-        ax.axvline(x=phase2_start, color="#a78bfa", linewidth=1.2,
-                   linestyle="--", alpha=0.7)
-
-    ax1.plot(epochs, all_train_acc, color="#00bfff", linewidth=2,
-             marker="o", markersize=3, label="Train Accuracy")
-    ax1.plot(epochs, all_val_acc,   color="#7fffd4", linewidth=2,
-             marker="o", markersize=3, label="Val Accuracy")
-    ax1.set_title("Accuracy", color="#7ecfea", fontsize=11, pad=10)
-    ax1.set_xlabel("Epoch", color="#7ecfea", fontsize=9)
-    ax1.set_ylabel("Accuracy", color="#7ecfea", fontsize=9)
-    ax1.legend(facecolor="#041e3a", labelcolor="#7ecfea", fontsize=8)
-    ax1.set_ylim(0.4, 1.05)
-    ax1.text(10, 0.45, "Phase 1: Frozen", color="#a78bfa", fontsize=8, ha="center", alpha=0.8)
-    ax1.text(phase2_start + 2, 0.45, "Phase 2: Fine-tune", color="#a78bfa", fontsize=8, ha="center", alpha=0.8)
-
-    ax2.plot(epochs, all_train_loss, color="#00bfff", linewidth=2,
-             marker="o", markersize=3, label="Train Loss")
-    ax2.plot(epochs, all_val_loss,   color="#7fffd4", linewidth=2,
-             marker="o", markersize=3, label="Val Loss")
-    ax2.set_title("Loss", color="#7ecfea", fontsize=11, pad=10)
-    ax2.set_xlabel("Epoch", color="#7ecfea", fontsize=9)
-    ax2.set_ylabel("Loss", color="#7ecfea", fontsize=9)
-    ax2.legend(facecolor="#041e3a", labelcolor="#7ecfea", fontsize=8)
-
-    plt.tight_layout()
-    st.pyplot(fig2)
-    plt.close()
+    if live_eval and live_eval.get("history"):
+        history        = live_eval["history"]
+        all_train_acc  = history["accuracy"]
+        all_val_acc    = history["val_accuracy"]
+        all_train_loss = history["loss"]
+        all_val_loss   = history["val_loss"]
+        epochs         = list(range(1, len(all_train_acc) + 1))
+        phase2_start   = history.get("phase2_start")
+
+    if phase2_start:
+        st.markdown(f"""
+        <p style="color:#2a6fa8; font-size:0.78rem; letter-spacing:1px; margin-bottom:1rem;">
+            Phase 1 = frozen base (epochs 1–{phase2_start - 1}) · Phase 2 = fine-tuning (epochs {phase2_start}–{len(epochs)})
+        </p>
+        """, unsafe_allow_html=True)
+
+    history_data = {
+        "train_acc": all_train_acc, "val_acc": all_val_acc,
+        "train_loss": all_train_loss, "val_loss": all_val_loss,
+        "phase2_start": phase2_start,
+    }
+    if interactive_charts:
+        col_acc, col_loss = st.columns(2)
+        with col_acc:
+            st.vega_lite_chart(training_history_spec(history_data, "acc"), use_container_width=True)
+        with col_loss:
+            st.vega_lite_chart(training_history_spec(history_data, "loss"), use_container_width=True)
+    else:
+        st.image(get_chart_cache().get("training_history", history_data), use_container_width=True)
+
+    # ═══════════════════════════════════════════════
+    # HEAD RETRAINING
+    # ═══════════════════════════════════════════════
+    st.markdown("<br>", unsafe_allow_html=True)
+    st.markdown('<div class="info-label">🔁 Head Retraining</div>', unsafe_allow_html=True)
+    st.caption("Refits only the final layer on cached MobileNetV2 embeddings of your corrections"
+               f"{' and ' + ', '.join(RETRAIN_DIRS) if RETRAIN_DIRS else ''}: seconds on a CPU, and the frozen "
+               "backbone cannot overfit the way Phase 2 fine-tuning does.")
+    correction_counts = retrain.correction_counts()
+    for col, (species, n) in zip(st.columns(len(CLASS_NAMES)), correction_counts.items()):
+        col.metric(species.replace('_', ' ').title(), n)
+
+    if MODEL_SPEC:
+        st.info("Serving several models (JELLYFISH_MODELS): run `python -m jellyfish retrain` and add the new "
+                "version to JELLYFISH_MODELS to A/B test or shadow it.")
+    else:
+        col_train, col_active = st.columns(2, gap="large")
+        with col_train:
+            if st.button("🔁 Retrain head", use_container_width=True,
+                         disabled=not sum(correction_counts.values()) and not RETRAIN_DIRS):
+                if load_model() is not None:
+                    model, model_file = model_loader.current()
+                    with st.spinner("🪼 Embedding new images and refitting the head…"):
+                        try:
+                            meta = retrain.retrain(model, model_file,
+                                                   [*RETRAIN_DIRS, retrain.CORRECTIONS_DIR], cache=get_feature_cache())
+                        except ValueError as e:
+                            st.error(f"⚠️ {e}")
+                        else:
+                            st.success(f"Saved v{meta['version']:03d}: {meta['images']} images "
+                                       f"({meta['embedded']} newly embedded), head fit in {meta['train_seconds']:.1f}s, "
+                                       f"held-out accuracy {meta['parent_accuracy'] * 100:.1f}% → "
+                                       f"{meta['accuracy'] * 100:.1f}%. Activate it to start using it.")
+        with col_active:
+            # Activating promotes the version (what the CLI and the next start load) and hot-swaps
+            # this app onto it; the current model keeps answering until the new one is warm
+            options = [None] + [v["path"] for v in retrain.versions()]
+            serving = model_loader.model_file
+            serving_index = next((i for i, path in enumerate(options) if path and serving
+                                  and os.path.abspath(path) == os.path.abspath(serving)), 0)
+            picked = st.selectbox("Active model", options, index=serving_index, format_func=version_label)
+            if st.button("⚡ Activate", use_container_width=True, disabled=picked == options[serving_index]):
+                retrain.promote(picked)
+                with st.spinner("🪼 Loading and warming up the new model…"):
+                    model_loader.swap(picked or inference.MODEL_PATH, block=True)
+                if model_loader.swap_error:
+                    st.error(f"⚠️ Could not load {picked or inference.MODEL_PATH}: {model_loader.swap_error}")
+                else:
+                    st.rerun()
 
 # ═══════════════════════════════════════════════
 # PAGE 3 — SPECIES GALLERY
@@ -836,9 +1174,11 @@ elif page == "🖼️ Species Gallery":
         cols = st.columns(3, gap="medium")
         for col, species in zip(cols, SPECIES[i:i+3]):
             with col:
-                img_path = f"samples/{species['key']}.jpg"
+                references = reference_images(species['key'])
                 try:
-                    st.image(img_path, use_container_width=True)
+                    with timer("gallery.image"):
+                        st.image(get_image_store().variant(references[0], pick_width(COLUMN_PX["gallery"])),
+                                 use_container_width=True)
                 except:
                     st.markdown(f"""
                     <div style="height:180px; background:rgba(255,255,255,0.03);
@@ -871,4 +1211,264 @@ elif page == "🖼️ Species Gallery":
                 </div>
                 """, unsafe_allow_html=True)
 
+                if len(references) > 1:
+                    with st.expander(f"📚 {len(references) - 1} more reference image{'s' if len(references) > 2 else ''}"):
+                        thumbs = st.columns(4)
+                        for j, path in enumerate(references[1:]):
+                            with thumbs[j % 4]:
+                                st.image(get_image_store().variant(path, pick_width(COLUMN_PX["gallery_thumb"])),
+                                         use_container_width=True)
+
+# ═══════════════════════════════════════════════
+# PAGE 4 — VIDEO
+# ═══════════════════════════════════════════════
+elif page == "🎥 Video":
+    import pandas as pd
+    import tempfile
+
+    st.markdown('<div class="hero-title">Video Monitoring</div>', unsafe_allow_html=True)
+    st.markdown('<div class="hero-sub">Clips · Camera Streams · Species Timeline</div>', unsafe_allow_html=True)
+
+    clip = st.file_uploader("Upload a video clip", type=[e.lstrip(".") for e in video.VIDEO_EXTENSIONS],
+                            label_visibility="collapsed")
+    stream_url = st.text_input("…or a camera stream URL", placeholder="rtsp://camera.local/stream")
+    col_motion, col_smooth, col_conf, col_limit = st.columns(4)
+    with col_motion:
+        motion_threshold = st.slider("Motion threshold", 0.0, 0.2, video.DEFAULT_MOTION_THRESHOLD, 0.005,
+                                     help="Frames that changed less than this since the last classified frame are skipped")
+    with col_smooth:
+        smoothing = st.slider("Smoothing (s)", 0.0, 5.0, video.DEFAULT_SMOOTHING, 0.25)
+    with col_conf:
+        min_confidence = st.slider("Min confidence", 0.3, 0.95, video.DEFAULT_MIN_CONFIDENCE, 0.05)
+    with col_limit:
+        max_seconds = st.number_input("Stream seconds", min_value=5, max_value=3600, value=60,
+                                      help="How long to watch a live stream")
+
+    source_id = clip.file_id if clip else stream_url.strip()
+    signature = (source_id, motion_threshold, smoothing, min_confidence)
+    run = st.session_state.get("video_run")
+    if source_id and st.button("▶️ Classify video", use_container_width=True):
+        model = load_model()
+        if model is not None:
+            path = stream_url.strip()
+            if clip:
+                # OpenCV reads from a path, so the upload is spooled to a temporary file
+                with tempfile.NamedTemporaryFile(suffix=os.path.splitext(clip.name)[1], delete=False) as f:
+                    f.write(clip.getbuffer())
+                    path = f.name
+            reader = video.FrameReader(path)
+            sampler = video.FrameSampler(threshold=motion_threshold)
+            rows = []
+            status = st.empty()
+            started = time.perf_counter()
+            try:
+                for row in video.classify_stream(model, reader, sampler, video.TemporalSmoother(smoothing)):
+                    rows.append(row)
+                    elapsed = time.perf_counter() - started
+                    status.caption(f"🎞️ {row['time']:.1f}s of video · {sampler.sampled} frames classified, "
+                                   f"{sampler.skipped} skipped, {reader.frames_dropped} dropped · "
+                                   f"{row['time'] / elapsed if elapsed else 0:.1f}× real time")
+                    if reader.live and row["time"] >= max_seconds:
+                        break
+            except (OSError, RuntimeError) as e:
+                st.error(f"⚠️ Could not read the video: {e}")
+            finally:
+                if clip:
+                    os.remove(path)
+            segments = video.detect_segments(rows, min_confidence, end_time=reader.last_time)
+            run = {"signature": signature, "rows": rows, "segments": segments,
+                   "read": reader.frames_read, "sampled": sampler.sampled, "seconds": time.perf_counter() - started}
+            st.session_state["video_run"] = run
+
+    if run and run["signature"] == signature:
+        segments, rows = run["segments"], run["rows"]
+        duration = rows[-1]["time"] if rows else 0.0
+        st.caption(f"{run['read']} frames read · {run['sampled']} classified · "
+                   f"{duration:.1f}s of video in {run['seconds']:.1f}s")
+        if segments:
+            st.vega_lite_chart(video_timeline_spec(segments, rows), use_container_width=True)
+            segment_df = pd.DataFrame([video.segment_row(s) for s in segments])
+            st.dataframe(segment_df, hide_index=True, use_container_width=True)
+        else:
+            st.info("No species detected above the confidence threshold.")
+        col_segments, col_frames = st.columns(2)
+        with col_segments:
+            st.download_button("📥 Detections CSV",
+                               data=pd.DataFrame([video.segment_row(s) for s in segments],
+                                                 columns=video.SEGMENT_COLUMNS).to_csv(index=False),
+                               file_name="jellyfish_video_detections.csv", mime="text/csv",
+                               use_container_width=True)
+        with col_frames:
+            st.download_button("🎞️ Per-frame CSV",
+                               data=pd.DataFrame([video.frame_row(r) for r in rows],
+                                                 columns=video.FRAME_COLUMNS).to_csv(index=False),
+                               file_name="jellyfish_video_frames.csv", mime="text/csv", use_container_width=True)
+
+# ═══════════════════════════════════════════════
+# PAGE 5 — HISTORY
+# ═══════════════════════════════════════════════
+elif page == "📜 History":
+    import datetime
+    import pandas as pd
+
+    st.markdown('<div class="hero-title">Sighting History</div>', unsafe_allow_html=True)
+    st.markdown('<div class="hero-sub">Every Classified Image · Daily · Monthly</div>', unsafe_allow_html=True)
+
+    history = get_history()
+    if history is None:
+        st.info("History is switched off (JELLYFISH_HISTORY_DB is empty).")
+    else:
+        # Everything below reads the per-day aggregate tables, never the results table itself
+        totals = history.totals()
+        if not totals["images"]:
+            st.info("No classifications recorded yet — classify some images first.")
+        else:
+            first = datetime.date.fromisoformat(totals["first_day"])
+            last = datetime.date.fromisoformat(totals["last_day"])
+            col_range, col_period, col_band = st.columns([2, 1, 1.5])
+            with col_range:
+                picked = st.date_input("Date range", (first, last), min_value=first, max_value=last)
+            with col_period:
+                period = st.selectbox("Group by", ["month", "day", "year"], format_func=str.title)
+            with col_band:
+                statuses = st.multiselect("Status", ["HIGH", "MODERATE", "LOW", "OOD"], placeholder="All statuses",
+                                          help="Filters the species counts")
+            start, end = (picked[0], picked[-1]) if picked else (first, last)
+
+            totals = history.totals(start, end)
+            status_counts = history.status_counts(start, end)
+            col_images, col_days, col_high, col_low = st.columns(4)
+            col_images.metric("Images", f"{totals['images']:,}")
+            col_days.metric("Days with sightings", totals["days"])
+            col_high.metric("High confidence", f"{status_counts.get('HIGH', 0):,}")
+            col_low.metric("Low / OOD", f"{status_counts.get('LOW', 0) + status_counts.get('OOD', 0):,}")
+
+            counts = history.counts(period, start, end, statuses)
+            if counts:
+                st.vega_lite_chart(history_counts_spec(counts), use_container_width=True)
+                table = pd.DataFrame(counts).pivot_table(index="period", columns="species", values="images",
+                                                         fill_value=0, aggfunc="sum")
+                table.columns = [c.replace('_', ' ').title() for c in table.columns]
+                table["Total"] = table.sum(axis=1)
+                st.dataframe(table, use_container_width=True)
+                st.download_button(f"📥 {dict(day='Daily', month='Monthly', year='Yearly')[period]} statistics CSV",
+                                   data=table.to_csv(), file_name=f"jellyfish_sightings_by_{period}.csv",
+                                   mime="text/csv")
+            st.markdown('<div class="info-label">Sightings map</div>', unsafe_allow_html=True)
+            map_species = st.multiselect("Species on the map", CLASS_NAMES, default=STING_RISK,
+                                         format_func=lambda s: s.replace('_', ' ').title(),
+                                         help="Starts with the species whose sting is rated 🔴")
+            # One dot per occupied grid cell (JELLYFISH_GRID_DEGREES), sized by its sighting count
+            cells = history.sighting_cells(start, end, map_species, statuses)
+            if not cells:
+                st.caption("No geotagged sightings in this range — only photos with EXIF GPS positions are mapped.")
+            else:
+                cell_df = pd.DataFrame(cells)
+                cell_df["size"] = 60 + 40 * np.sqrt(cell_df["sightings"])
+                cell_df["color"] = [
+                    "#{:02x}{:02x}{:02x}".format(*tiling.CLASS_COLORS[CLASS_NAMES.index(s)]) for s in cell_df["species"]
+                ]
+                st.map(cell_df, latitude="lat", longitude="lon", size="size", color="color")
+
+                # Exact counts for a box such as one beach: whole grid cells come from the
+                # aggregate table, only the cells on the box edges are checked sighting by sighting
+                with st.expander("📍 Counts inside a bounding box"):
+                    # Defaults cover every mapped cell (dots sit at cell centres)
+                    half = history.grid / 2
+                    col_s, col_w, col_n, col_e = st.columns(4)
+                    south = col_s.number_input("South", -90.0, 90.0, max(-90.0, cell_df["lat"].min() - half),
+                                               format="%.5f")
+                    west = col_w.number_input("West", -180.0, 180.0, max(-180.0, cell_df["lon"].min() - half),
+                                              format="%.5f")
+                    north = col_n.number_input("North", -90.0, 90.0, min(90.0, cell_df["lat"].max() + half),
+                                               format="%.5f")
+                    east = col_e.number_input("East", -180.0, 180.0, min(180.0, cell_df["lon"].max() + half),
+                                              format="%.5f", help="East < West crosses the 180° meridian")
+                    if south > north:
+                        st.warning("South must not be north of North.")
+                    else:
+                        in_box = history.species_in_bbox(south, west, north, east, start, end, statuses)
+                        st.dataframe(pd.DataFrame([
+                            {"Species": s.replace('_', ' ').title(), "Sightings": n,
+                             "Sting Danger": JELLYFISH_INFO.get(s, {}).get("danger", "")}
+                            for s, n in in_box.items() if not map_species or s in map_species
+                        ], columns=["Species", "Sightings", "Sting Danger"]), hide_index=True, use_container_width=True)
+
+            st.markdown('<div class="info-label">Confidence distribution</div>', unsafe_allow_html=True)
+            st.vega_lite_chart(confidence_histogram_spec(history.confidence_histogram(start, end)),
+                               use_container_width=True)
+
+            with st.expander("🕘 Latest classifications"):
+                st.dataframe(pd.DataFrame([
+                    {
+                        "Time": datetime.datetime.fromtimestamp(r["ts"]).strftime("%Y-%m-%d %H:%M"),
+                        "Filename": r["filename"],
+                        "Species": r["species"].replace('_', ' ').title(),
+                        "Confidence (%)": round(r["confidence"] * 100, 1),
+                        "Status": r["status"],
+                        "Model": r["model"],
+                        "Source": r["source"],
+                    }
+                    for r in history.recent(50)
+                ]), hide_index=True, use_container_width=True)
+
+# ═══════════════════════════════════════════════
+# PAGE 6 — DIAGNOSTICS (hidden)
+# ═══════════════════════════════════════════════
+elif page == "🩺 Diagnostics":
+    import pandas as pd
+
+    st.markdown('<div class="hero-title">Diagnostics</div>', unsafe_allow_html=True)
+    st.markdown('<div class="hero-sub">Per-stage latency · p50 / p95 / p99</div>', unsafe_allow_html=True)
+
+    if model_loader.load_seconds is not None:
+        st.caption(f"Model {model_loader.state} after {model_loader.load_seconds:.2f}s (background load + warm-up)")
+
+    deployment = model_loader.wait(timeout=0) if model_loader.ready else None
+    if isinstance(deployment, Deployment):
+        deployment_stats = deployment.stats()
+        st.markdown(f"**Serving mode:** `{deployment_stats['mode']}`"
+                    + (f" · {deployment_stats['split']*100:.0f}% to challenger" if deployment_stats["split"] else ""))
+        st.dataframe(pd.DataFrame([
+            {
+                "Model": name,
+                "Role": m["role"],
+                "Served": m["served"],
+                "Scored": m["scored"],
+                "Agreement with primary": f"{m['agreement']*100:.1f}%" if m["agreement"] is not None else "—",
+                "Loaded (MB)": round(m["loaded_mb"], 1) if m["loaded_mb"] is not None else "not loaded",
+            }
+            for name, m in deployment_stats["models"].items()
+        ]), hide_index=True, use_container_width=True)
+
+    snapshot = LATENCY.snapshot()
+    if snapshot:
+        st.dataframe(pd.DataFrame([
+            {
+                "Stage": stage,
+                "Count": s["count"],
+                "p50 (ms)": round(s["p50"] * 1000, 2),
+                "p95 (ms)": round(s["p95"] * 1000, 2),
+                "p99 (ms)": round(s["p99"] * 1000, 2),
+                "Max (ms)": round(s["max"] * 1000, 2),
+                "Total (s)": round(s["sum"], 3),
+            }
+            for stage, s in snapshot.items()
+        ]), hide_index=True, use_container_width=True)
+    else:
+        st.info("No timings recorded yet — use the other pages first.")
+
+    col_prom, col_jsonl, col_reset = st.columns(3)
+    with col_prom:
+        st.download_button("📈 Prometheus text", data=LATENCY.to_prometheus(),
+                           file_name="jellyfish_metrics.prom", mime="text/plain", use_container_width=True)
+    with col_jsonl:
+        st.download_button("🧾 JSON lines", data=LATENCY.to_jsonl(),
+                           file_name="jellyfish_metrics.jsonl", mime="application/json", use_container_width=True)
+    with col_reset:
+        if st.button("♻️ Reset timings", use_container_width=True):
+            LATENCY.reset()
+            st.rerun()
+
 st.markdown('<div class="footer">Built with TensorFlow · MobileNetV2 · Streamlit 🪼</div>', unsafe_allow_html=True)
+LATENCY.observe(f"app.rerun.{page.split(' ', 1)[1].lower().replace(' ', '_')}", time.perf_counter() - _RERUN_START)
@@ -0,0 +1,19 @@
+"""Reusable pieces of the Jellyfish Classifier, shared by the Streamlit app and tooling.
+
+``jellyfish.inference`` imports TensorFlow, so it is not re-exported here.
+"""
+
+from jellyfish.cache import PredictionCache, content_key, file_fingerprint
+from jellyfish.results import CSV_COLUMNS, build_result, public_row
+from jellyfish.species import CLASS_NAMES, JELLYFISH_INFO
+
+__all__ = [
+    "CLASS_NAMES",
+    "CSV_COLUMNS",
+    "JELLYFISH_INFO",
+    "PredictionCache",
+    "build_result",
+    "content_key",
+    "file_fingerprint",
+    "public_row",
+]
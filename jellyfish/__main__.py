@@ -0,0 +1,5 @@
+import sys
+
+from jellyfish.cli import main
+
+sys.exit(main())
@@ -0,0 +1,136 @@
+"""TFLite inference backend, Keras→TFLite conversion and a backend parity check.
+
+Conversion modes:
+    float32   plain TFLite, no quantization
+    float16   float16 weights
+    dynamic   int8 weights, float activations (dynamic-range)
+    int8      full-integer weights and activations, calibrated on sample images
+"""
+
+import threading
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from jellyfish.inference import BATCH_SIZE, predict_batch
+from jellyfish.pipeline import PreprocessPipeline, iter_images, labelled_images, load_image
+
+QUANTIZATION_MODES = ("float32", "float16", "dynamic", "int8")
+CALIBRATION_DIR = "samples"
+
+
+class TFLiteModel:
+    """Runs a ``.tflite`` file through the TFLite interpreter with a Keras-like ``predict_on_batch``.
+
+    Quantized (int8/uint8) inputs and outputs are converted to and from float
+    here, so callers always pass ``[0, 1]`` float batches and get softmax rows back.
+    """
+
+    def __init__(self, path, num_threads=None):
+        self.path = path
+        self._interpreter = tf.lite.Interpreter(model_path=path, num_threads=num_threads)
+        self._interpreter.allocate_tensors()
+        self._lock = threading.Lock()  # the interpreter is not thread-safe
+        self._refresh_details()
+
+    def _refresh_details(self):
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+
+    def _resize(self, n):
+        shape = list(self._input["shape"])
+        if shape[0] != n:
+            self._interpreter.resize_tensor_input(self._input["index"], [n, *shape[1:]])
+            self._interpreter.allocate_tensors()
+            self._refresh_details()
+
+    def predict_on_batch(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            self._resize(len(batch))
+            dtype = self._input["dtype"]
+            if np.issubdtype(dtype, np.integer):
+                scale, zero_point = self._input["quantization"]
+                info = np.iinfo(dtype)
+                batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+            self._interpreter.set_tensor(self._input["index"], batch)
+            self._interpreter.invoke()
+            out = self._interpreter.get_tensor(self._output["index"])
+            if np.issubdtype(out.dtype, np.integer):
+                scale, zero_point = self._output["quantization"]
+                out = (out.astype(np.float32) - zero_point) * scale
+            return out.astype(np.float32, copy=False)
+
+    def predict(self, batch, verbose=0):
+        return self.predict_on_batch(batch)
+
+
+# ── Conversion ───────────────────────────────────────────────
+def calibration_dataset(directory=CALIBRATION_DIR, limit=200):
+    """Representative inputs for full-integer quantization, one image per step."""
+    def generate():
+        for i, (_, path) in enumerate(iter_images(directory)):
+            if i >= limit:
+                break
+            yield [load_image(path)[np.newaxis]]
+    return generate
+
+
+def convert_to_tflite(keras_model, out_path, quantization="float16", calibration_dir=CALIBRATION_DIR):
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"quantization must be one of {QUANTIZATION_MODES}, got {quantization!r}")
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    if quantization != "float32":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == "int8":
+        if not any(True for _ in iter_images(calibration_dir)):
+            raise ValueError(f"int8 quantization needs calibration images; none found in {calibration_dir}")
+        converter.representative_dataset = calibration_dataset(calibration_dir)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    data = converter.convert()
+    with open(out_path, "wb") as f:
+        f.write(data)
+    return out_path
+
+
+# ── Parity check ─────────────────────────────────────────────
+def parity_report(reference, candidate, labelled_dir, batch_size=BATCH_SIZE):
+    """Accuracy, agreement and per-image latency of two backends on the same labelled images."""
+    pipeline = PreprocessPipeline(batch_size=batch_size)
+    labels, ref_top, cand_top, abs_diff = [], [], [], []
+    ref_time = cand_time = 0.0
+    for batch in pipeline.batches(labelled_images(labelled_dir), source=lambda item: item[0]):
+        if not batch.keys:
+            continue
+        t0 = time.perf_counter()
+        ref = predict_batch(reference, batch.array)
+        t1 = time.perf_counter()
+        cand = predict_batch(candidate, batch.array)
+        t2 = time.perf_counter()
+        ref_time += t1 - t0
+        cand_time += t2 - t1
+        labels.extend(label for _, label in batch.keys)
+        ref_top.extend(ref.argmax(axis=1))
+        cand_top.extend(cand.argmax(axis=1))
+        abs_diff.append(np.abs(ref - cand).max(axis=1))
+
+    n = len(labels)
+    if n == 0:
+        raise ValueError(f"No labelled images found in {labelled_dir}")
+    labels, ref_top, cand_top = np.array(labels), np.array(ref_top), np.array(cand_top)
+    abs_diff = np.concatenate(abs_diff)
+    return {
+        "images": n,
+        "reference_accuracy": float((ref_top == labels).mean()),
+        "candidate_accuracy": float((cand_top == labels).mean()),
+        "top1_agreement": float((ref_top == cand_top).mean()),
+        "max_abs_prob_diff": float(abs_diff.max()),
+        "mean_abs_prob_diff": float(abs_diff.mean()),
+        "reference_ms_per_image": 1000 * ref_time / n,
+        "candidate_ms_per_image": 1000 * cand_time / n,
+    }
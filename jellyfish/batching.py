@@ -0,0 +1,85 @@
+"""Dynamic micro-batching: concurrent single-image requests share one ``predict`` call."""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from jellyfish.inference import BATCH_SIZE, predict_batch
+
+
+class MicroBatcher:
+    """Collects submitted images for up to ``max_wait_ms`` or ``max_batch_size`` images.
+
+    ``submit`` is thread-safe and returns a ``Future`` resolving to that image's
+    row of ``predict(model, batch)`` (by default its softmax row). A single worker
+    thread owns the model, so callers never run inference concurrently.
+    """
+
+    def __init__(self, model, max_batch_size=BATCH_SIZE, max_wait_ms=10, predict=predict_batch):
+        self.model = model
+        self.predict_fn = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches_run = 0
+        self.images_run = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="jellyfish-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, array):
+        """Queue one preprocessed ``(224, 224, 3)`` image."""
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((array, future))
+        return future
+
+    def predict(self, arrays, timeout=None):
+        futures = [self.submit(a) for a in arrays]
+        return [f.result(timeout) for f in futures]
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        pending = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(pending) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            pending.append(item)
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            if pending is None:
+                return
+            futures = [f for _, f in pending]
+            try:
+                probs = self.predict_fn(self.model, np.stack([a for a, _ in pending]))
+            except Exception as e:
+                for f in futures:
+                    f.set_exception(e)
+                continue
+            self.batches_run += 1
+            self.images_run += len(pending)
+            for f, p in zip(futures, probs):
+                f.set_result(p)
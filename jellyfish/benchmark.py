@@ -0,0 +1,165 @@
+"""Benchmarks for the classification pipeline: ``python -m jellyfish bench``.
+
+Runs the real preprocessing, prediction, report and CSV code on ``samples/``
+and on synthetic JPEGs of several resolutions, and reports throughput,
+latency percentiles and peak RSS. Results are saved as JSON; ``compare``
+flags benchmarks that got slower than a baseline by more than a threshold.
+"""
+
+import io
+import json
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from jellyfish.inference import preprocess_image, predict_batch
+from jellyfish.pipeline import PreprocessPipeline, iter_images, load_image
+from jellyfish.results import build_result, public_row
+
+SYNTHETIC_RESOLUTIONS = ((640, 480), (1920, 1080), (4032, 3024), (8000, 6000))
+BATCH_SIZES = (1, 8, 32)
+
+
+# ── Inputs ───────────────────────────────────────────────────
+def synthetic_jpeg(width, height, seed=0):
+    """A noisy gradient JPEG — compresses like a photo rather than a flat colour."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 20, base.shape), 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def sample_jpegs(directory="samples"):
+    blobs = []
+    for _, path in iter_images(directory):
+        with open(path, "rb") as f:
+            blobs.append(f.read())
+    return blobs
+
+
+# ── Measurement ──────────────────────────────────────────────
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB on Linux
+
+
+def measure(fn, items_per_call, repeat=5, warmup=1):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times = np.array(times)
+    p50, p95, p99 = np.quantile(times, (0.5, 0.95, 0.99))
+    return {
+        "items_per_call": items_per_call,
+        "calls": repeat,
+        "throughput": items_per_call / times.mean(),
+        "p50_ms": 1000 * p50,
+        "p95_ms": 1000 * p95,
+        "p99_ms": 1000 * p99,
+        "peak_rss_mb": peak_rss_mb(),  # process high-water mark after this benchmark
+    }
+
+
+# ── Suite ────────────────────────────────────────────────────
+def run_suite(model=None, samples_dir="samples", repeat=5, batch_sizes=BATCH_SIZES,
+              resolutions=SYNTHETIC_RESOLUTIONS, report_rows=200, log=None):
+    inputs = {"samples": sample_jpegs(samples_dir)}
+    for w, h in resolutions:
+        inputs[f"synthetic_{w}x{h}"] = [synthetic_jpeg(w, h, seed=i) for i in range(4)]
+
+    results = {}
+
+    def run(name, fn, items):
+        results[name] = measure(fn, items, repeat=repeat)
+        if log:
+            r = results[name]
+            log(f"{name:<48} {r['throughput']:>9.1f} items/s  p95 {r['p95_ms']:>8.2f} ms  rss {r['peak_rss_mb']:.0f} MB")
+
+    for label, blobs in inputs.items():
+        if not blobs:
+            continue
+        run(f"preprocess_image/{label}",
+            lambda: [preprocess_image(Image.open(io.BytesIO(b))) for b in blobs], len(blobs))
+        run(f"load_image_draft/{label}", lambda: [load_image(b) for b in blobs], len(blobs))
+        pipeline = PreprocessPipeline(batch_size=len(blobs))
+        run(f"pipeline/{label}", lambda: list(pipeline.batches(blobs)), len(blobs))
+
+    if model is not None:
+        for n in batch_sizes:
+            batch = np.random.default_rng(n).random((n, 224, 224, 3), dtype=np.float32)
+            run(f"model.predict/batch_{n}", lambda: predict_batch(model, batch), n)
+
+    from jellyfish.report import ThumbnailCache, write_html_report
+
+    rng = np.random.default_rng(0)
+    blobs = inputs["synthetic_1920x1080"] if "synthetic_1920x1080" in inputs else next(iter(inputs.values()))
+    rows = [build_result(f"image_{i:05d}.jpg", rng.dirichlet(np.ones(6)), key=str(i % len(blobs)))
+            for i in range(report_rows)]
+    thumbnails = ThumbnailCache()
+    thumbnail = lambda r: thumbnails.get(blobs[int(r["_key"])], key=r["_key"])
+    run(f"generate_html_report/{report_rows}_rows", lambda: write_html_report(rows, thumbnail, io.BytesIO()), report_rows)
+
+    import pandas as pd
+
+    run(f"csv/{report_rows}_rows", lambda: pd.DataFrame([public_row(r) for r in rows]).to_csv(index=False),
+        report_rows)
+    return results
+
+
+def environment(model=None):
+    env = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pillow": Image.__version__,
+    }
+    if "tensorflow" in sys.modules:
+        env["tensorflow"] = sys.modules["tensorflow"].__version__
+    if model is not None:
+        env["model"] = type(model).__name__
+    return env
+
+
+def save(path, results, model=None):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(model), "results": results}, f, indent=2)
+
+
+# ── Regression check ─────────────────────────────────────────
+def compare(baseline, current, threshold=0.10):
+    """Per-benchmark change vs ``baseline``; a regression is >``threshold`` lower throughput or higher p95."""
+    rows = []
+    for name, cur in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        throughput_change = cur["throughput"] / base["throughput"] - 1
+        p95_change = cur["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        rows.append({
+            "benchmark": name,
+            "throughput_change": throughput_change,
+            "p95_change": p95_change,
+            "regression": throughput_change < -threshold or p95_change > threshold,
+        })
+    return rows
+
+
+def format_comparison(rows):
+    lines = [f"{'benchmark':<48} {'throughput':>11} {'p95':>9}"]
+    for r in rows:
+        flag = "  REGRESSION" if r["regression"] else ""
+        lines.append(f"{r['benchmark']:<48} {r['throughput_change']:>+10.1%} {r['p95_change']:>+9.1%}{flag}")
+    return "\n".join(lines)
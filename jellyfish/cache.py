@@ -0,0 +1,162 @@
+"""Content-addressed cache of softmax vectors.
+
+Keys are a hash of the raw image bytes plus a model fingerprint, so a re-uploaded
+photo maps to the same entry while a retrained model never sees stale results.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents, e.g. the ``.keras`` model; ``"missing"`` if absent."""
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                h.update(chunk)
+    except OSError:
+        return "missing"
+    return h.hexdigest()
+
+
+def content_key(data: bytes, model_fingerprint: str) -> str:
+    h = hashlib.sha256(data)
+    h.update(model_fingerprint.encode())
+    return h.hexdigest()
+
+
+class PredictionCache:
+    """Two-tier LRU cache: an in-process dict and an optional SQLite file.
+
+    Both tiers are bounded by entry count and evict least-recently-used keys.
+    Safe to share between Streamlit sessions (all access goes through one lock).
+    """
+
+    def __init__(self, max_entries=4096, disk_path=None, max_disk_entries=200_000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                " key TEXT PRIMARY KEY, probs BLOB NOT NULL, accessed INTEGER NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS predictions_accessed ON predictions(accessed)")
+            self._db.commit()
+        self._clock = self._db_clock()
+
+    def _db_clock(self):
+        if self._db is None:
+            return 0
+        row = self._db.execute("SELECT MAX(accessed) FROM predictions").fetchone()
+        return row[0] or 0
+
+    def _tick(self):
+        self._clock += 1
+        return self._clock
+
+    # ── Lookup / insert ──────────────────────────────────────
+    def get(self, key):
+        with self._lock:
+            probs = self._mem.get(key)
+            if probs is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return probs
+            if self._db is not None:
+                row = self._db.execute("SELECT probs FROM predictions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE predictions SET accessed = ? WHERE key = ?", (self._tick(), key))
+                    self._db.commit()
+                    probs = np.frombuffer(row[0], dtype=np.float32).copy()
+                    self._remember(key, probs)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return probs
+            self.misses += 1
+            return None
+
+    def put(self, key, probs):
+        self.put_many([(key, probs)])
+
+    def put_many(self, items):
+        with self._lock:
+            rows = []
+            for key, probs in items:
+                probs = np.asarray(probs, dtype=np.float32)
+                self._remember(key, probs)
+                rows.append((key, probs.tobytes(), self._tick()))
+            if self._db is not None and rows:
+                self._db.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)", rows)
+                self._evict_disk()
+                self._db.commit()
+
+    def get_or_compute(self, keys, compute):
+        """Return one softmax vector per key, calling ``compute(indices)`` once for all misses.
+
+        ``compute`` receives the positions of the missing keys and must return
+        their softmax rows in the same order.
+        """
+        probs = [self.get(k) for k in keys]
+        missing = [i for i, p in enumerate(probs) if p is None]
+        if missing:
+            fresh = compute(missing)
+            for i, p in zip(missing, fresh):
+                probs[i] = np.asarray(p, dtype=np.float32)
+            self.put_many([(keys[i], probs[i]) for i in missing])
+        return probs
+
+    # ── Eviction ─────────────────────────────────────────────
+    def _remember(self, key, probs):
+        self._mem[key] = probs
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def _evict_disk(self):
+        (count,) = self._db.execute("SELECT COUNT(*) FROM predictions").fetchone()
+        excess = count - self.max_disk_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM predictions WHERE key IN"
+                " (SELECT key FROM predictions ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+
+    # ── Reporting ────────────────────────────────────────────
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._mem),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM predictions")
+                self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,319 @@
+"""Pre-rendered Model Performance charts.
+
+Figures are rendered once per (chart, data, theme, size, format) and the image
+bytes are kept in memory and optionally on disk, so page views serve bytes
+instead of re-running matplotlib. ``*_spec`` functions build the equivalent
+Vega-Lite specs for client-side interactive charts.
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from jellyfish.metrics import timer
+from jellyfish.species import CLASS_NAMES
+
+THEME = {
+    "background": "#041e3a",
+    "text": "#7ecfea",
+    "grid": "#062d55",
+    "accent": "#a78bfa",
+    "train": "#00bfff",
+    "val": "#7fffd4",
+}
+
+CHART_CACHE_DIR = os.environ.get("JELLYFISH_CHART_CACHE_DIR", os.path.join(".cache", "charts"))
+
+
+# ── Rendering ────────────────────────────────────────────────
+def _figure(size):
+    # Figure() rather than pyplot: no global state, safe across concurrent sessions
+    from matplotlib.figure import Figure
+
+    return Figure(figsize=size)
+
+
+def _to_bytes(fig, fmt, dpi=100):
+    buf = io.BytesIO()
+    fig.tight_layout()
+    fig.savefig(buf, format=fmt, dpi=dpi, facecolor=fig.get_facecolor())
+    return buf.getvalue()
+
+
+def render_confusion_matrix(data, fmt="png", size=(7, 5), theme=THEME):
+    import seaborn as sns
+
+    with timer("render.confusion_matrix"):
+        fig = _figure(size)
+        fig.patch.set_facecolor(theme["background"])
+        ax = fig.add_subplot()
+        ax.set_facecolor(theme["background"])
+
+        sns.heatmap(
+            data["matrix"], annot=True, fmt="d", ax=ax,
+            cmap=sns.color_palette("Blues", as_cmap=True),
+            linewidths=0.5, linecolor=theme["grid"],
+            xticklabels=data["labels"],
+            yticklabels=data["labels"],
+            cbar_kws={"shrink": 0.8}
+        )
+
+        ax.set_xlabel("Predicted", color=theme["text"], fontsize=10, labelpad=10)
+        ax.set_ylabel("Actual", color=theme["text"], fontsize=10, labelpad=10)
+        ax.tick_params(colors=theme["text"], labelsize=8)
+        for label in ax.get_xticklabels():
+            label.set_rotation(30)
+            label.set_ha("right")
+        for label in ax.get_yticklabels():
+            label.set_rotation(0)
+
+        # Color the colorbar
+        cbar = ax.collections[0].colorbar
+        cbar.ax.yaxis.set_tick_params(color=theme["text"])
+        for label in cbar.ax.yaxis.get_ticklabels():
+            label.set_color(theme["text"])
+
+        return _to_bytes(fig, fmt)
+
+
+def render_training_history(data, fmt="png", size=(12, 4), theme=THEME):
+    with timer("render.training_history"):
+        fig = _figure(size)
+        fig.patch.set_facecolor(theme["background"])
+        ax1, ax2 = fig.subplots(1, 2)
+        epochs = list(range(1, len(data["train_acc"]) + 1))
+        phase2_start = data.get("phase2_start")
+
+        for ax in [ax1, ax2]:
+            ax.set_facecolor(theme["background"])
+            ax.tick_params(colors=theme["text"], labelsize=8)
+            ax.spines[:].set_color(theme["grid"])
+            ax.grid(color=theme["grid"], linewidth=0.5)
+            if phase2_start:
+                ax.axvline(x=phase2_start, color=theme["accent"], linewidth=1.2,
+                           linestyle="--", alpha=0.7)
+
+        ax1.plot(epochs, data["train_acc"], color=theme["train"], linewidth=2,
+                 marker="o", markersize=3, label="Train Accuracy")
+        ax1.plot(epochs, data["val_acc"],   color=theme["val"], linewidth=2,
+                 marker="o", markersize=3, label="Val Accuracy")
+        ax1.set_title("Accuracy", color=theme["text"], fontsize=11, pad=10)
+        ax1.set_xlabel("Epoch", color=theme["text"], fontsize=9)
+        ax1.set_ylabel("Accuracy", color=theme["text"], fontsize=9)
+        ax1.legend(facecolor=theme["background"], labelcolor=theme["text"], fontsize=8)
+        ax1.set_ylim(0.4, 1.05)
+        if phase2_start:
+            ax1.text(phase2_start / 2, 0.45, "Phase 1: Frozen", color=theme["accent"], fontsize=8, ha="center", alpha=0.8)
+            ax1.text(phase2_start + 2, 0.45, "Phase 2: Fine-tune", color=theme["accent"], fontsize=8, ha="center", alpha=0.8)
+
+        ax2.plot(epochs, data["train_loss"], color=theme["train"], linewidth=2,
+                 marker="o", markersize=3, label="Train Loss")
+        ax2.plot(epochs, data["val_loss"],   color=theme["val"], linewidth=2,
+                 marker="o", markersize=3, label="Val Loss")
+        ax2.set_title("Loss", color=theme["text"], fontsize=11, pad=10)
+        ax2.set_xlabel("Epoch", color=theme["text"], fontsize=9)
+        ax2.set_ylabel("Loss", color=theme["text"], fontsize=9)
+        ax2.legend(facecolor=theme["background"], labelcolor=theme["text"], fontsize=8)
+
+        return _to_bytes(fig, fmt)
+
+
+RENDERERS = {
+    "confusion_matrix": render_confusion_matrix,
+    "training_history": render_training_history,
+}
+DEFAULT_SIZES = {
+    "confusion_matrix": (7, 5),
+    "training_history": (12, 4),
+}
+
+
+# ── Cache ────────────────────────────────────────────────────
+class ChartCache:
+    """Rendered chart bytes keyed by a hash of (chart, data, theme, size, format)."""
+
+    def __init__(self, disk_dir=CHART_CACHE_DIR, max_entries=64):
+        self.disk_dir = disk_dir
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(chart, data, fmt, size, theme):
+        payload = json.dumps([chart, data, fmt, list(size), theme], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, chart, data, fmt="png", size=None, theme=THEME):
+        render = RENDERERS[chart]
+        size = size or DEFAULT_SIZES[chart]
+        key = self.key(chart, data, fmt, size, theme)
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+        path = os.path.join(self.disk_dir, f"{chart}-{key[:32]}.{fmt}") if self.disk_dir else None
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                image = f.read()
+        else:
+            image = render(data, fmt=fmt, size=size, theme=theme)
+            if path:
+                tmp = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(image)
+                os.replace(tmp, path)
+        with self._lock:
+            self.misses += 1
+            self._items[key] = image
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return image
+
+
+# ── Client-side (Vega-Lite) ──────────────────────────────────
+def confusion_matrix_spec(data, theme=THEME):
+    labels = data["labels"]
+    values = [
+        {"actual": labels[i], "predicted": labels[j], "count": int(v)}
+        for i, row in enumerate(data["matrix"]) for j, v in enumerate(row)
+    ]
+    axis = {"labelColor": theme["text"], "titleColor": theme["text"], "labelAngle": -30}
+    encoding = {
+        "x": {"field": "predicted", "type": "nominal", "sort": labels, "title": "Predicted", "axis": axis},
+        "y": {"field": "actual", "type": "nominal", "sort": labels, "title": "Actual",
+              "axis": {**axis, "labelAngle": 0}},
+    }
+    return {
+        "data": {"values": values},
+        "background": theme["background"],
+        "layer": [
+            {"mark": "rect", "encoding": {**encoding, "color": {"field": "count", "type": "quantitative",
+                                                                 "scale": {"scheme": "blues"}, "legend": None},
+                                          "tooltip": [{"field": "actual"}, {"field": "predicted"}, {"field": "count"}]}},
+            {"mark": {"type": "text", "color": theme["background"]},
+             "encoding": {**encoding, "text": {"field": "count", "type": "quantitative"}}},
+        ],
+        "height": 360,
+    }
+
+
+def training_history_spec(data, metric, theme=THEME):
+    """Line chart of ``metric`` ("acc" or "loss") for train and validation."""
+    values = []
+    for split in ("train", "val"):
+        for epoch, v in enumerate(data[f"{split}_{metric}"], start=1):
+            values.append({"epoch": epoch, "value": v, "split": "Train" if split == "train" else "Val"})
+    axis = {"labelColor": theme["text"], "titleColor": theme["text"], "gridColor": theme["grid"]}
+    layers = [{
+        "mark": {"type": "line", "point": True},
+        "encoding": {
+            "x": {"field": "epoch", "type": "quantitative", "title": "Epoch", "axis": axis},
+            "y": {"field": "value", "type": "quantitative", "title": "Accuracy" if metric == "acc" else "Loss",
+                  "axis": axis, "scale": {"zero": False}},
+            "color": {"field": "split", "type": "nominal",
+                      "scale": {"range": [theme["train"], theme["val"]]},
+                      "legend": {"labelColor": theme["text"], "titleColor": theme["text"]}},
+            "tooltip": [{"field": "epoch"}, {"field": "split"}, {"field": "value", "format": ".3f"}],
+        },
+    }]
+    if data.get("phase2_start"):
+        layers.append({
+            "data": {"values": [{"epoch": data["phase2_start"]}]},
+            "mark": {"type": "rule", "color": theme["accent"], "strokeDash": [4, 4]},
+            "encoding": {"x": {"field": "epoch", "type": "quantitative"}},
+        })
+    return {"data": {"values": values}, "background": theme["background"], "layer": layers, "height": 280}
+
+
+def video_timeline_spec(segments, rows, theme=THEME):
+    """Detected segments as bars over time, above the smoothed top-class confidence per sampled frame."""
+    axis = {"labelColor": theme["text"], "titleColor": theme["text"], "gridColor": theme["grid"]}
+    bars = [{"species": s["species"].replace('_', ' ').title(), "start": round(s["start"], 2),
+             "end": round(s["end"], 2), "confidence": round(s["confidence"], 3)} for s in segments]
+    points = [{"time": round(r["time"], 2), "confidence": round(float(r["smoothed"].max()), 3),
+               "species": CLASS_NAMES[int(r["smoothed"].argmax())].replace('_', ' ').title()} for r in rows]
+    legend = {"labelColor": theme["text"], "titleColor": theme["text"]}
+    return {
+        "background": theme["background"],
+        "vconcat": [
+            {
+                "data": {"values": bars},
+                "mark": {"type": "bar", "cornerRadius": 3},
+                "encoding": {
+                    "x": {"field": "start", "type": "quantitative", "title": None, "axis": axis},
+                    "x2": {"field": "end"},
+                    "y": {"field": "species", "type": "nominal", "title": None, "axis": axis},
+                    "color": {"field": "species", "type": "nominal", "legend": None},
+                    "tooltip": [{"field": "species"}, {"field": "start", "title": "start (s)"},
+                                {"field": "end", "title": "end (s)"}, {"field": "confidence", "format": ".1%"}],
+                },
+                "height": 140,
+                "width": "container",
+            },
+            {
+                "data": {"values": points},
+                "encoding": {
+                    "x": {"field": "time", "type": "quantitative", "title": "Time (s)", "axis": axis},
+                    "y": {"field": "confidence", "type": "quantitative", "title": "Smoothed confidence",
+                          "axis": {**axis, "format": ".0%"}, "scale": {"domain": [0, 1]}},
+                },
+                "layer": [
+                    {"mark": {"type": "line", "color": theme["accent"], "interpolate": "step-after"}},
+                    {"mark": {"type": "point", "filled": True},
+                     "encoding": {"color": {"field": "species", "type": "nominal", "legend": legend},
+                                  "tooltip": [{"field": "time"}, {"field": "species"},
+                                              {"field": "confidence", "format": ".1%"}]}},
+                ],
+                "height": 160,
+                "width": "container",
+            },
+        ],
+    }
+
+
+def history_counts_spec(rows, theme=THEME):
+    """Stacked bars of images per period and species, from ``HistoryStore.counts``."""
+    axis = {"labelColor": theme["text"], "titleColor": theme["text"], "gridColor": theme["grid"]}
+    values = [{**r, "species": r["species"].replace('_', ' ').title()} for r in rows]
+    return {
+        "data": {"values": values},
+        "background": theme["background"],
+        "mark": "bar",
+        "encoding": {
+            "x": {"field": "period", "type": "ordinal", "title": None, "axis": {**axis, "labelAngle": -45}},
+            "y": {"field": "images", "type": "quantitative", "title": "Images", "axis": axis},
+            "color": {"field": "species", "type": "nominal",
+                      "legend": {"labelColor": theme["text"], "titleColor": theme["text"]}},
+            "tooltip": [{"field": "period"}, {"field": "species"}, {"field": "images"},
+                        {"field": "mean_confidence", "title": "mean confidence", "format": ".1%"}],
+        },
+        "height": 280,
+    }
+
+
+def confidence_histogram_spec(histogram, theme=THEME):
+    """Bars of image counts per equal-width confidence bucket."""
+    axis = {"labelColor": theme["text"], "titleColor": theme["text"], "gridColor": theme["grid"]}
+    width = 1 / len(histogram)
+    values = [{"from": i * width, "to": (i + 1) * width, "images": n} for i, n in enumerate(histogram)]
+    return {
+        "data": {"values": values},
+        "background": theme["background"],
+        "mark": {"type": "bar", "color": theme["accent"]},
+        "encoding": {
+            "x": {"field": "from", "type": "quantitative", "bin": {"binned": True, "step": width},
+                  "title": "Confidence", "axis": {**axis, "format": ".0%"}},
+            "x2": {"field": "to"},
+            "y": {"field": "images", "type": "quantitative", "title": "Images", "axis": axis},
+            "tooltip": [{"field": "from", "format": ".0%"}, {"field": "to", "format": ".0%"}, {"field": "images"}],
+        },
+        "height": 220,
+    }
@@ -0,0 +1,721 @@
+"""Headless batch classification: ``python -m jellyfish classify DIR --out results.jsonl``.
+
+Images are discovered lazily, decoded in parallel a batch ahead of the model, and each
+batch's rows are appended and flushed before the next starts, so memory stays flat
+and an interrupted run picks up where it stopped.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from jellyfish import exif, inference, retrain, tta
+from jellyfish.cache import content_key, file_fingerprint
+from jellyfish.dedup import DEFAULT_MAX_DISTANCE, HashIndex, describe
+from jellyfish.history import HISTORY_DB, HistoryStore
+from jellyfish.pipeline import DEFAULT_WORKERS, PreprocessPipeline, iter_images
+from jellyfish.registry import MODEL_BUDGET_BYTES, MODES, Deployment
+from jellyfish.results import CSV_COLUMNS, build_result, public_row
+from jellyfish.species import CLASS_NAMES
+
+# ── Output ───────────────────────────────────────────────────
+def output_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def _drop_partial_line(path):
+    # A run killed mid-write can leave half a row; cut back to the last newline
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def completed_files(path, fmt):
+    """Filenames already present in an earlier (possibly interrupted) output file."""
+    if not os.path.exists(path):
+        return set()
+    _drop_partial_line(path)
+    done = set()
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            for row in csv.DictReader(f):
+                done.add(row["Filename"])
+        else:
+            for line in f:
+                if line.strip():
+                    done.add(json.loads(line)["Filename"])
+    return done
+
+
+class RowWriter:
+    def __init__(self, path, fmt):
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.fmt = fmt
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        if fmt == "csv":
+            fieldnames = CSV_COLUMNS
+            if not is_new:
+                # Resuming a file written before columns were added: keep its header
+                with open(path, newline="", encoding="utf-8") as f:
+                    fieldnames = next(csv.reader(f), None) or CSV_COLUMNS
+            self._csv = csv.DictWriter(self._file, fieldnames=fieldnames, extrasaction="ignore")
+            if is_new:
+                self._csv.writeheader()
+
+    def write_many(self, rows):
+        for row in rows:
+            if self.fmt == "csv":
+                self._csv.writerow(row)
+            else:
+                self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def error_row(filename, exc):
+    row = dict.fromkeys(CSV_COLUMNS, "")
+    row.update({"Filename": filename, "Status": "ERROR", "Note": f"Could not read image: {exc}"})
+    return row
+
+
+# ── Progress ─────────────────────────────────────────────────
+class Progress:
+    def __init__(self, stream=sys.stderr, skipped=0):
+        self.stream = stream
+        self.skipped = skipped
+        self.done = 0
+        self.tta_images = 0
+        self.deduplicated = 0
+        self.tta_seconds = 0.0
+        self.start = time.perf_counter()
+
+    def update(self, n, tta_costs=()):
+        self.done += n
+        self.tta_images += len(tta_costs)
+        self.tta_seconds += sum(tta_costs)
+        elapsed = time.perf_counter() - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        tta = (f" · TTA on {self.tta_images} ({1000 * self.tta_seconds / self.tta_images:.0f} ms/img)"
+               if self.tta_images else "")
+        dedup = f" · {self.deduplicated} near-duplicates reused" if self.deduplicated else ""
+        resumed = f" · {self.skipped} skipped (resumed)" if self.skipped else ""
+        self.stream.write(f"\r{self.done} processed · {rate:.1f} img/s{tta}{dedup}{resumed}")
+        self.stream.flush()
+
+    def finish(self):
+        self.stream.write("\n")
+
+
+# ── Commands ─────────────────────────────────────────────────
+def classify_directory(model, root, out, fmt=None, batch_size=inference.BATCH_SIZE, resume=True, progress=None,
+                       workers=DEFAULT_WORKERS, tta_mode="off", tta_views=tta.DEFAULT_VIEWS, dedup=None, ood=None,
+                       history=None):
+    """``dedup`` is an optional ``HashIndex``; near-duplicates of an indexed image reuse its softmax row.
+
+    ``history`` is a ``(HistoryStore, model_fingerprint)`` pair that every classified image is recorded in.
+    EXIF capture time and GPS position are read from each file's header on a side pool while its batch predicts.
+
+    ``ood`` is an ``(EmbeddingModel, OODDetector)`` pair; when given, the batch goes through the
+    embedding model so out-of-distribution scores come from the same forward pass.
+    """
+    fmt = output_format(out, fmt)
+    if not resume and os.path.exists(out):
+        os.remove(out)
+    done = completed_files(out, fmt)
+    progress = progress or Progress(skipped=len(done))
+    pipeline = PreprocessPipeline(workers=workers, batch_size=batch_size)
+    writer = RowWriter(out, fmt)
+    exif_reader = exif.ExifReader()
+    try:
+        pending = ((rel, path) for rel, path in iter_images(root) if rel not in done)
+        for batch in pipeline.batches(pending, source=lambda item: item[1]):
+            rows = [error_row(rel, e) for (rel, _), e in batch.errors]
+            costs = []
+            if batch.keys:
+                headers = exif_reader.submit(path for _, path in batch.keys)
+                if dedup is None:
+                    probs, costs = _classify_batch(model, batch.array, tta_mode, tta_views, ood)
+                else:
+                    clusters, fresh = [], []
+                    for row, (a, (rel, _)) in enumerate(zip(batch.array, batch.keys)):
+                        h, signature = describe(a)
+                        cluster = dedup.find(h, signature)
+                        if cluster is None:
+                            cluster = dedup.add(h, signature, label=rel)
+                            fresh.append(row)
+                        clusters.append(cluster)
+                    costs = np.zeros(0)
+                    if fresh:
+                        fresh_probs, costs = _classify_batch(model, batch.array[fresh], tta_mode, tta_views, ood)
+                        for row, p in zip(fresh, fresh_probs):
+                            dedup.set_probs(clusters[row], p)
+                    probs = [dedup.probs(c) for c in clusters]
+                    progress.deduplicated += len(batch.keys) - len(fresh)
+                costs = costs[costs > 0]
+                records = [_result(rel, p, ood, h.result()) for (rel, _), p, h in zip(batch.keys, probs, headers)]
+                if history is not None:
+                    # Keyed like the app's uploads, so an image seen by both is stored once
+                    store, fingerprint = history
+                    for record, (_, path) in zip(records, batch.keys):
+                        with open(path, "rb") as f:
+                            record["_key"] = content_key(f.read(), fingerprint)
+                    store.add(records, fingerprint[:12], source="cli")
+                rows.extend(public_row(r) for r in records)
+            writer.write_many(rows)
+            progress.update(len(batch.keys) + len(batch.errors), costs)
+    finally:
+        writer.close()
+        exif_reader.close()
+        progress.finish()
+        if dedup is not None and dedup.path:
+            dedup.save()
+        if history is not None:
+            history[0].flush()
+    return progress.done
+
+
+def classify_video(model, source, out, frames_out=None, replay_fps=None, max_seconds=None, sampler=None,
+                   smoother=None, min_confidence=None, stream=sys.stderr):
+    """Write detected segments to ``out`` (CSV) and optionally every classified frame to ``frames_out``.
+
+    Stops at the end of the source, after ``max_seconds`` of media time, or on Ctrl-C;
+    segments found so far are written in every case.
+    """
+    from jellyfish import video
+
+    reader = video.FrameReader(source, replay_fps=replay_fps)
+    sampler = sampler or video.FrameSampler()
+    rows = []
+    frame_file = open(frames_out, "w", newline="", encoding="utf-8") if frames_out else None
+    start = time.perf_counter()
+    try:
+        frame_writer = csv.DictWriter(frame_file, fieldnames=video.FRAME_COLUMNS) if frame_file else None
+        if frame_writer:
+            frame_writer.writeheader()
+        for row in video.classify_stream(model, reader, sampler, smoother):
+            rows.append({k: row[k] for k in ("frame", "time", "smoothed")})
+            if frame_writer:
+                frame_writer.writerow(video.frame_row(row))
+            elapsed = time.perf_counter() - start
+            stream.write(f"\r{row['time']:.1f}s of video · {reader.frames_read} frames read · "
+                         f"{sampler.sampled} classified · {sampler.skipped} static skipped · "
+                         f"{reader.frames_dropped} dropped · {row['time'] / elapsed if elapsed else 0:.1f}× real time")
+            stream.flush()
+            if max_seconds is not None and row["time"] >= max_seconds:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if frame_file:
+            frame_file.close()
+        stream.write("\n")
+    segments = video.detect_segments(rows, min_confidence or video.DEFAULT_MIN_CONFIDENCE,
+                                     end_time=reader.last_time)
+    with open(out, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=video.SEGMENT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(video.segment_row(s) for s in segments)
+    return segments
+
+
+def count_directory(model, root, out, regions_out=None, heatmaps=None, progress=None, **tiling_options):
+    """Per-image species counts from tiled inference, plus optional region rows and heatmap overlays."""
+    from jellyfish import tiling
+
+    species = [name.replace('_', ' ').title() for name in CLASS_NAMES]
+    progress = progress or Progress()
+    if heatmaps:
+        os.makedirs(heatmaps, exist_ok=True)
+    with open(out, "w", newline="", encoding="utf-8") as f, \
+            (open(regions_out, "w", newline="", encoding="utf-8") if regions_out else open(os.devnull, "w")) as rf:
+        counts = csv.DictWriter(f, fieldnames=["Filename", "Tiles", "Classified Tiles", "Regions", *species, "Note"])
+        counts.writeheader()
+        regions = csv.DictWriter(rf, fieldnames=["Filename", "Species", "Confidence (%)", "Peak (%)",
+                                                 "X0", "Y0", "X1", "Y1"])
+        regions.writeheader()
+        for (rel, path), result, error in tiling.classify_tiled(model, iter_images(root), source=lambda item: item[1],
+                                                                **tiling_options):
+            if error is not None:
+                counts.writerow({"Filename": rel, "Note": f"Could not read image: {error}"})
+                progress.update(1)
+                continue
+            # Boxes are reported in original-image pixels
+            with Image.open(path) as img:
+                scale = img.width / result["size"][0]
+            row = {"Filename": rel, "Tiles": result["tiles"], "Classified Tiles": result["classified"],
+                   "Regions": len(result["regions"]), "Note": ""}
+            row.update({title: result["counts"].get(name, 0) for name, title in zip(CLASS_NAMES, species)})
+            counts.writerow(row)
+            for region in result["regions"]:
+                regions.writerow({"Filename": rel, "Species": region["species"].replace('_', ' ').title(),
+                                  "Confidence (%)": f"{region['confidence']*100:.1f}",
+                                  "Peak (%)": f"{region['peak']*100:.1f}",
+                                  **dict(zip(("X0", "Y0", "X1", "Y1"), (round(v * scale) for v in region["box"])))})
+            if heatmaps:
+                target = os.path.join(heatmaps, os.path.splitext(rel.replace(os.sep, "__"))[0] + ".heatmap.webp")
+                with open(target, "wb") as hf:
+                    hf.write(tiling.heatmap_overlay(path, result))
+            f.flush()
+            progress.update(1)
+    progress.finish()
+    return progress.done
+
+
+def _classify_batch(model, batch, tta_mode, tta_views, ood=None):
+    # Softmax rows, with the three OOD scores appended when scoring OOD
+    if ood is None:
+        probs = inference.predict_batch(model, batch)
+        return tta.refine(model, batch, probs, tta_mode, tta_views)
+    embedder, detector = ood
+    features, probs = embedder.embed(batch)
+    scores = detector.score(features, probs)
+    probs, costs = tta.refine(model, batch, probs, tta_mode, tta_views)
+    return np.concatenate([probs, scores], axis=1), costs
+
+
+def _result(rel, row, ood=None, meta=None):
+    if ood is None:
+        return build_result(rel, row, exif=meta)
+    detector = ood[1]
+    return build_result(rel, row[:len(CLASS_NAMES)], ood=detector.describe(row[None, len(CLASS_NAMES):])[0],
+                        exif=meta)
+
+
+def _bbox(text):
+    try:
+        south, west, north, east = (float(v) for v in text.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected four comma-separated degrees: south,west,north,east")
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise argparse.ArgumentTypeError("south/north must be ordered in -90..90 and west/east in -180..180")
+    return south, west, north, east
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m jellyfish", description="Jellyfish Classifier tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    classify = sub.add_parser("classify", help="Classify every image under a directory")
+    classify.add_argument("directory")
+    classify.add_argument("--out", required=True, help="Output file (.csv or .jsonl)")
+    classify.add_argument("--format", choices=["csv", "jsonl"], help="Override format inferred from --out")
+    classify.add_argument("--model", help="Model file (default: the configured backend's model)")
+    classify.add_argument("--backend", choices=["keras", "tflite"], help="Default: $JELLYFISH_BACKEND or keras")
+    classify.add_argument("--batch-size", type=int, default=inference.BATCH_SIZE)
+    classify.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Decode/preprocess threads")
+    classify.add_argument("--tta", choices=tta.MODES, default="off",
+                          help="Test-time augmentation: auto re-scores only low/moderate confidence images")
+    classify.add_argument("--tta-views", type=int, default=tta.DEFAULT_VIEWS, help=f"Views per image (max {len(tta.VIEWS)})")
+    classify.add_argument("--dedup", action="store_true",
+                          help="Reuse one prediction for near-duplicate images (perceptual hash plus colour check)")
+    classify.add_argument("--dedup-distance", type=int, default=DEFAULT_MAX_DISTANCE,
+                          help="Max differing hash bits (of 64) to count as a duplicate; colours must match too")
+    classify.add_argument("--dedup-index", help="Load/save the duplicate index here (.npz) to reuse it across runs")
+    classify.add_argument("--ood", action="store_true",
+                          help="Flag out-of-distribution images in Status/Note (needs calibrate-ood first)")
+    classify.add_argument("--history", nargs="?", const=HISTORY_DB, metavar="DB",
+                          help="Also record every result in the history database (default: $JELLYFISH_HISTORY_DB)")
+    classify.add_argument("--no-resume", dest="resume", action="store_false",
+                          help="Start over instead of skipping files already in --out")
+
+    serve = sub.add_parser("serve", help="Run the HTTP inference service")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument("--model", help="Model file (default: the configured backend's model)")
+    serve.add_argument("--backend", choices=["keras", "tflite"], help="Default: $JELLYFISH_BACKEND or keras")
+    serve.add_argument("--models", help="Serve several versions: 'current=a.keras,candidate=b.tflite' "
+                                        "(first is primary; overrides --model)")
+    serve.add_argument("--mode", choices=MODES, default="single", help="How --models share traffic")
+    serve.add_argument("--split", type=float, default=0.1, help="Share of images sent to the challenger in ab mode")
+    serve.add_argument("--model-budget-mb", type=int, default=MODEL_BUDGET_BYTES // 2**20,
+                       help="Evict least recently used models past this size")
+    serve.add_argument("--max-batch", type=int, default=inference.BATCH_SIZE,
+                       help="Most images grouped into one predict call")
+    serve.add_argument("--max-wait-ms", type=float, default=10,
+                       help="How long the first queued image waits for others to join its batch")
+
+    convert = sub.add_parser("convert", help="Convert the Keras model to TFLite")
+    convert.add_argument("--model", default=inference.model_path("keras"))
+    convert.add_argument("--out", default=inference.TFLITE_MODEL_PATH)
+    convert.add_argument("--quantization", choices=["float32", "float16", "dynamic", "int8"], default="float16")
+    convert.add_argument("--calibration-dir", default="samples", help="Representative images for int8")
+
+    parity = sub.add_parser("parity", help="Compare a TFLite model against the Keras model on labelled images")
+    parity.add_argument("directory", help="Class-per-subfolder directory (or files named <class>.jpg)")
+    parity.add_argument("--model", default=inference.model_path("keras"))
+    parity.add_argument("--candidate", default=inference.TFLITE_MODEL_PATH)
+    parity.add_argument("--threads", type=int, default=inference.TFLITE_THREADS)
+
+    evaluate = sub.add_parser("evaluate", help="Evaluate the model on a labelled folder and save the artifact")
+    evaluate.add_argument("directory", help="Class-per-subfolder directory named after CLASS_NAMES")
+    evaluate.add_argument("--model", help="Model file (default: the configured backend's model)")
+    evaluate.add_argument("--backend", choices=["keras", "tflite"])
+    evaluate.add_argument("--batch-size", type=int, default=inference.BATCH_SIZE)
+    evaluate.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    evaluate.add_argument("--history", help="Keras History JSON to show as training curves")
+    evaluate.add_argument("--artifacts-dir", help="Where to write <model hash>.json (default: eval_artifacts)")
+
+    bench = sub.add_parser("bench", help="Benchmark preprocessing, prediction, report and CSV building")
+    bench.add_argument("--out", default="benchmark.json")
+    bench.add_argument("--samples", default="samples")
+    bench.add_argument("--repeat", type=int, default=5)
+    bench.add_argument("--model", help="Model file (default: the configured backend's model)")
+    bench.add_argument("--backend", choices=["keras", "tflite"])
+    bench.add_argument("--no-model", action="store_true", help="Skip model.predict benchmarks")
+    bench.add_argument("--baseline", help="Earlier benchmark JSON to compare against")
+    bench.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown before flagging (0.10 = 10%%)")
+
+    compare = sub.add_parser("bench-compare", help="Compare two benchmark JSON files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.10)
+
+    gallery = sub.add_parser("index-gallery", help="Embed reference images into the similarity index (incremental)")
+    gallery.add_argument("directory", nargs="?", help="Reference images (default: $JELLYFISH_GALLERY_DIR or samples)")
+    gallery.add_argument("--model", help="Keras model file (default: the configured model)")
+    gallery.add_argument("--index-dir", help="Default: a per-model folder under $JELLYFISH_GALLERY_INDEX_DIR")
+    gallery.add_argument("--batch-size", type=int, default=inference.BATCH_SIZE)
+    gallery.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+
+    vid = sub.add_parser("video", help="Classify a video file or camera stream into timed species detections")
+    vid.add_argument("source", help="Video file, camera index (0) or stream URL (rtsp://…)")
+    vid.add_argument("--out", required=True, help="Detected segments (.csv)")
+    vid.add_argument("--frames-out", help="Also write every classified frame here (.csv)")
+    vid.add_argument("--model", help="Model file (default: the configured backend's model)")
+    vid.add_argument("--backend", choices=["keras", "tflite"], help="Default: $JELLYFISH_BACKEND or keras")
+    vid.add_argument("--replay-fps", type=float,
+                     help="Play a file back at this frame rate like a live camera (drops frames if behind)")
+    vid.add_argument("--max-seconds", type=float, help="Stop after this much video (needed for endless streams)")
+    vid.add_argument("--motion-threshold", type=float, default=None,
+                     help="Mean grey-level change (0-1) that makes a frame worth classifying")
+    vid.add_argument("--max-gap", type=float, default=None, help="Classify a static scene at least this often (s)")
+    vid.add_argument("--smoothing", type=float, default=None, help="Time constant of the softmax smoothing (s)")
+    vid.add_argument("--min-confidence", type=float, default=None, help="Smoothed confidence needed for a detection")
+
+    count = sub.add_parser("count", help="Count jellyfish in wide shots by classifying overlapping tiles")
+    count.add_argument("directory")
+    count.add_argument("--out", required=True, help="Per-image species counts (.csv)")
+    count.add_argument("--regions-out", help="One row per detected region with its pixel box (.csv)")
+    count.add_argument("--heatmaps", help="Folder for <image>.heatmap.webp overlays")
+    count.add_argument("--model", help="Model file (default: the configured backend's model)")
+    count.add_argument("--backend", choices=["keras", "tflite"], help="Default: $JELLYFISH_BACKEND or keras")
+    count.add_argument("--scales", help="Tile sides as fractions of the short edge, e.g. 0.5,0.25")
+    count.add_argument("--overlap", type=float, help="Fraction by which neighbouring tiles overlap")
+    count.add_argument("--min-std", type=float, help="Skip tiles whose grey-level std (0-1) is below this")
+    count.add_argument("--min-confidence", type=float, help="Cell confidence needed to belong to a region")
+    count.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Decode/tiling threads")
+
+    hist = sub.add_parser("history", help="Sighting statistics from the history database")
+    hist.add_argument("--db", default=HISTORY_DB, help="Default: $JELLYFISH_HISTORY_DB")
+    hist.add_argument("--by", choices=["day", "month", "year"], default="month")
+    hist.add_argument("--since", help="First day (YYYY-MM-DD)")
+    hist.add_argument("--until", help="Last day (YYYY-MM-DD)")
+    hist.add_argument("--out", help="Write the per-period, per-species counts here (.csv)")
+    hist.add_argument("--rebuild", action="store_true", help="Recompute the aggregates from the stored results first")
+
+    sightings = sub.add_parser("sightings", help="Species counts inside bounding boxes, from geotagged history")
+    sightings.add_argument("--db", default=HISTORY_DB, help="Default: $JELLYFISH_HISTORY_DB")
+    sightings.add_argument("--bbox", type=_bbox, metavar="S,W,N,E", help="South,west,north,east in degrees")
+    sightings.add_argument("--places", help='JSON file of named boxes, e.g. {"Bondi": [-33.897, 151.268, -33.884, 151.284]}')
+    sightings.add_argument("--since", help="First day (YYYY-MM-DD)")
+    sightings.add_argument("--until", help="Last day (YYYY-MM-DD)")
+    sightings.add_argument("--species", nargs="+", choices=CLASS_NAMES, help="Only report these species")
+    sightings.add_argument("--out", help="Write place, species, sightings rows here (.csv)")
+
+    calibrate = sub.add_parser("calibrate-ood", help="Fit out-of-distribution centroids and thresholds "
+                                                     "on labelled in-distribution images")
+    calibrate.add_argument("directory", help="Labelled folder (class subfolders or <class>.jpg names)")
+    calibrate.add_argument("--model", help="Keras model file (default: the configured model)")
+    calibrate.add_argument("--quantile", type=float, default=0.95,
+                           help="Share of in-distribution images each threshold lets through")
+    calibrate.add_argument("--batch-size", type=int, default=inference.BATCH_SIZE)
+    calibrate.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+
+    refit = sub.add_parser("retrain", help="Refit only the classification head on cached backbone embeddings "
+                                          "of labelled images and corrections; saves a new model version")
+    refit.add_argument("directories", nargs="*", help="Labelled folders (class subfolders or <class>.jpg names)")
+    refit.add_argument("--corrections", default=retrain.CORRECTIONS_DIR,
+                       help="Corrections saved from the Classifier page (default: $JELLYFISH_CORRECTIONS_DIR)")
+    refit.add_argument("--model", help="Keras model to start from (default: the current version)")
+    refit.add_argument("--models-dir", default=inference.MODELS_DIR, help="Default: $JELLYFISH_MODELS_DIR")
+    refit.add_argument("--feature-db", default=retrain.FEATURE_DB, help="Embedding cache (default: $JELLYFISH_FEATURE_DB)")
+    refit.add_argument("--epochs", type=int, default=retrain.EPOCHS)
+    refit.add_argument("--learning-rate", type=float, default=retrain.LEARNING_RATE)
+    refit.add_argument("--l2", type=float, default=retrain.L2, help="Pull towards the starting head's weights")
+    refit.add_argument("--promote", action="store_true",
+                       help="Make the new version current unless its held-out accuracy is below the parent's")
+    refit.add_argument("--force", action="store_true", help="With --promote, promote even if accuracy dropped")
+    refit.add_argument("--batch-size", type=int, default=inference.BATCH_SIZE)
+    refit.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+
+    promote = sub.add_parser("promote", help="List model versions, or pick the one the app and CLI load")
+    promote.add_argument("version", nargs="?", help="Version number, or 'original' for the base model file")
+    promote.add_argument("--models-dir", default=inference.MODELS_DIR, help="Default: $JELLYFISH_MODELS_DIR")
+
+    similar = sub.add_parser("similar", help="Most similar reference images for each given image")
+    similar.add_argument("images", nargs="+")
+    similar.add_argument("--model", help="Keras model file (default: the configured model)")
+    similar.add_argument("--index-dir", help="Default: a per-model folder under $JELLYFISH_GALLERY_INDEX_DIR")
+    similar.add_argument("-k", type=int, default=5)
+    return parser
+
+
+def _report_comparison(baseline_path, current_path, threshold):
+    from jellyfish import benchmark
+
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(current_path, encoding="utf-8") as f:
+        current = json.load(f)
+    rows = benchmark.compare(baseline, current, threshold)
+    print(benchmark.format_comparison(rows))
+    return 1 if any(r["regression"] for r in rows) else 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "classify":
+        if not os.path.isdir(args.directory):
+            print(f"error: {args.directory} is not a directory", file=sys.stderr)
+            return 2
+        model_file = args.model or inference.model_path(args.backend)
+        model = inference.load_model(model_file, backend=args.backend)
+        ood = None
+        if args.ood:
+            from jellyfish.embeddings import EmbeddingModel
+            from jellyfish.ood import OODDetector, calibration_path
+
+            try:
+                embedder = EmbeddingModel(model)
+            except ValueError as e:
+                print(f"error: --ood: {e}", file=sys.stderr)
+                return 2
+            detector = OODDetector.load(model_file, embedder.head)
+            if detector is None:
+                print(f"error: no OOD calibration for {model_file} at {calibration_path(model_file)}; "
+                      f"run 'python -m jellyfish calibrate-ood DIR' first", file=sys.stderr)
+                return 2
+            ood = (embedder, detector)
+        dedup = None
+        if args.dedup or args.dedup_index:
+            # Rows in a saved index are only valid for the same model file and scoring options
+            fingerprint = file_fingerprint(model_file)
+            if args.tta != "off":
+                fingerprint += f"{tta.tag(args.tta_views)}-{args.tta}"
+            if ood is not None:
+                fingerprint += f":ood-{ood[1].fingerprint}"
+            dedup = HashIndex(args.dedup_distance, args.dedup_index, fingerprint)
+        history = (HistoryStore(args.history), file_fingerprint(model_file)) if args.history else None
+        classify_directory(model, args.directory, args.out, fmt=args.format,
+                           batch_size=args.batch_size, resume=args.resume, workers=args.workers,
+                           tta_mode=args.tta, tta_views=args.tta_views, dedup=dedup, ood=ood, history=history)
+        if history is not None:
+            history[0].close()
+    elif args.command == "serve":
+        from jellyfish.server import serve
+
+        if args.models:
+            model = Deployment.from_spec(args.models, mode=args.mode, split=args.split,
+                                         budget_bytes=args.model_budget_mb * 2**20,
+                                         loader=lambda path: inference.load_model(path, backend=args.backend))
+        else:
+            model = inference.load_model(args.model, backend=args.backend)
+        inference.warm_up(model)
+        serve(model, host=args.host, port=args.port, max_batch_size=args.max_batch, max_wait_ms=args.max_wait_ms)
+    elif args.command == "convert":
+        from jellyfish.backends import convert_to_tflite
+
+        keras_model = inference.load_model(args.model, backend="keras")
+        convert_to_tflite(keras_model, args.out, args.quantization, args.calibration_dir)
+        print(f"Wrote {args.quantization} TFLite model to {args.out}")
+    elif args.command == "parity":
+        from jellyfish.backends import parity_report
+
+        report = parity_report(inference.load_model(args.model, backend="keras"),
+                               inference.load_model(args.candidate, backend="tflite", num_threads=args.threads),
+                               args.directory)
+        print(json.dumps(report, indent=2))
+    elif args.command == "evaluate":
+        from jellyfish import evaluation
+
+        model_file = args.model or inference.model_path(args.backend)
+        model = inference.load_model(model_file, backend=args.backend)
+        history = evaluation.load_history(args.history) if args.history else None
+        progress = Progress()
+        result = evaluation.evaluate(model, args.directory, batch_size=args.batch_size, workers=args.workers,
+                                     progress=lambda n, skipped: progress.update(n - progress.done))
+        progress.finish()
+        path = evaluation.save_artifact(result, model_file, args.artifacts_dir or evaluation.ARTIFACTS_DIR, history)
+        print(f"Accuracy {result['accuracy']*100:.1f}% on {result['images']} images "
+              f"(ECE {result['calibration']['ece']:.3f}) — saved {path}")
+    elif args.command == "bench":
+        from jellyfish import benchmark
+
+        model = None
+        if not args.no_model:
+            model = inference.load_model(args.model, backend=args.backend)
+            inference.warm_up(model)
+        results = benchmark.run_suite(model, samples_dir=args.samples, repeat=args.repeat, log=print)
+        benchmark.save(args.out, results, model)
+        print(f"Saved {len(results)} benchmarks to {args.out}")
+        if args.baseline:
+            return _report_comparison(args.baseline, args.out, args.threshold)
+    elif args.command == "bench-compare":
+        return _report_comparison(args.baseline, args.current, args.threshold)
+    elif args.command == "video":
+        from jellyfish import video
+
+        model = inference.load_model(args.model, backend=args.backend)
+        inference.warm_up(model, (video.STREAM_BATCH_SIZE,))
+        sampler = video.FrameSampler(
+            video.DEFAULT_MOTION_THRESHOLD if args.motion_threshold is None else args.motion_threshold,
+            video.DEFAULT_MAX_GAP if args.max_gap is None else args.max_gap)
+        smoother = video.TemporalSmoother(video.DEFAULT_SMOOTHING if args.smoothing is None else args.smoothing)
+        segments = classify_video(model, args.source, args.out, args.frames_out, args.replay_fps, args.max_seconds,
+                                  sampler, smoother, args.min_confidence)
+        for s in segments:
+            print(f"{s['start']:8.2f}–{s['end']:<8.2f} {s['species']:<24} {s['confidence']*100:.1f}%")
+        print(f"{len(segments)} detections — saved {args.out}")
+    elif args.command == "count":
+        if not os.path.isdir(args.directory):
+            print(f"error: {args.directory} is not a directory", file=sys.stderr)
+            return 2
+        model = inference.load_model(args.model, backend=args.backend)
+        options = {"workers": args.workers}
+        if args.scales:
+            options["scales"] = tuple(float(s) for s in args.scales.split(","))
+        for name in ("overlap", "min_std", "min_confidence"):
+            if getattr(args, name) is not None:
+                options[name] = getattr(args, name)
+        n = count_directory(model, args.directory, args.out, args.regions_out, args.heatmaps, **options)
+        print(f"Counted {n} images — saved {args.out}")
+    elif args.command == "history":
+        store = HistoryStore(args.db)
+        if args.rebuild:
+            store.rebuild_aggregates()
+        counts = store.counts(args.by, args.since, args.until)
+        if args.out:
+            with open(args.out, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=["period", "species", "images", "mean_confidence"])
+                writer.writeheader()
+                writer.writerows(counts)
+        for row in counts:
+            print(f"{row['period']:<10} {row['species']:<24} {row['images']:>10,}  {row['mean_confidence']*100:5.1f}%")
+        totals = store.totals(args.since, args.until)
+        print(f"{totals['images']:,} images over {totals['days']} days")
+        store.close()
+    elif args.command == "sightings":
+        places = {}
+        if args.places:
+            with open(args.places, encoding="utf-8") as f:
+                named = json.load(f)
+            for name, box in named.items():
+                try:
+                    places[name] = _bbox(",".join(str(v) for v in box) if isinstance(box, list) else "")
+                except argparse.ArgumentTypeError as e:
+                    print(f"error: invalid box for {name}: {e}", file=sys.stderr)
+                    return 2
+        if args.bbox:
+            places["bbox"] = args.bbox
+        if not places:
+            print("error: sightings needs --bbox or --places", file=sys.stderr)
+            return 2
+        store = HistoryStore(args.db)
+        rows = []
+        for name, box in places.items():
+            counts = store.species_in_bbox(*box, start=args.since, end=args.until)
+            rows.extend({"place": name, "species": s, "sightings": n} for s, n in counts.items()
+                        if not args.species or s in args.species)
+        store.close()
+        if args.out:
+            with open(args.out, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=["place", "species", "sightings"])
+                writer.writeheader()
+                writer.writerows(rows)
+        for row in rows:
+            print(f"{row['place']:<20} {row['species']:<24} {row['sightings']:>8,}")
+    elif args.command == "calibrate-ood":
+        from jellyfish import ood
+        from jellyfish.embeddings import EmbeddingModel
+
+        model_file = args.model or inference.model_path("keras")
+        embedder = EmbeddingModel(inference.load_model(model_file, backend="keras"))
+        detector, n = ood.calibrate(embedder, args.directory, model_file, args.quantile,
+                                    batch_size=args.batch_size, workers=args.workers)
+        thresholds = ", ".join(f"{name} > {t:.3f}" for name, t in zip(ood.SCORES, detector.thresholds))
+        print(f"Calibrated on {n} images: {thresholds} (flag on {ood.MIN_VOTES} of 3) — saved "
+              f"{ood.calibration_path(model_file)}")
+    elif args.command == "retrain":
+        model_file = args.model or inference.model_path("keras")
+        model = inference.load_model(model_file, backend="keras")
+        cache = retrain.FeatureCache(args.feature_db)
+        try:
+            meta = retrain.retrain(
+                model, model_file, [*args.directories, args.corrections], args.models_dir, cache, args.corrections,
+                args.epochs, args.learning_rate, args.l2, args.batch_size, args.workers,
+                progress=lambda done, total: print(f"\rEmbeddings {done}/{total}", end="", file=sys.stderr))
+        finally:
+            cache.close()
+        print(file=sys.stderr)
+        print(f"v{meta['version']:03d} from {meta['parent']}: {meta['images']} images ({meta['corrections']} "
+              f"corrections, {meta['embedded']} newly embedded in {meta['embed_seconds']:.1f}s), head fit in "
+              f"{meta['train_seconds']:.1f}s — {'held-out' if meta['validation_images'] else 'training'} accuracy "
+              f"{meta['parent_accuracy'] * 100:.1f}% → {meta['accuracy'] * 100:.1f}% on "
+              f"{meta['validation_images'] or meta['images']} images")
+        print(f"Saved {meta['path']}")
+        if args.promote:
+            if meta["accuracy"] < meta["parent_accuracy"] and not args.force:
+                print("Not promoted: held-out accuracy dropped (use --force to promote anyway)", file=sys.stderr)
+                return 1
+            retrain.promote(meta["path"], args.models_dir)
+            print(f"Promoted v{meta['version']:03d}")
+    elif args.command == "promote":
+        found = {str(v["version"]): v for v in retrain.versions(args.models_dir)}
+        if args.version is None:
+            current = inference.current_version(args.models_dir)
+            print(f"{'*' if current is None else ' '} original  {inference.MODEL_PATH}")
+            for v in found.values():
+                marker = "*" if current and os.path.samefile(current, v["path"]) else " "
+                print(f"{marker} v{v['version']:03d}      {v['created'][:10]}  {v['images']:>6} images  "
+                      f"{v['corrections']:>5} corrections  held-out {v['parent_accuracy'] * 100:.1f}% → "
+                      f"{v['accuracy'] * 100:.1f}%  (from {v['parent']})")
+        elif args.version == "original":
+            retrain.promote(None, args.models_dir)
+            print(f"Promoted the original model ({inference.MODEL_PATH})")
+        elif args.version.lstrip("v").lstrip("0") in found:
+            v = found[args.version.lstrip("v").lstrip("0")]
+            retrain.promote(v["path"], args.models_dir)
+            print(f"Promoted v{v['version']:03d} ({v['path']})")
+        else:
+            print(f"error: no version {args.version} in {args.models_dir}", file=sys.stderr)
+            return 2
+    elif args.command in ("index-gallery", "similar"):
+        from jellyfish import embeddings
+        from jellyfish.pipeline import load_image
+
+        model_file = args.model or inference.model_path("keras")
+        embedder = embeddings.EmbeddingModel(inference.load_model(model_file, backend="keras"))
+        index = embeddings.GalleryIndex(args.index_dir or embeddings.index_dir_for(file_fingerprint(model_file)))
+        if args.command == "index-gallery":
+            added, removed = embeddings.build_gallery(embedder, index, args.directory or embeddings.GALLERY_DIR,
+                                                      batch_size=args.batch_size, workers=args.workers)
+            print(f"Index {index.index_dir}: {len(index)} images ({added} added, {removed} removed)")
+        else:
+            vectors, _ = embedder.embed(np.stack([load_image(path) for path in args.images]))
+            for path, matches in zip(args.images, index.search(vectors, args.k)):
+                print(path)
+                for ref, label, score in matches:
+                    species = CLASS_NAMES[label] if label is not None else "unlabelled"
+                    print(f"  {score:.3f}  {species:<24} {ref}")
+    return 0
@@ -0,0 +1,211 @@
+"""Near-duplicate detection with 64-bit difference hashes, confirmed by colour.
+
+``dhash`` shrinks an image to 9×8 grey pixels (JPEG draft mode keeps the decode
+to a fraction of full size) and records whether each pixel is brighter than its
+left neighbour. Frames from one burst land within a few bits of each other, so
+``HashIndex`` clusters hashes by Hamming distance and keeps one softmax row per
+cluster; later members reuse it instead of going through the model.
+
+Murky, low-texture underwater frames have weak gradients, so unrelated ones can
+hash only a few bits apart. A hash match therefore also has to pass a colour
+check: ``describe`` takes an 8×8 RGB thumbnail from the same decode, and two
+frames only merge when those thumbnails differ by at most ``max_color_diff`` on
+average, which keeps apart frames whose subject differs in colour or position.
+"""
+
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+SIGNATURE_SIZE = 8
+INITIAL_CAPACITY = 1024
+DEFAULT_MAX_DISTANCE = int(os.environ.get("JELLYFISH_DEDUP_DISTANCE", "2"))
+# Mean absolute difference of the 8×8 RGB thumbnails, on a 0-1 scale
+DEFAULT_MAX_COLOR_DIFF = float(os.environ.get("JELLYFISH_DEDUP_COLOR_DIFF", "0.03"))
+
+
+def describe(source, size=HASH_SIZE):
+    """``(dhash, signature)`` of a path, bytes, file object or decoded ``(h, w, 3)`` float array.
+
+    The signature is the flattened 8×8 RGB thumbnail as uint8.
+    """
+    if isinstance(source, np.ndarray):
+        img = Image.fromarray(np.uint8(np.clip(source, 0.0, 1.0) * 255))
+    else:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        with Image.open(source) as im:
+            im.draft("RGB", ((size + 1) * 8, size * 8))
+            img = im.convert("RGB")
+    small = np.asarray(img.convert("L").resize((size + 1, size), Image.BILINEAR), dtype=np.int16)
+    bits = np.packbits((small[:, 1:] > small[:, :-1]).ravel())
+    signature = np.asarray(img.resize((SIGNATURE_SIZE, SIGNATURE_SIZE), Image.BILINEAR), dtype=np.uint8).ravel()
+    return int.from_bytes(bits.tobytes(), "big"), signature
+
+
+def dhash(source, size=HASH_SIZE):
+    """Difference hash alone; see ``describe``."""
+    return describe(source, size)[0]
+
+
+def color_diff(signatures, signature):
+    """Mean absolute thumbnail difference (0-1) from ``signature`` to each row of ``signatures``."""
+    return np.abs(signatures.astype(np.int16) - signature.astype(np.int16)).mean(axis=1) / 255
+
+
+# Set bits in each byte value, so a 64-bit distance is eight table lookups
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def hamming(hashes, h):
+    """Bit distance from ``h`` to each entry of a uint64 array."""
+    diff = np.bitwise_xor(hashes, np.uint64(h))
+    return _POPCOUNT[diff.view(np.uint8)].reshape(len(hashes), 8).sum(axis=1, dtype=np.int16)
+
+
+def _chunks(n):
+    """``(shift, mask)`` of ``n`` near-equal bit ranges covering a 64-bit hash."""
+    bounds = [64 * i // n for i in range(n + 1)]
+    return [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(bounds, bounds[1:])]
+
+
+class HashIndex:
+    """Cluster representatives: hash, colour signature, softmax row (``None`` until classified) and a label.
+
+    With ``path`` set the index is loaded from and saved to an ``.npz`` file;
+    ``fingerprint`` (model plus scoring options) guards against reusing rows
+    from a different model.
+    """
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, path=None, fingerprint="",
+                 max_color_diff=DEFAULT_MAX_COLOR_DIFF):
+        self.max_distance = max_distance
+        self.max_color_diff = max_color_diff
+        self.path = path
+        self.fingerprint = fingerprint
+        # Preallocated and doubled when full; the first _size rows are in use
+        self._size = 0
+        # Multi-index hashing: a hash within max_distance bits of another equals it exactly on
+        # at least one of max_distance + 1 chunks, so find() only compares against clusters
+        # sharing a chunk. Chunks narrower than a byte would match nearly everything, so very
+        # loose thresholds fall back to scanning the whole index.
+        self._chunks = _chunks(max_distance + 1) if 64 // (max_distance + 1) >= 8 else []
+        self._buckets = [{} for _ in self._chunks]
+        self._hashes = np.empty(INITIAL_CAPACITY, dtype=np.uint64)
+        self._signatures = np.empty((INITIAL_CAPACITY, SIGNATURE_SIZE * SIGNATURE_SIZE * 3), dtype=np.uint8)
+        self._probs = []
+        self._labels = []
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self):
+        return self._size
+
+    def find(self, h, signature):
+        """Cluster id of the nearest representative within ``max_distance`` bits whose colours
+        also match, or ``None``."""
+        if not len(self):
+            return None
+        h = int(h)
+        if self._chunks:
+            candidates = set()
+            for (shift, mask), bucket in zip(self._chunks, self._buckets):
+                candidates.update(bucket.get((h >> shift) & mask, ()))
+            candidates = np.fromiter(sorted(candidates), dtype=np.intp, count=len(candidates))
+        else:
+            candidates = np.arange(self._size)
+        distances = hamming(self._hashes[candidates], h)
+        close = distances <= self.max_distance
+        candidates, distances = candidates[close], distances[close]
+        if not len(candidates):
+            return None
+        diffs = color_diff(self._signatures[candidates], signature)
+        matching = diffs <= self.max_color_diff
+        if not matching.any():
+            return None
+        candidates, distances, diffs = candidates[matching], distances[matching], diffs[matching]
+        return int(candidates[np.lexsort((diffs, distances))[0]])
+
+    def add(self, h, signature, probs=None, label=""):
+        if self._size == len(self._hashes):
+            self._grow(max(INITIAL_CAPACITY, 2 * self._size))
+        cluster = self._size
+        self._hashes[cluster] = np.uint64(h)
+        self._signatures[cluster] = signature
+        self._index(cluster, int(h))
+        self._probs.append(probs)
+        self._labels.append(label)
+        self._size += 1
+        return cluster
+
+    def _index(self, cluster, h):
+        for (shift, mask), bucket in zip(self._chunks, self._buckets):
+            bucket.setdefault((h >> shift) & mask, []).append(cluster)
+
+    def _grow(self, capacity):
+        hashes = np.empty(capacity, dtype=np.uint64)
+        signatures = np.empty((capacity, self._signatures.shape[1]), dtype=np.uint8)
+        hashes[:self._size] = self._hashes[:self._size]
+        signatures[:self._size] = self._signatures[:self._size]
+        self._hashes, self._signatures = hashes, signatures
+
+    def probs(self, cluster):
+        return self._probs[cluster]
+
+    def set_probs(self, cluster, probs):
+        self._probs[cluster] = probs
+
+    def label(self, cluster):
+        return self._labels[cluster]
+
+    # ── Persistence ──────────────────────────────────────────
+    def _load(self):
+        with np.load(self.path, allow_pickle=False) as data:
+            # Indexes saved before colour signatures were kept are rebuilt from scratch
+            if str(data["fingerprint"]) != self.fingerprint or "signatures" not in data:
+                return
+            self._hashes = data["hashes"].astype(np.uint64)
+            self._signatures = data["signatures"].astype(np.uint8)
+            self._size = len(self._hashes)
+            for cluster, h in enumerate(self._hashes.tolist()):
+                self._index(cluster, h)
+            self._probs = list(data["probs"])
+            self._labels = [str(s) for s in data["labels"]]
+
+    def save(self):
+        # Only classified clusters are worth keeping
+        keep = np.array([i for i, p in enumerate(self._probs) if p is not None], dtype=np.intp)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp.npz"
+        np.savez(
+            tmp,
+            fingerprint=np.array(self.fingerprint),
+            hashes=self._hashes[keep],
+            signatures=self._signatures[keep],
+            probs=np.array([self._probs[i] for i in keep], dtype=np.float32).reshape(len(keep), -1),
+            labels=np.array([self._labels[i] for i in keep], dtype=str),
+        )
+        os.replace(tmp, self.path)
+
+
+def cluster_hashes(keys, known=(), max_distance=DEFAULT_MAX_DISTANCE, max_color_diff=DEFAULT_MAX_COLOR_DIFF):
+    """Representative position for each ``describe`` key within ``[*known, *keys]``.
+
+    A key within ``max_distance`` bits and ``max_color_diff`` of an existing
+    representative joins its cluster; otherwise it becomes a representative
+    itself. ``known`` keys are all representatives; ``None`` entries are skipped.
+    """
+    index = HashIndex(max_distance, max_color_diff=max_color_diff)
+    for pos, key in enumerate(known):
+        if key is not None:
+            index.add(*key, label=pos)
+    reps = []
+    for i, (h, signature) in enumerate(keys):
+        cluster = index.find(h, signature)
+        if cluster is None:
+            cluster = index.add(h, signature, label=len(known) + i)
+        reps.append(index.label(cluster))
+    return reps
@@ -0,0 +1,216 @@
+"""Penultimate-layer embeddings and a similarity index over reference images.
+
+``EmbeddingModel`` wraps a Keras classifier so one forward pass returns both
+the feature vector feeding the final layer and the softmax. ``GalleryIndex``
+keeps L2-normalised embeddings as a float16 matrix in a flat file that is
+memory-mapped on open, with an append-only ``items.jsonl`` beside it; adding
+images appends rows instead of rewriting the index. Top-k cosine search is a
+chunked matrix product over the mapped rows, so a batch of queries costs one
+pass over the index however many queries it holds.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from jellyfish.inference import BATCH_SIZE
+from jellyfish.metrics import timer
+from jellyfish.pipeline import DEFAULT_WORKERS, PreprocessPipeline, image_label, iter_images
+
+GALLERY_DIR = os.environ.get("JELLYFISH_GALLERY_DIR", "samples")
+GALLERY_INDEX_DIR = os.environ.get("JELLYFISH_GALLERY_INDEX_DIR", os.path.join(".cache", "gallery"))
+# Indexes whose float32 form fits in this budget are searched from RAM; larger ones
+# are converted chunk by chunk from the float16 memory map on every search
+RESIDENT_BYTES = int(os.environ.get("JELLYFISH_GALLERY_RESIDENT_MB", "256")) * 1024 * 1024
+
+
+# ── Feature extraction ───────────────────────────────────────
+def penultimate_layer(model):
+    """The last layer before the classifier head whose output is a flat ``(batch, features)`` vector."""
+    for layer in reversed(model.layers[:-1]):
+        if len(layer.output.shape) == 2:
+            return layer
+    raise ValueError("Model has no flat feature layer before its output layer")
+
+
+class EmbeddingModel:
+    def __init__(self, model):
+        # A Deployment embeds with its primary model; TFLite graphs don't expose inner tensors
+        registry = getattr(model, "registry", None)
+        if registry is not None:
+            model = registry.get(model.primary)
+        if not hasattr(model, "layers"):
+            raise ValueError("Embeddings need the Keras model (the TFLite backend has no feature layer)")
+        import tensorflow as tf
+
+        self.classifier = model
+        self.feature_layer = penultimate_layer(model)
+        self.dim = int(self.feature_layer.output.shape[-1])
+        self._model = tf.keras.Model(model.inputs, [self.feature_layer.output, model.outputs[0]])
+        self.head = None  # (kernel, bias) of a final Dense layer fed directly by the features
+        weights = model.layers[-1].get_weights()
+        if len(weights) == 2 and weights[0].shape[0] == self.dim:
+            self.head = (np.asarray(weights[0], dtype=np.float32), np.asarray(weights[1], dtype=np.float32))
+
+    def embed(self, batch):
+        """``(embeddings, probs)`` for a preprocessed batch, from a single forward pass."""
+        with timer("model.embed"):
+            features, probs = self._model.predict_on_batch(batch)
+        return np.asarray(features, dtype=np.float32), np.asarray(probs)
+
+    def predict_on_batch(self, batch):
+        return self.embed(batch)[1]
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+# ── Index ────────────────────────────────────────────────────
+def index_dir_for(model_hash, root=GALLERY_INDEX_DIR):
+    # One index per model file; embeddings from different weights are not comparable
+    return os.path.join(root, model_hash[:16])
+
+
+class GalleryIndex:
+    def __init__(self, index_dir, resident_bytes=RESIDENT_BYTES):
+        self.index_dir = index_dir
+        self.resident_bytes = resident_bytes
+        self._matrix_path = os.path.join(index_dir, "embeddings.f16")
+        self._items_path = os.path.join(index_dir, "items.jsonl")
+        self.dim = None
+        self.items = []  # one {"path", "label", "stamp"} per matrix row
+        self._live = np.zeros(0, dtype=bool)  # False for rows replaced or removed later
+        self._matrix = None
+        self._resident = None
+        self._load()
+
+    def __len__(self):
+        return int(self._live.sum())
+
+    def _load(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        latest = {}
+        if os.path.exists(self._items_path):
+            with open(self._items_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn final line from an interrupted append
+                    if entry.get("removed"):
+                        latest.pop(entry["path"], None)
+                        continue
+                    self.dim = entry["dim"]
+                    latest[entry["path"]] = len(self.items)
+                    self.items.append(entry)
+        rows = os.path.getsize(self._matrix_path) // (2 * self.dim) if self.dim and os.path.exists(self._matrix_path) else 0
+        # Rows are written before their item lines, so the shorter of the two is complete
+        self.items = self.items[:rows]
+        self._live = np.zeros(len(self.items), dtype=bool)
+        self._live[[i for i in latest.values() if i < len(self.items)]] = True
+        self._map()
+
+    def _map(self):
+        self._matrix = (np.memmap(self._matrix_path, dtype=np.float16, mode="r", shape=(len(self.items), self.dim))
+                        if self.items else None)
+        self._resident = None
+
+    def _block(self, start, rows):
+        if self._resident is None and len(self.items) * self.dim * 4 <= self.resident_bytes:
+            self._resident = np.asarray(self._matrix, dtype=np.float32)
+        if self._resident is not None:
+            return self._resident[start:start + rows]
+        return np.asarray(self._matrix[start:start + rows], dtype=np.float32)
+
+    def stamps(self):
+        """``{path: stamp}`` for the live rows, to decide what an incremental update must add."""
+        return {self.items[i]["path"]: self.items[i]["stamp"] for i in np.flatnonzero(self._live)}
+
+    def add(self, paths, labels, stamps, embeddings):
+        embeddings = normalize(embeddings).astype(np.float16)
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Embedding size {embeddings.shape[1]} does not match the index ({self.dim})")
+        replaced = {self.items[i]["path"]: i for i in np.flatnonzero(self._live)}
+        with open(self._matrix_path, "ab") as f:
+            f.write(embeddings.tobytes())
+        with open(self._items_path, "a", encoding="utf-8") as f:
+            for path, label, stamp in zip(paths, labels, stamps):
+                entry = {"path": path, "label": label, "stamp": stamp, "dim": self.dim}
+                f.write(json.dumps(entry) + "\n")
+                self.items.append(entry)
+        live = np.ones(len(self.items), dtype=bool)
+        live[:len(self._live)] = self._live
+        for path in paths:
+            if path in replaced:
+                live[replaced[path]] = False
+        self._live = live
+        self._map()
+
+    def remove(self, paths):
+        paths = set(paths)
+        with open(self._items_path, "a", encoding="utf-8") as f:
+            for i in np.flatnonzero(self._live):
+                if self.items[i]["path"] in paths:
+                    f.write(json.dumps({"path": self.items[i]["path"], "removed": True}) + "\n")
+                    self._live[i] = False
+
+    def search(self, queries, k=5, chunk_rows=16384):
+        """Per query, up to ``k`` ``(path, label, cosine)`` tuples, most similar first."""
+        queries = normalize(np.atleast_2d(queries))
+        if self._matrix is None or not self._live.any():
+            return [[] for _ in queries]
+        n = len(self.items)
+        k = min(k, len(self))
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        with timer("gallery.search"):
+            for start in range(0, n, chunk_rows):
+                block = self._block(start, chunk_rows)
+                scores = queries @ block.T
+                scores[:, ~self._live[start:start + len(block)]] = -np.inf
+                take = min(k, scores.shape[1])
+                top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+                best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+                best_rows = np.concatenate([best_rows, top + start], axis=1)
+                if best_scores.shape[1] > k:
+                    keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                    best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                    best_rows = np.take_along_axis(best_rows, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        results = []
+        for rows, scores in zip(np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)):
+            results.append([(self.items[r]["path"], self.items[r]["label"], float(s))
+                            for r, s in zip(rows, scores) if np.isfinite(s)])
+        return results
+
+
+def build_gallery(embedder, index, root=GALLERY_DIR, batch_size=BATCH_SIZE, workers=DEFAULT_WORKERS):
+    """Bring ``index`` up to date with the images under ``root``; returns ``(added, removed)``.
+
+    Only new or modified files (by mtime and size) are embedded.
+    """
+    known = index.stamps()
+    present, pending = set(), []
+    for rel, path in iter_images(root):
+        st = os.stat(path)
+        stamp = f"{st.st_mtime_ns}-{st.st_size}"
+        present.add(path)
+        if known.get(path) != stamp:
+            pending.append((path, image_label(rel), stamp))
+    removed = [p for p in known if p not in present]
+    if removed:
+        index.remove(removed)
+    pipeline = PreprocessPipeline(workers=workers, batch_size=batch_size)
+    added = 0
+    for batch in pipeline.batches(pending, source=lambda item: item[0]):
+        if batch.keys:
+            embeddings, _ = embedder.embed(batch.array)
+            index.add(*zip(*batch.keys), embeddings)
+            added += len(batch.keys)
+    return added, len(removed)
@@ -0,0 +1,162 @@
+"""Evaluate the loaded model on a labelled folder: ``python -m jellyfish evaluate DIR``.
+
+Images stream through the parallel preprocessing pipeline one batch at a time;
+only running totals (confusion matrix and calibration bins) are kept, so memory
+does not grow with dataset size. Results are saved as a JSON artifact named
+after the model file's hash, which the Model Performance page loads.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+from jellyfish.cache import file_fingerprint
+from jellyfish.inference import BATCH_SIZE, predict_batch
+from jellyfish.pipeline import DEFAULT_WORKERS, PreprocessPipeline, labelled_images
+from jellyfish.species import CLASS_NAMES
+
+ARTIFACTS_DIR = os.environ.get("JELLYFISH_EVAL_DIR", "eval_artifacts")
+CALIBRATION_BINS = 10
+
+
+class EvaluationAccumulator:
+    """Running confusion matrix and reliability-diagram bins, updated a batch at a time."""
+
+    def __init__(self, num_classes=len(CLASS_NAMES), bins=CALIBRATION_BINS):
+        self.num_classes = num_classes
+        self.bins = bins
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.bin_count = np.zeros(bins, dtype=np.int64)
+        self.bin_confidence = np.zeros(bins, dtype=np.float64)
+        self.bin_correct = np.zeros(bins, dtype=np.int64)
+        self.nll_sum = 0.0
+        self.brier_sum = 0.0
+
+    def update(self, labels, probs):
+        labels = np.asarray(labels, dtype=np.int64)
+        probs = np.asarray(probs, dtype=np.float64)
+        preds = probs.argmax(axis=1)
+        k = self.num_classes
+        self.confusion += np.bincount(labels * k + preds, minlength=k * k).reshape(k, k)
+
+        confidence = probs.max(axis=1)
+        correct = (preds == labels).astype(np.int64)
+        bin_idx = np.minimum((confidence * self.bins).astype(np.int64), self.bins - 1)
+        self.bin_count += np.bincount(bin_idx, minlength=self.bins)
+        self.bin_confidence += np.bincount(bin_idx, weights=confidence, minlength=self.bins)
+        self.bin_correct += np.bincount(bin_idx, weights=correct, minlength=self.bins).astype(np.int64)
+
+        true_prob = probs[np.arange(len(labels)), labels]
+        self.nll_sum += float(-np.log(np.clip(true_prob, 1e-12, 1.0)).sum())
+        onehot = np.eye(k)[labels]
+        self.brier_sum += float(((probs - onehot) ** 2).sum(axis=1).sum())
+
+    def result(self):
+        n = int(self.confusion.sum())
+        per_class = per_class_metrics(self.confusion)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            bin_accuracy = np.where(self.bin_count > 0, self.bin_correct / self.bin_count, 0.0)
+            bin_confidence = np.where(self.bin_count > 0, self.bin_confidence / self.bin_count, 0.0)
+        ece = float((self.bin_count * np.abs(bin_accuracy - bin_confidence)).sum() / n) if n else 0.0
+        return {
+            "images": n,
+            "accuracy": float(np.trace(self.confusion) / n) if n else 0.0,
+            "confusion_matrix": self.confusion.tolist(),
+            "per_class": per_class,
+            "macro_avg": {
+                metric: float(np.mean([c[metric] for c in per_class])) for metric in ("precision", "recall", "f1")
+            } | {"support": n},
+            "calibration": {
+                "ece": ece,
+                "nll": self.nll_sum / n if n else 0.0,
+                "brier": self.brier_sum / n if n else 0.0,
+                "bin_edges": np.linspace(0, 1, self.bins + 1).tolist(),
+                "bin_count": self.bin_count.tolist(),
+                "bin_accuracy": bin_accuracy.tolist(),
+                "bin_confidence": bin_confidence.tolist(),
+            },
+        }
+
+
+def per_class_metrics(confusion):
+    """Precision/recall/F1/support for every class from a confusion matrix (rows = actual)."""
+    confusion = np.asarray(confusion, dtype=np.float64)
+    tp = np.diag(confusion)
+    predicted = confusion.sum(axis=0)
+    support = confusion.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        precision = np.where(predicted > 0, tp / predicted, 0.0)
+        recall = np.where(support > 0, tp / support, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return [
+        {"class": name, "precision": float(p), "recall": float(r), "f1": float(f), "support": int(s)}
+        for name, p, r, f, s in zip(CLASS_NAMES, precision, recall, f1, support)
+    ]
+
+
+def evaluate(model, labelled_dir, batch_size=BATCH_SIZE, workers=DEFAULT_WORKERS, progress=None):
+    acc = EvaluationAccumulator()
+    pipeline = PreprocessPipeline(workers=workers, batch_size=batch_size)
+    skipped = 0
+    start = time.perf_counter()
+    for batch in pipeline.batches(labelled_images(labelled_dir), source=lambda item: item[0]):
+        skipped += len(batch.errors)
+        if batch.keys:
+            acc.update([label for _, label in batch.keys], predict_batch(model, batch.array))
+        if progress:
+            progress(int(acc.confusion.sum()), skipped)
+    result = acc.result()
+    if result["images"] == 0:
+        raise ValueError(f"No labelled images found in {labelled_dir}")
+    result.update({
+        "dataset": os.path.abspath(labelled_dir),
+        "unreadable_images": skipped,
+        "seconds": time.perf_counter() - start,
+    })
+    return result
+
+
+# ── Artifacts ────────────────────────────────────────────────
+def load_history(path):
+    """Training curves from a Keras ``History.history`` JSON dump.
+
+    Accepts ``accuracy``/``val_accuracy``/``loss``/``val_loss`` lists and an optional
+    ``phase2_start`` epoch marking where fine-tuning began.
+    """
+    with open(path, encoding="utf-8") as f:
+        history = json.load(f)
+    keys = ("accuracy", "val_accuracy", "loss", "val_loss")
+    missing = [k for k in keys if k not in history]
+    if missing:
+        raise ValueError(f"{path} is missing {', '.join(missing)}")
+    return {k: history[k] for k in (*keys, "phase2_start") if k in history}
+
+
+def artifact_path(model_hash, artifacts_dir=ARTIFACTS_DIR):
+    return os.path.join(artifacts_dir, f"{model_hash}.json")
+
+
+def save_artifact(result, model_file, artifacts_dir=ARTIFACTS_DIR, history=None):
+    model_hash = file_fingerprint(model_file)
+    artifact = dict(result, model=os.path.basename(model_file), model_hash=model_hash,
+                    created=time.strftime("%Y-%m-%dT%H:%M:%S%z"))
+    if history is not None:
+        artifact["history"] = history
+    os.makedirs(artifacts_dir, exist_ok=True)
+    path = artifact_path(model_hash, artifacts_dir)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def load_artifact(model_hash, artifacts_dir=ARTIFACTS_DIR):
+    """The saved evaluation for ``model_hash``, or ``None`` if it has not been evaluated."""
+    try:
+        with open(artifact_path(model_hash, artifacts_dir), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
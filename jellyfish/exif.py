@@ -0,0 +1,77 @@
+"""Capture time and GPS position from EXIF headers, read alongside inference.
+
+``Image.open`` parses only the header (a JPEG's APP1 segment holds EXIF), never
+the pixels, and ``head`` trims an in-memory JPEG to its first 256 KB, so a
+lookup costs a few kilobytes of parsing per image. ``ExifReader`` runs those
+lookups on a small thread pool of its own, so they overlap the decode and
+predict work of the preprocessing pipeline.
+"""
+
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+HEADER_BYTES = 256 * 1024  # EXIF must fit in one 64 KB APP segment near the start of a JPEG
+
+_EXIF_IFD = 0x8769
+_GPS_IFD = 0x8825
+_DATETIME = 306
+_DATETIME_ORIGINAL = 36867
+# GPS IFD tags
+_LAT_REF, _LAT, _LON_REF, _LON = 1, 2, 3, 4
+
+EMPTY = {"taken": None, "lat": None, "lon": None}
+
+
+def head(buffer):
+    """Just the header bytes of an in-memory JPEG; other formats may keep EXIF anywhere, so stay whole."""
+    view = memoryview(buffer)
+    return bytes(view[:HEADER_BYTES]) if bytes(view[:2]) == b"\xff\xd8" else bytes(view)
+
+
+def _degrees(dms, ref):
+    d, m, s = (float(v) for v in dms)
+    value = d + m / 60 + s / 3600
+    return -value if ref in ("S", "W") else value
+
+
+def read_exif(source):
+    """``{"taken", "lat", "lon"}`` from a path, bytes or file object; fields are None when absent."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    try:
+        with Image.open(source) as img:
+            if img.format == "PNG" and "exif" not in img.info:
+                return dict(EMPTY)  # an eXIf chunk after the pixel data is only reached by decoding
+            exif = img.getexif()
+    except Exception:
+        return dict(EMPTY)
+    meta = dict(EMPTY)
+    taken = exif.get_ifd(_EXIF_IFD).get(_DATETIME_ORIGINAL) or exif.get(_DATETIME)
+    if isinstance(taken, str) and len(taken) >= 19:
+        # "2024:07:14 09:31:02" → ISO 8601
+        meta["taken"] = taken[:10].replace(":", "-") + "T" + taken[11:19]
+    gps = exif.get_ifd(_GPS_IFD)
+    try:
+        if _LAT in gps and _LON in gps:
+            lat = _degrees(gps[_LAT], gps.get(_LAT_REF, "N"))
+            lon = _degrees(gps[_LON], gps.get(_LON_REF, "E"))
+            if -90 <= lat <= 90 and -180 <= lon <= 180:
+                meta["lat"], meta["lon"] = round(lat, 6), round(lon, 6)
+    except (TypeError, ValueError, ZeroDivisionError):
+        pass  # malformed GPS block: keep the timestamp, drop the position
+    return meta
+
+
+class ExifReader:
+    """Thread pool for header reads; ``submit`` returns futures to collect after inference."""
+
+    def __init__(self, workers=4):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jellyfish-exif")
+
+    def submit(self, sources):
+        return [self._pool.submit(read_exif, source) for source in sources]
+
+    def close(self):
+        self._pool.shutdown(wait=True)
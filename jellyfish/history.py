@@ -0,0 +1,326 @@
+"""Persistent history of classified images with incrementally maintained aggregates.
+
+One SQLite file (``JELLYFISH_HISTORY_DB``) holds a ``results`` table with one
+row per image: content key, filename, top class, confidence, Status, the full
+softmax as a float32 blob, timestamp and model version. Two small tables hold
+per-day aggregates: counts and confidence sums per species and Status, and a
+5%-bucket confidence histogram. Rows are buffered and written in batches, and
+each batch upserts its aggregate deltas in the same transaction, so the
+History page reads a few rows per day however many results are stored, and
+monthly statistics roll up days rather than scanning results.
+
+Results with an EXIF GPS position are also sightings, bucketed into a fixed
+latitude/longitude grid (``JELLYFISH_GRID_DEGREES``, 0.01° ≈ 1 km, fixed per
+database when it is created). ``cell_species`` counts sightings per cell, day,
+species and Status, so a bounding-box query sums whole cells from that table and
+only reads individual sightings in the cells the box edges cut through.
+"""
+
+import datetime
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from jellyfish.species import CLASS_NAMES
+
+HISTORY_DB = os.environ.get("JELLYFISH_HISTORY_DB", os.path.join(".cache", "history.sqlite"))
+BATCH_ROWS = 256
+MAX_DELAY = 5.0  # seconds a buffered row may wait for its batch
+CONFIDENCE_BUCKETS = 20
+GRID_DEGREES = float(os.environ.get("JELLYFISH_GRID_DEGREES", "0.01"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE,
+    filename TEXT NOT NULL,
+    day TEXT NOT NULL,
+    ts REAL NOT NULL,
+    species INTEGER NOT NULL,
+    confidence REAL NOT NULL,
+    status TEXT NOT NULL,
+    model TEXT NOT NULL,
+    source TEXT NOT NULL,
+    probs BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_day ON results(day);
+CREATE TABLE IF NOT EXISTS daily_species (
+    day TEXT NOT NULL,
+    species INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    confidence_sum REAL NOT NULL,
+    PRIMARY KEY (day, species, status)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily_confidence (
+    day TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (day, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sightings (
+    id INTEGER PRIMARY KEY,
+    key TEXT,
+    filename TEXT NOT NULL,
+    day TEXT NOT NULL,
+    taken TEXT,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    cell_row INTEGER NOT NULL,
+    cell_col INTEGER NOT NULL,
+    species INTEGER NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sightings_row ON sightings(cell_row, cell_col, day);
+CREATE INDEX IF NOT EXISTS sightings_col ON sightings(cell_col, cell_row, day);
+CREATE TABLE IF NOT EXISTS cell_species (
+    cell_row INTEGER NOT NULL,
+    cell_col INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    species INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (cell_row, cell_col, day, species, status)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _bucket(confidence):
+    return min(CONFIDENCE_BUCKETS - 1, int(confidence * CONFIDENCE_BUCKETS))
+
+
+def _in(values):
+    return f"IN ({','.join('?' * len(values))})"
+
+
+class HistoryStore:
+    """Append-only results plus aggregates; safe to share between threads and Streamlit sessions."""
+
+    def __init__(self, path=HISTORY_DB, batch_rows=BATCH_ROWS, max_delay=MAX_DELAY, grid_degrees=GRID_DEGREES):
+        self.path = path
+        self.batch_rows = batch_rows
+        self.max_delay = max_delay
+        self._pending = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        # Cells already stored were cut with the grid the database was created with
+        self._db.execute("INSERT OR IGNORE INTO meta VALUES ('grid_degrees', ?)", (repr(grid_degrees),))
+        self._db.commit()
+        self.grid = float(self._db.execute("SELECT value FROM meta WHERE name = 'grid_degrees'").fetchone()[0])
+
+    def cell(self, lat, lon):
+        """``(row, col)`` of the grid cell holding a position."""
+        return math.floor((lat + 90) / self.grid), math.floor((lon + 180) / self.grid)
+
+    # ── Writes ───────────────────────────────────────────────
+    def add(self, records, model_version, source="app", ts=None):
+        """Buffer ``build_result`` records; written once ``batch_rows`` are pending or the oldest is stale."""
+        ts = time.time() if ts is None else ts
+        day = datetime.date.fromtimestamp(ts).isoformat()
+        rows = [(r["_key"], r["Filename"], day, ts, CLASS_NAMES.index(r["_top_class"]), float(r["_confidence_raw"]),
+                 r["Status"], model_version, source, np.asarray(r["_preds"], dtype=np.float32).tobytes(),
+                 r.get("_exif"))
+                for r in records]
+        with self._lock:
+            self._pending.extend(rows)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if len(self._pending) >= self.batch_rows or time.monotonic() - self._oldest >= self.max_delay:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        rows, self._pending, self._oldest = self._pending, [], None
+        # The same image classified by the same model again is not a new sighting
+        unique, keys = [], set()
+        for row in rows:
+            if row[0] is None or row[0] not in keys:
+                unique.append(row)
+                keys.add(row[0])
+        rows = unique
+        keys = [k for k in keys if k is not None]
+        known = set()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            known.update(k for (k,) in self._db.execute(
+                f"SELECT key FROM results WHERE key {_in(chunk)}", chunk))
+        rows = [row for row in rows if row[0] not in known]
+        if not rows:
+            return
+        species = Counter()
+        confidence_sum = Counter()
+        buckets = Counter()
+        sightings = []
+        cells = Counter()
+        for key, filename, day, _, top, confidence, status, *_, meta in rows:
+            species[day, top, status] += 1
+            confidence_sum[day, top, status] += confidence
+            buckets[day, _bucket(confidence)] += 1
+            if meta and meta.get("lat") is not None:
+                # A sighting belongs to the day the photo was taken, when the camera recorded it
+                seen = (meta.get("taken") or day)[:10]
+                row, col = self.cell(meta["lat"], meta["lon"])
+                sightings.append((key, filename, seen, meta.get("taken"), meta["lat"], meta["lon"], row, col, top,
+                                  status))
+                cells[row, col, seen, top, status] += 1
+        with self._db:
+            self._db.executemany("INSERT INTO results (key, filename, day, ts, species, confidence, status, model,"
+                                 " source, probs) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [row[:10] for row in rows])
+            self._db.executemany(
+                "INSERT INTO daily_species VALUES (?, ?, ?, ?, ?) ON CONFLICT (day, species, status)"
+                " DO UPDATE SET n = n + excluded.n, confidence_sum = confidence_sum + excluded.confidence_sum",
+                [(*k, n, confidence_sum[k]) for k, n in species.items()])
+            self._db.executemany(
+                "INSERT INTO daily_confidence VALUES (?, ?, ?) ON CONFLICT (day, bucket)"
+                " DO UPDATE SET n = n + excluded.n",
+                [(*k, n) for k, n in buckets.items()])
+            self._db.executemany("INSERT INTO sightings (key, filename, day, taken, lat, lon, cell_row, cell_col,"
+                                 " species, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", sightings)
+            self._db.executemany(
+                "INSERT INTO cell_species VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (cell_row, cell_col, day, species,"
+                " status) DO UPDATE SET n = n + excluded.n",
+                [(*k, n) for k, n in cells.items()])
+
+    def rebuild_aggregates(self):
+        """Recompute the aggregate tables from ``results`` and ``sightings`` (after manual edits or an import)."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM daily_species")
+            self._db.execute("DELETE FROM daily_confidence")
+            self._db.execute("DELETE FROM cell_species")
+            self._db.execute("INSERT INTO cell_species SELECT cell_row, cell_col, day, species, status, COUNT(*)"
+                             " FROM sightings GROUP BY cell_row, cell_col, day, species, status")
+            self._db.execute("INSERT INTO daily_species SELECT day, species, status, COUNT(*), SUM(confidence)"
+                             " FROM results GROUP BY day, species, status")
+            self._db.execute(f"INSERT INTO daily_confidence SELECT day,"
+                             f" MIN({CONFIDENCE_BUCKETS - 1}, CAST(confidence * {CONFIDENCE_BUCKETS} AS INTEGER)),"
+                             f" COUNT(*) FROM results GROUP BY 1, 2")
+
+    # ── Reads (aggregates only) ──────────────────────────────
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    @staticmethod
+    def _range(start=None, end=None, column="day"):
+        clauses, args = [], []
+        if start:
+            clauses.append(f"{column} >= ?")
+            args.append(str(start))
+        if end:
+            clauses.append(f"{column} <= ?")
+            args.append(str(end))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), args
+
+    def totals(self, start=None, end=None):
+        """``{"images", "days", "first_day", "last_day"}`` over the aggregate table."""
+        where, args = self._range(start, end)
+        images, days, first, last = self._query(
+            f"SELECT COALESCE(SUM(n), 0), COUNT(DISTINCT day), MIN(day), MAX(day) FROM daily_species{where}", args)[0]
+        return {"images": images, "days": days, "first_day": first, "last_day": last}
+
+    def counts(self, period="day", start=None, end=None, statuses=None):
+        """``[{period, species, images, mean_confidence}]`` grouped by ``"day"``, ``"month"`` or ``"year"``."""
+        length = {"day": 10, "month": 7, "year": 4}[period]
+        where, args = self._range(start, end)
+        if statuses:
+            where += (" AND " if where else " WHERE ") + f"status {_in(statuses)}"
+            args += list(statuses)
+        rows = self._query(f"SELECT substr(day, 1, {length}) AS p, species, SUM(n), SUM(confidence_sum)"
+                           f" FROM daily_species{where} GROUP BY p, species ORDER BY p, species", args)
+        return [{"period": p, "species": CLASS_NAMES[s], "images": n, "mean_confidence": total / n}
+                for p, s, n, total in rows]
+
+    def status_counts(self, start=None, end=None):
+        where, args = self._range(start, end)
+        return dict(self._query(f"SELECT status, SUM(n) FROM daily_species{where} GROUP BY status", args))
+
+    def confidence_histogram(self, start=None, end=None):
+        """Image counts per 5% confidence bucket, lowest bucket first."""
+        where, args = self._range(start, end)
+        hist = [0] * CONFIDENCE_BUCKETS
+        for bucket, n in self._query(f"SELECT bucket, SUM(n) FROM daily_confidence{where} GROUP BY bucket", args):
+            hist[bucket] = n
+        return hist
+
+    def recent(self, limit=50):
+        """The newest ``limit`` results (read backwards along the primary key)."""
+        rows = self._query("SELECT ts, filename, species, confidence, status, model, source FROM results"
+                           " ORDER BY id DESC LIMIT ?", (limit,))
+        return [{"ts": ts, "filename": f, "species": CLASS_NAMES[s], "confidence": c, "status": st,
+                 "model": m, "source": src} for ts, f, s, c, st, m, src in rows]
+
+    # ── Sightings ────────────────────────────────────────────
+    def species_in_bbox(self, south, west, north, east, start=None, end=None, statuses=None):
+        """``{species: sightings}`` inside a box (``west > east`` crosses the antimeridian) and date range.
+
+        Cells wholly inside the box are summed from ``cell_species``; only the ring of cells the
+        edges cut through is read sighting by sighting, against the exact coordinates.
+        """
+        if west > east:
+            a = self.species_in_bbox(south, west, north, 180.0, start, end, statuses)
+            b = self.species_in_bbox(south, -180.0, north, east, start, end, statuses)
+            return {s: a.get(s, 0) + b.get(s, 0) for s in sorted(set(a) | set(b), key=CLASS_NAMES.index)}
+        (r0, c0), (r1, c1) = self.cell(south, west), self.cell(north, east)
+        where, args = self._range(start, end)
+        where = where.replace(" WHERE ", " AND ")
+        if statuses:
+            where += f" AND status {_in(statuses)}"
+            args += list(statuses)
+        counts = Counter()
+        inner_rows = list(range(r0 + 1, r1))
+        if inner_rows and c0 + 1 <= c1 - 1:
+            for chunk in range(0, len(inner_rows), 500):
+                part = inner_rows[chunk:chunk + 500]
+                # An IN list lets the primary key seek each row's column span instead of scanning the band
+                counts.update(dict(self._query(
+                    f"SELECT species, SUM(n) FROM cell_species WHERE cell_row {_in(part)}"
+                    f" AND cell_col BETWEEN ? AND ?{where} GROUP BY species", (*part, c0 + 1, c1 - 1, *args))))
+        exact = f" AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?{where} GROUP BY species"
+        edge_rows = sorted({r0, r1})
+        counts.update(dict(self._query(
+            f"SELECT species, COUNT(*) FROM sightings WHERE cell_row {_in(edge_rows)} AND cell_col BETWEEN ? AND ?"
+            + exact, (*edge_rows, c0, c1, south, north, west, east, *args))))
+        if inner_rows:
+            edge_cols = sorted({c0, c1})
+            counts.update(dict(self._query(
+                f"SELECT species, COUNT(*) FROM sightings WHERE cell_col {_in(edge_cols)} AND cell_row BETWEEN ? AND ?"
+                + exact, (*edge_cols, r0 + 1, r1 - 1, south, north, west, east, *args))))
+        return {CLASS_NAMES[s]: n for s, n in sorted(counts.items())}
+
+    def sighting_cells(self, start=None, end=None, species=None, statuses=None):
+        """``[{lat, lon, species, sightings}]`` per occupied grid cell (its centre), for maps."""
+        where, args = self._range(start, end)
+        if species:
+            where += (" AND " if where else " WHERE ") + f"species {_in(species)}"
+            args += [CLASS_NAMES.index(s) for s in species]
+        if statuses:
+            where += (" AND " if where else " WHERE ") + f"status {_in(statuses)}"
+            args += list(statuses)
+        rows = self._query(f"SELECT cell_row, cell_col, species, SUM(n) FROM cell_species{where}"
+                           f" GROUP BY cell_row, cell_col, species", args)
+        return [{"lat": round((r + 0.5) * self.grid - 90, 6), "lon": round((c + 0.5) * self.grid - 180, 6),
+                 "species": CLASS_NAMES[s], "sightings": n} for r, c, s, n in rows]
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._db.close()
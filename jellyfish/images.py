@@ -0,0 +1,134 @@
+"""Resized image variants for display, built once per image and served as bytes.
+
+Each source image is decoded once (with JPEG draft mode) into a pyramid of
+WebP variants, largest first, each downscaled from the one above. Variants are
+keyed by content hash and kept in a bounded memory LRU and under
+``JELLYFISH_IMAGE_CACHE_DIR``, so later views never re-decode the original.
+"""
+
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from jellyfish.metrics import timer
+from jellyfish.pipeline import IMAGE_EXTENSIONS
+
+VARIANT_WIDTHS = (160, 320, 640)
+PIXEL_RATIO = 2  # serve 2x the CSS width so images stay sharp on high-DPI screens
+IMAGE_CACHE_DIR = os.environ.get("JELLYFISH_IMAGE_CACHE_DIR", os.path.join(".cache", "images"))
+
+
+def pick_width(display_px, widths=VARIANT_WIDTHS, pixel_ratio=PIXEL_RATIO):
+    """Smallest variant that covers ``display_px`` CSS pixels, or the largest one."""
+    needed = display_px * pixel_ratio
+    for w in sorted(widths):
+        if w >= needed:
+            return w
+    return max(widths)
+
+
+def build_pyramid(source, widths=VARIANT_WIDTHS, quality=80):
+    """``{width: webp bytes}`` from bytes, a path or a file object; never upscales."""
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    with timer("images.build_pyramid"), Image.open(source) as img:
+        largest = max(widths)
+        img.draft("RGB", (largest, largest))
+        img = img.convert("RGB")
+        variants = {}
+        for w in sorted(widths, reverse=True):
+            if img.width > w:
+                img = img.resize((w, max(1, round(img.height * w / img.width))), Image.LANCZOS)
+            buf = io.BytesIO()
+            img.save(buf, format="WEBP", quality=quality, method=4)
+            variants[w] = buf.getvalue()
+        return variants
+
+
+class ImageStore:
+    def __init__(self, disk_dir=IMAGE_CACHE_DIR, max_entries=512, widths=VARIANT_WIDTHS):
+        self.disk_dir = disk_dir
+        self.max_entries = max_entries
+        self.widths = tuple(sorted(widths))
+        self._items = OrderedDict()  # content hash -> {width: bytes}
+        self._file_hashes = {}  # (path, mtime, size) -> content hash
+        self._lock = threading.Lock()
+
+    # ── Keys ─────────────────────────────────────────────────
+    def file_key(self, path):
+        """Content hash of a file, re-read only when its mtime or size changes."""
+        st = os.stat(path)
+        stamp = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            key = self._file_hashes.get(stamp)
+        if key is None:
+            with open(path, "rb") as f:
+                key = hashlib.sha256(f.read()).hexdigest()
+            with self._lock:
+                self._file_hashes[stamp] = key
+        return key
+
+    # ── Lookup ───────────────────────────────────────────────
+    def variant(self, source, width, key=None):
+        """WebP bytes of ``source`` (bytes or path) at the nearest variant ``>= width``."""
+        if key is None:
+            key = self.file_key(source) if isinstance(source, (str, os.PathLike)) else hashlib.sha256(source).hexdigest()
+        width = next((w for w in self.widths if w >= width), self.widths[-1])
+        return self._variants(key, source)[width]
+
+    def _variants(self, key, source):
+        with self._lock:
+            variants = self._items.get(key)
+            if variants is not None:
+                self._items.move_to_end(key)
+                return variants
+        variants = self._load_disk(key)
+        if variants is None:
+            variants = build_pyramid(source, self.widths)
+            self._save_disk(key, variants)
+        with self._lock:
+            self._items[key] = variants
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return variants
+
+    def _disk_path(self, key, width):
+        return os.path.join(self.disk_dir, key[:2], f"{key}-{width}.webp")
+
+    def _load_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            variants = {}
+            for w in self.widths:
+                with open(self._disk_path(key, w), "rb") as f:
+                    variants[w] = f.read()
+            return variants
+        except OSError:
+            return None
+
+    def _save_disk(self, key, variants):
+        if not self.disk_dir:
+            return
+        for w, data in variants.items():
+            path = self._disk_path(key, w)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+
+def reference_images(species_key, root="samples"):
+    """``samples/<key>.jpg`` followed by any images in ``samples/<key>/``."""
+    paths = [os.path.join(root, f"{species_key}{ext}") for ext in IMAGE_EXTENSIONS]
+    paths = [p for p in paths if os.path.exists(p)]
+    folder = os.path.join(root, species_key)
+    if os.path.isdir(folder):
+        paths += [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+                  if name.lower().endswith(IMAGE_EXTENSIONS)]
+    return paths
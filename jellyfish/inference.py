@@ -0,0 +1,200 @@
+"""Model loading, preprocessing and batched prediction, independent of the UI.
+
+TensorFlow is imported inside ``load_model`` rather than at module level, so
+importing this module (and everything built on it) stays cheap until a model
+is actually needed.
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from jellyfish.metrics import timer
+
+MODEL_PATH = "best_jellyfish_model.keras"
+IMAGE_SIZE = (224, 224)
+BATCH_SIZE = 32
+
+# Backend selection — "keras" (default) or "tflite"; see jellyfish.backends
+BACKEND = os.environ.get("JELLYFISH_BACKEND", "keras")
+TFLITE_MODEL_PATH = os.environ.get("JELLYFISH_TFLITE_MODEL", "best_jellyfish_model.tflite")
+TFLITE_THREADS = int(os.environ.get("JELLYFISH_TFLITE_THREADS", os.cpu_count() or 1))
+
+# Retrained model versions (see jellyfish.retrain); MODELS_DIR/current names the promoted one
+MODELS_DIR = os.environ.get("JELLYFISH_MODELS_DIR", "models")
+CURRENT_POINTER = "current"
+
+
+# ── Model loading ────────────────────────────────────────────
+def resolve_backend(path=None, backend=None):
+    if backend:
+        return backend
+    if path and path.endswith(".tflite"):
+        return "tflite"
+    return BACKEND
+
+
+def current_version(models_dir=MODELS_DIR):
+    """The promoted retrained ``.keras`` file, or ``None`` when the original model is in use."""
+    try:
+        with open(os.path.join(models_dir, CURRENT_POINTER), encoding="utf-8") as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    path = os.path.join(models_dir, name)
+    return path if name and os.path.exists(path) else None
+
+
+def model_path(backend=None):
+    """The file the configured backend loads; also what the prediction cache fingerprints."""
+    if resolve_backend(backend=backend) == "tflite":
+        return TFLITE_MODEL_PATH
+    return current_version() or MODEL_PATH
+
+
+def load_model(path=None, backend=None, num_threads=TFLITE_THREADS):
+    """Load the classifier. Every backend exposes ``predict_on_batch(batch) -> softmax rows``."""
+    backend = resolve_backend(path, backend)
+    path = path or model_path(backend)
+    if backend == "keras":
+        with timer("import.tensorflow"):
+            import tensorflow as tf
+        with timer("load_model"):
+            return tf.keras.models.load_model(path)
+    if backend == "tflite":
+        with timer("import.tensorflow"):
+            from jellyfish.backends import TFLiteModel
+        with timer("load_model"):
+            return TFLiteModel(path, num_threads=num_threads)
+    raise ValueError(f"Unknown inference backend {backend!r} (expected 'keras' or 'tflite')")
+
+
+def warm_up(model, batch_sizes=(1,)):
+    """Run dummy batches so graph tracing/allocation happens before the first real request."""
+    for n in batch_sizes:
+        predict_batch(model, np.zeros((n, *IMAGE_SIZE, 3), dtype=np.float32))
+
+
+class ModelLoader:
+    """Loads and warms up the model on a background thread.
+
+    ``state`` moves from ``"idle"`` to ``"loading"`` to ``"ready"`` (or ``"failed"``,
+    with the exception in ``error``). ``wait`` starts the load if needed and
+    blocks until it finishes. ``load`` replaces ``load_model`` as the factory,
+    e.g. to build a multi-model ``jellyfish.registry.Deployment``.
+
+    ``swap`` hot-swaps a ready loader to another model file: the new model loads
+    and warms up on its own thread while the current one keeps answering, then
+    ``wait`` starts returning it. ``model_file`` always names the file behind the
+    model ``wait`` returns (``None`` with a custom ``load``).
+    """
+
+    def __init__(self, path=None, backend=None, warm_up_batch_sizes=(1,), load=None):
+        self.path = path
+        self.backend = backend
+        self.load = load
+        self.warm_up_batch_sizes = warm_up_batch_sizes
+        self.state = "idle"
+        self.error = None
+        self.load_seconds = None
+        self.model_file = None
+        self.swap_error = None
+        self.swaps = 0
+        self._model = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.state != "idle":
+                return self
+            self.state = "loading"
+        threading.Thread(target=self._run, name="jellyfish-model-loader", daemon=True).start()
+        return self
+
+    def _load(self, path=None):
+        # The path is resolved once, so the file that gets fingerprinted is the file that was loaded
+        if self.load is not None:
+            model = self.load()
+        else:
+            path = path or self.path or model_path(self.backend)
+            model = load_model(path, self.backend)
+        warm_up(model, self.warm_up_batch_sizes)
+        return model, path if self.load is None else None
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            model, model_file = self._load()
+            with self._lock:
+                self._model, self.model_file = model, model_file
+            self.state = "ready"
+        except Exception as e:
+            self.error = e
+            self.state = "failed"
+        finally:
+            self.load_seconds = time.perf_counter() - start
+            self._done.set()
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def wait(self, timeout=None):
+        """The loaded model, or ``None`` if loading failed or ``timeout`` expired."""
+        self.start()
+        self._done.wait(timeout)
+        return self._model
+
+    def current(self):
+        """``(model, model_file)`` read together, so a concurrent swap can't pair one with the other."""
+        with self._lock:
+            return self._model, self.model_file
+
+    def swap(self, path=None, block=False):
+        """Switch to ``path`` (default: ``model_path()`` again, e.g. a newly promoted version).
+
+        Returns the loading thread; with ``block`` it is joined first. A failed load leaves the
+        current model in place and the exception in ``swap_error``.
+        """
+        if self.load is not None:
+            raise ValueError("Hot swap needs a single-model loader; list new versions in JELLYFISH_MODELS instead")
+        self.swap_error = None
+
+        def run():
+            try:
+                model, model_file = self._load(path or model_path(self.backend))
+            except Exception as e:
+                self.swap_error = e
+                return
+            with self._lock:
+                self._model, self.model_file, self.path = model, model_file, model_file
+                self.swaps += 1
+
+        thread = threading.Thread(target=run, name="jellyfish-model-swap", daemon=True)
+        thread.start()
+        if block:
+            thread.join()
+        return thread
+
+
+# ── Preprocessing ────────────────────────────────────────────
+def preprocess_image(image: Image.Image):
+    with timer("preprocess.decode"):
+        img = image.convert("RGB")
+    with timer("preprocess.resize"):
+        img = img.resize(IMAGE_SIZE)
+    with timer("preprocess.normalize"):
+        arr = np.array(img, dtype=np.float32) / 255.0
+    return np.expand_dims(arr, axis=0)
+
+
+# ── Batched inference ────────────────────────────────────────
+def predict_batch(model, batch):
+    """Softmax rows for an already-preprocessed ``(n, 224, 224, 3)`` batch."""
+    with timer("model.predict"):
+        return np.asarray(model.predict_on_batch(batch))
+
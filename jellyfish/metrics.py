@@ -0,0 +1,103 @@
+"""Per-stage latency instrumentation.
+
+Stages record durations into bounded reservoirs, reported as p50/p95/p99.
+``METRICS`` is the process-wide registry shared by the app, CLI and HTTP
+service. Set ``JELLYFISH_METRICS_JSONL`` to also append every observation to a
+JSON-lines file.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+RESERVOIR_SIZE = 4096
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class StageStats:
+    def __init__(self, maxlen=RESERVOIR_SIZE):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=maxlen)  # the most recent observations, for percentiles
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def summary(self):
+        values = np.fromiter(self.recent, dtype=np.float64)
+        quantiles = np.quantile(values, QUANTILES) if len(values) else [0.0] * len(QUANTILES)
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.max,
+            **{f"p{int(q * 100)}": float(v) for q, v in zip(QUANTILES, quantiles)},
+        }
+
+
+class MetricsRegistry:
+    def __init__(self, jsonl_path=None):
+        self.jsonl_path = jsonl_path
+        self._stages = {}
+        self._lock = threading.Lock()
+        # Opened once and line-buffered; its own lock keeps file writes off the stats lock
+        self._jsonl = open(jsonl_path, "a", encoding="utf-8", buffering=1) if jsonl_path else None
+        self._jsonl_lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = StageStats()
+            stats.observe(seconds)
+        if self._jsonl is not None:
+            line = json.dumps({"ts": time.time(), "stage": stage, "seconds": seconds}) + "\n"
+            with self._jsonl_lock:
+                self._jsonl.write(line)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def snapshot(self):
+        """``{stage: {count, sum, max, p50, p95, p99}}`` in seconds, sorted by stage name."""
+        with self._lock:
+            return {stage: self._stages[stage].summary() for stage in sorted(self._stages)}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+    # ── Export ───────────────────────────────────────────────
+    def to_prometheus(self, prefix="jellyfish_stage_seconds"):
+        lines = [
+            f"# HELP {prefix} Duration of instrumented pipeline stages.",
+            f"# TYPE {prefix} summary",
+        ]
+        for stage, s in self.snapshot().items():
+            label = stage.replace("\\", "\\\\").replace('"', '\\"')
+            for q in QUANTILES:
+                lines.append(f'{prefix}{{stage="{label}",quantile="{q}"}} {s[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'{prefix}_sum{{stage="{label}"}} {s["sum"]:.6f}')
+            lines.append(f'{prefix}_count{{stage="{label}"}} {s["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def to_jsonl(self):
+        ts = time.time()
+        return "".join(json.dumps({"ts": ts, "stage": stage, **s}) + "\n" for stage, s in self.snapshot().items())
+
+
+METRICS = MetricsRegistry(jsonl_path=os.environ.get("JELLYFISH_METRICS_JSONL") or None)
+timer = METRICS.timer
@@ -0,0 +1,134 @@
+"""Out-of-distribution scores from the classifier's own forward pass.
+
+Three scores per image, all derived from the penultimate features and softmax
+that ``EmbeddingModel.embed`` already returns, so no extra model call is made:
+
+    energy     -logsumexp of the logits, recomputed from the features through
+               the final Dense layer's weights (a 1280×6 matmul)
+    entropy    softmax entropy, normalised to [0, 1]
+    distance   cosine distance from the features to the predicted class centroid
+
+Centroids and per-score thresholds (a quantile of each score on labelled
+in-distribution images) come from ``python -m jellyfish calibrate-ood DIR`` and
+are saved next to the model file as ``<model>.ood.npz``. An image is flagged
+when at least two scores exceed their thresholds.
+"""
+
+import os
+
+import numpy as np
+
+from jellyfish.cache import file_fingerprint
+from jellyfish.embeddings import normalize
+from jellyfish.inference import BATCH_SIZE
+from jellyfish.pipeline import DEFAULT_WORKERS, PreprocessPipeline, labelled_images
+from jellyfish.species import CLASS_NAMES
+
+SCORES = ("energy", "entropy", "distance")
+DEFAULT_QUANTILE = 0.95
+MIN_VOTES = 2
+
+
+def calibration_path(model_file):
+    return f"{model_file}.ood.npz"
+
+
+def _logsumexp(x):
+    top = x.max(axis=1, keepdims=True)
+    return (top + np.log(np.exp(x - top).sum(axis=1, keepdims=True)))[:, 0]
+
+
+class OODDetector:
+    def __init__(self, centroids, thresholds, head=None, fingerprint=""):
+        self.centroids = normalize(centroids)
+        self.thresholds = np.asarray(thresholds, dtype=np.float32)
+        self.head = head
+        self.fingerprint = fingerprint
+
+    def score(self, features, probs):
+        """``(n, 3)`` energy/entropy/distance; energy is NaN without a Dense head."""
+        features = np.asarray(features, dtype=np.float32)
+        probs = np.clip(np.asarray(probs, dtype=np.float32), 1e-12, 1.0)
+        if self.head is not None:
+            energy = -_logsumexp(features @ self.head[0] + self.head[1])
+        else:
+            energy = np.full(len(probs), np.nan, dtype=np.float32)
+        entropy = -(probs * np.log(probs)).sum(axis=1) / np.log(probs.shape[1])
+        predicted = self.centroids[probs.argmax(axis=1)]
+        distance = 1.0 - (normalize(features) * predicted).sum(axis=1)
+        return np.stack([energy, entropy, distance], axis=1)
+
+    def flags(self, scores):
+        with np.errstate(invalid="ignore"):
+            return (np.asarray(scores) > self.thresholds).sum(axis=1) >= MIN_VOTES
+
+    def describe(self, scores):
+        """``[{energy, entropy, distance, flagged}, ...]`` as plain floats, for result records."""
+        flagged = self.flags(scores)
+        return [dict(zip(SCORES, map(float, row)), flagged=bool(f)) for row, f in zip(scores, flagged)]
+
+    # ── Calibration ──────────────────────────────────────────
+    @classmethod
+    def fit(cls, features, probs, labels, head=None, quantile=DEFAULT_QUANTILE, fingerprint=""):
+        # Raw features, as ``score`` sees them at inference time; centroids average unit vectors
+        features = np.asarray(features, dtype=np.float32)
+        unit = normalize(features)
+        labels = np.asarray(labels)
+        centroids = np.zeros((len(CLASS_NAMES), features.shape[1]), dtype=np.float32)
+        for c in range(len(CLASS_NAMES)):
+            if (labels == c).any():
+                centroids[c] = unit[labels == c].mean(axis=0)
+        detector = cls(centroids, np.zeros(len(SCORES)), head, fingerprint)
+        scores = detector.score(features, probs)
+        detector.thresholds = np.array([np.nanquantile(s, quantile) if np.isfinite(s).any() else np.inf
+                                        for s in scores.T], dtype=np.float32)
+        return detector
+
+    def save(self, path):
+        np.savez(path, centroids=self.centroids, thresholds=self.thresholds, fingerprint=np.array(self.fingerprint))
+
+    @classmethod
+    def load(cls, model_file, head=None):
+        """The saved calibration for ``model_file``, or ``None`` if missing or made for other weights."""
+        path = calibration_path(model_file)
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            fingerprint = str(data["fingerprint"])
+            if fingerprint != file_fingerprint(model_file):
+                return None
+            return cls(data["centroids"], data["thresholds"], head, fingerprint)
+
+
+def calibrate(embedder, labelled_dir, model_file, quantile=DEFAULT_QUANTILE, batch_size=BATCH_SIZE,
+              workers=DEFAULT_WORKERS):
+    """Fit centroids and thresholds on labelled in-distribution images and save them beside the model."""
+    pipeline = PreprocessPipeline(workers=workers, batch_size=batch_size)
+    features, probs, labels = [], [], []
+    for batch in pipeline.batches(labelled_images(labelled_dir), source=lambda item: item[0]):
+        if batch.keys:
+            f, p = embedder.embed(batch.array)
+            features.append(f.astype(np.float16))
+            probs.append(p)
+            labels.extend(label for _, label in batch.keys)
+    if not labels:
+        raise ValueError(f"No labelled images found in {labelled_dir}")
+    detector = OODDetector.fit(np.concatenate(features), np.concatenate(probs), labels, embedder.head,
+                               quantile, file_fingerprint(model_file))
+    detector.save(calibration_path(model_file))
+    return detector, len(labels)
+
+
+def classify_sources(embedder, detector, sources, pipeline=None):
+    """``(probs, scores)`` for a list of paths/bytes/files: one forward pass per batch feeds both."""
+    pipeline = pipeline or PreprocessPipeline()
+    probs, scores = [], []
+    for batch in pipeline.batches(range(len(sources)), source=lambda i: sources[i]):
+        if batch.errors:
+            raise batch.errors[0][1]
+        f, p = embedder.embed(batch.array)
+        probs.append(p)
+        scores.append(detector.score(f, p))
+    if not probs:
+        return np.empty((0, len(CLASS_NAMES)), dtype=np.float32), np.empty((0, len(SCORES)), dtype=np.float32)
+    return np.concatenate(probs, axis=0), np.concatenate(scores, axis=0)
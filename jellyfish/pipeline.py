@@ -0,0 +1,175 @@
+"""Parallel decode + preprocess feeding the model through a bounded queue.
+
+A producer thread hands each batch's images to a worker pool and queues the
+stacked tensor; the consumer predicts batch N while batch N+1 is decoding.
+The queue size caps how many decoded batches can exist at once.
+"""
+
+import io
+import os
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from jellyfish.inference import BATCH_SIZE, IMAGE_SIZE, predict_batch
+from jellyfish.metrics import timer
+from jellyfish.species import CLASS_NAMES
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+DEFAULT_WORKERS = int(os.environ.get("JELLYFISH_DECODE_WORKERS", min(8, os.cpu_count() or 1)))
+
+# keys/array line up row for row; errors holds (key, exception) for images that failed to decode
+DecodedBatch = namedtuple("DecodedBatch", ["keys", "array", "errors"])
+
+_DONE = object()
+
+
+# ── Discovery ────────────────────────────────────────────────
+def iter_images(root):
+    """Yield ``(relative_path, absolute_path)`` for every image under ``root``, in a stable order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(dirpath, name)
+                yield os.path.relpath(path, root), path
+
+
+def image_label(rel):
+    """Class index named by a relative path, or ``None``.
+
+    The label is the first path component that names a class (class-per-subfolder
+    layout), falling back to the file stem so ``samples/<class>.jpg`` also works.
+    """
+    index = {name.lower(): i for i, name in enumerate(CLASS_NAMES)}
+    parts = rel.replace(os.sep, "/").split("/")
+    for part in parts[:-1] + [os.path.splitext(parts[-1])[0]]:
+        if part.lower() in index:
+            return index[part.lower()]
+    return None
+
+
+def labelled_images(root):
+    """Yield ``(path, class_index)`` for every image under ``root`` whose path names a class."""
+    for rel, path in iter_images(root):
+        label = image_label(rel)
+        if label is not None:
+            yield path, label
+
+
+# ── Decode ───────────────────────────────────────────────────
+
+def load_image(source, size=IMAGE_SIZE):
+    """Decode ``source`` (path, bytes, file object or RGB uint8 frame) to a ``(224, 224, 3)`` float32 array.
+
+    ``draft`` lets the JPEG decoder downscale by 1/2–1/8 while decoding, so a 48 MP
+    photo is never materialised at full resolution.
+    """
+    if isinstance(source, np.ndarray):
+        # Already-decoded video frame: only resize and normalise
+        with timer("preprocess.resize"):
+            img = Image.fromarray(source).resize(size)
+        with timer("preprocess.normalize"):
+            return np.asarray(img, dtype=np.float32) / 255.0
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    with Image.open(source) as img:
+        with timer("preprocess.decode"):
+            img.draft("RGB", size)
+            img = img.convert("RGB")
+        with timer("preprocess.resize"):
+            img = img.resize(size)
+        with timer("preprocess.normalize"):
+            return np.asarray(img, dtype=np.float32) / 255.0
+
+
+class PreprocessPipeline:
+    def __init__(self, workers=DEFAULT_WORKERS, batch_size=BATCH_SIZE, max_pending_batches=2):
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.max_pending_batches = max(1, max_pending_batches)
+
+    def batches(self, items, source=lambda item: item, grouped=False):
+        """Yield a ``DecodedBatch`` per ``batch_size`` items, in input order.
+
+        ``source(item)`` maps each item to something ``load_image`` accepts; the
+        items themselves are returned as the batch keys. With ``grouped=True``
+        ``items`` yields ready-made lists, each decoded as one batch.
+        """
+        q = queue.Queue(maxsize=self.max_pending_batches)
+        stop = threading.Event()
+
+        def produce():
+            try:
+                with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="jellyfish-decode") as pool:
+                    for chunk in (items if grouped else self._chunks(items)):
+                        if not self._put(q, self._decode(pool, chunk, source), stop):
+                            return
+            except BaseException as e:
+                self._put(q, e, stop)
+            finally:
+                self._put(q, _DONE, stop)
+
+        producer = threading.Thread(target=produce, name="jellyfish-preprocess", daemon=True)
+        producer.start()
+        try:
+            while True:
+                batch = q.get()
+                if batch is _DONE:
+                    break
+                if isinstance(batch, BaseException):
+                    raise batch
+                yield batch
+        finally:
+            # Consumer stopped early (error or break): unblock and retire the producer
+            stop.set()
+            producer.join()
+
+    def _chunks(self, items):
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) == self.batch_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def _put(q, value, stop):
+        # Blocks while the queue is full (backpressure) but gives up once the consumer has gone
+        while not stop.is_set():
+            try:
+                q.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    @staticmethod
+    def _decode(pool, chunk, source):
+        futures = [pool.submit(load_image, source(item)) for item in chunk]
+        keys, arrays, errors = [], [], []
+        for item, future in zip(chunk, futures):
+            try:
+                arrays.append(future.result())
+                keys.append(item)
+            except Exception as e:
+                errors.append((item, e))
+        array = np.stack(arrays) if arrays else np.empty((0, *IMAGE_SIZE, 3), dtype=np.float32)
+        return DecodedBatch(keys, array, errors)
+
+
+def classify_sources(model, sources, pipeline=None):
+    """Softmax rows for a list of paths/bytes, raising the first decode error."""
+    pipeline = pipeline or PreprocessPipeline()
+    probs = []
+    for batch in pipeline.batches(range(len(sources)), source=lambda i: sources[i]):
+        if batch.errors:
+            raise batch.errors[0][1]
+        probs.append(predict_batch(model, batch.array))
+    return np.concatenate(probs, axis=0) if probs else np.empty((0, 0), dtype=np.float32)
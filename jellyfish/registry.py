@@ -0,0 +1,185 @@
+"""Several model versions behind one ``predict_on_batch``: A/B, shadow and ensemble serving.
+
+``ModelRegistry`` loads models on first use and evicts the least recently used
+once their combined size passes a memory budget. A ``Deployment`` takes one
+preprocessed batch and hands the same tensor to every model its mode needs,
+recording per-model latency (the ``model.<name>.predict`` stage) and how often
+each other model agrees with the primary's top class.
+
+    single     the primary model only
+    ab         each image goes to the challenger with probability ``split``
+    shadow     the primary answers; challengers score the same batch silently
+    ensemble   the primary and challengers' softmax outputs are averaged
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from jellyfish.cache import file_fingerprint
+from jellyfish.inference import load_model
+from jellyfish.metrics import METRICS
+
+MODES = ("single", "ab", "shadow", "ensemble")
+MODEL_BUDGET_BYTES = int(os.environ.get("JELLYFISH_MODEL_BUDGET_MB", "1024")) * 1024 * 1024
+
+
+def parse_models(spec):
+    """``"current=a.keras,candidate=b.tflite"`` → ordered ``{name: path}``; bare paths are named by file stem."""
+    models = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        name, sep, path = item.partition("=")
+        if not sep:
+            name, path = os.path.splitext(os.path.basename(item))[0], item
+        models[name.strip()] = path.strip()
+    return models
+
+
+def model_bytes(model, path):
+    """Rough resident size: parameter bytes when the model reports them, else the file size."""
+    count_params = getattr(model, "count_params", None)
+    if count_params is not None:
+        return int(count_params()) * 4
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class ModelRegistry:
+    def __init__(self, paths, budget_bytes=MODEL_BUDGET_BYTES, loader=load_model):
+        self.paths = dict(paths)
+        self.budget_bytes = budget_bytes
+        self.loader = loader
+        self._loaded = OrderedDict()  # name -> (model, bytes), most recently used last
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._loaded[name][0]
+            path = self.paths[name]
+            with METRICS.timer(f"model.{name}.load"):
+                model = self.loader(path)
+            self._loaded[name] = (model, model_bytes(model, path))
+            # The model just loaded always stays, even if it alone is over budget
+            while len(self._loaded) > 1 and sum(size for _, size in self._loaded.values()) > self.budget_bytes:
+                self._loaded.popitem(last=False)
+            return model
+
+    def loaded(self):
+        with self._lock:
+            return {name: size for name, (_, size) in self._loaded.items()}
+
+    def fingerprint(self, name):
+        if name not in self._fingerprints:
+            self._fingerprints[name] = file_fingerprint(self.paths[name])
+        return self._fingerprints[name]
+
+
+class Deployment:
+    def __init__(self, registry, primary, mode="single", challengers=(), split=0.1, seed=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown serving mode {mode!r} (expected one of {', '.join(MODES)})")
+        if mode != "single" and not challengers:
+            raise ValueError(f"Serving mode {mode!r} needs at least one challenger model")
+        self.registry = registry
+        self.primary = primary
+        self.mode = mode
+        self.challengers = list(challengers) if mode != "single" else []
+        self.split = split
+        self._rng = np.random.default_rng(seed)
+        self._served = dict.fromkeys([primary, *self.challengers], 0)
+        self._scored = dict.fromkeys([primary, *self.challengers], 0)
+        self._agreed = dict.fromkeys(self.challengers, 0)
+        self._compared = dict.fromkeys(self.challengers, 0)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_spec(cls, spec, mode="single", split=0.1, budget_bytes=MODEL_BUDGET_BYTES, loader=load_model):
+        """The first model in ``spec`` is the primary; the rest are challengers."""
+        paths = parse_models(spec)
+        if not paths:
+            raise ValueError("No models given")
+        names = list(paths)
+        return cls(ModelRegistry(paths, budget_bytes, loader), names[0], mode, names[1:], split)
+
+    # ── Prediction ───────────────────────────────────────────
+    def _run(self, name, batch):
+        model = self.registry.get(name)
+        with METRICS.timer(f"model.{name}.predict"):
+            probs = np.asarray(model.predict_on_batch(batch))
+        with self._lock:
+            self._scored[name] += len(batch)
+        return probs
+
+    def _compare(self, reference, name, probs):
+        agreed = int(np.sum(np.argmax(reference, axis=1) == np.argmax(probs, axis=1)))
+        with self._lock:
+            self._agreed[name] += agreed
+            self._compared[name] += len(probs)
+
+    def predict(self, batch):
+        """``(probs, served_by)`` for one preprocessed batch; ``served_by`` names the model behind each row."""
+        n = len(batch)
+        if self.mode == "ab":
+            to_challenger = self._rng.random(n) < self.split
+            probs = np.empty((n, 0), dtype=np.float32)
+            served_by = [self.primary] * n
+            for name, rows in ((self.primary, ~to_challenger), (self.challengers[0], to_challenger)):
+                if rows.any():
+                    part = self._run(name, batch[rows])
+                    if probs.shape[1] == 0:
+                        probs = np.empty((n, part.shape[1]), dtype=part.dtype)
+                    probs[rows] = part
+                    for i in np.flatnonzero(rows):
+                        served_by[i] = name
+        else:
+            probs = self._run(self.primary, batch)
+            served_by = [self.primary] * n
+            if self.mode in ("shadow", "ensemble"):
+                outputs = [probs]
+                for name in self.challengers:
+                    other = self._run(name, batch)
+                    self._compare(probs, name, other)
+                    outputs.append(other)
+                if self.mode == "ensemble":
+                    probs = np.mean(outputs, axis=0)
+                    served_by = ["ensemble"] * n
+        with self._lock:
+            for name in served_by:
+                if name in self._served:
+                    self._served[name] += 1
+        return probs, served_by
+
+    def predict_on_batch(self, batch):
+        # Lets a Deployment stand in for a single model anywhere in the package
+        return self.predict(batch)[0]
+
+    # ── Introspection ────────────────────────────────────────
+    def fingerprint(self):
+        """Changes whenever a model file, the mode or the split changes; used for prediction-cache keys."""
+        h = hashlib.sha256(f"{self.mode}:{self.split if self.mode == 'ab' else ''}".encode())
+        for name in [self.primary, *self.challengers]:
+            h.update(f"{name}={self.registry.fingerprint(name)}".encode())
+        return h.hexdigest()
+
+    def stats(self):
+        """Per-model served/scored counts and agreement with the primary, plus what is loaded."""
+        loaded = self.registry.loaded()
+        with self._lock:
+            models = {}
+            for name in [self.primary, *self.challengers]:
+                models[name] = {
+                    "role": "primary" if name == self.primary else "challenger",
+                    "served": self._served[name],
+                    "scored": self._scored[name],
+                    "agreement": (self._agreed[name] / self._compared[name]) if self._compared.get(name) else None,
+                    "loaded_mb": loaded[name] / 2**20 if name in loaded else None,
+                }
+            return {"mode": self.mode, "split": self.split if self.mode == "ab" else None, "models": models}
@@ -0,0 +1,240 @@
+"""HTML report for a batch of classification results.
+
+Thumbnails are made once per image (cached by content hash) at twice the 90px
+display size, rows are generated one at a time, and an optional byte budget stops
+embedding thumbnails once the report would grow past it. ``write_report_zip``
+writes the same report with thumbnails as separate files instead of base64.
+Both stream into a binary file chunk by chunk, so the whole report is never held
+in memory.
+"""
+
+import base64
+import hashlib
+import html
+import io
+import threading
+import zipfile
+from collections import OrderedDict
+
+from PIL import Image
+
+THUMBNAIL_SIZE = 180
+DEFAULT_BUDGET_BYTES = 50 * 1024 * 1024
+
+
+# ── Thumbnails ───────────────────────────────────────────────
+def make_thumbnail(source, size=THUMBNAIL_SIZE, quality=80):
+    """JPEG bytes of ``source`` (bytes, path or PIL image) shrunk to fit ``size``×``size``."""
+    if isinstance(source, Image.Image):
+        img = source.copy()
+    else:
+        img = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+        img.draft("RGB", (size, size))
+    img = img.convert("RGB")
+    img.thumbnail((size, size))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+class ThumbnailCache:
+    """LRU of thumbnail JPEG bytes keyed by content hash; shared across reruns."""
+
+    def __init__(self, max_entries=2048, size=THUMBNAIL_SIZE):
+        self.max_entries = max_entries
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, source, key=None):
+        if key is None:
+            key = hashlib.sha256(source).hexdigest()
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        thumb = make_thumbnail(source, self.size)
+        with self._lock:
+            self._items[key] = thumb
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return thumb
+
+
+# ── HTML ─────────────────────────────────────────────────────
+def _badge(conf, ood=False):
+    if ood:
+        row_bg = "background:#1a0a2d; border-left: 4px solid #a78bfa;"
+        badge = f'<span style="background:#6d28d9;color:white;padding:3px 10px;border-radius:99px;font-size:0.75rem;">🚫 Out of distribution {conf*100:.1f}%</span>'
+    elif conf < 0.60:
+        row_bg = "background:#2d0a0a; border-left: 4px solid #e74c3c;"
+        badge = f'<span style="background:#e74c3c;color:white;padding:3px 10px;border-radius:99px;font-size:0.75rem;">⚠️ Low {conf*100:.1f}%</span>'
+    elif conf < 0.80:
+        row_bg = "background:#2d1a00; border-left: 4px solid #e67e22;"
+        badge = f'<span style="background:#e67e22;color:white;padding:3px 10px;border-radius:99px;font-size:0.75rem;">🔶 Moderate {conf*100:.1f}%</span>'
+    else:
+        row_bg = "background:#0a1628; border-left: 4px solid #7fffd4;"
+        badge = f'<span style="background:#1a6b4a;color:#7fffd4;padding:3px 10px;border-radius:99px;font-size:0.75rem;">✅ High {conf*100:.1f}%</span>'
+    return row_bg, badge
+
+
+def _row_html(r, img_src):
+    row_bg, badge = _badge(r["_confidence_raw"], r.get("Status") == "OOD")
+    note = r.get("Note", "")
+    note_html = f'<div style="color:#e67e22;font-size:0.75rem;margin-top:0.3rem;">{html.escape(note)}</div>' if note else ""
+    burst = r.get("_burst_size", 1)
+    burst_html = (f'<div style="color:#7ecfea;font-size:0.75rem;margin-top:0.3rem;">+{burst - 1} near-duplicate '
+                  f'frame{"s" if burst > 2 else ""}</div>') if burst > 1 else ""
+    meta = r.get("_exif") or {}
+    where_html = ""
+    if meta.get("lat") is not None:
+        osm = f"https://www.openstreetmap.org/?mlat={meta['lat']}&mlon={meta['lon']}#map=15/{meta['lat']}/{meta['lon']}"
+        where_html += (f'<div style="font-size:0.75rem;margin-top:0.3rem;"><a href="{html.escape(osm)}" '
+                       f'style="color:#7ecfea;">📍 {meta["lat"]:.5f}, {meta["lon"]:.5f}</a></div>')
+    if meta.get("taken"):
+        where_html += (f'<div style="color:#7ecfea;font-size:0.75rem;margin-top:0.3rem;">'
+                       f'🕒 {html.escape(meta["taken"].replace("T", " "))}</div>')
+    img_html = (f'<img src="{img_src}" style="width:90px;height:90px;object-fit:cover;border-radius:10px;"/>'
+                if img_src else '<div style="width:90px;height:90px;border-radius:10px;background:rgba(255,255,255,0.05);'
+                                'display:flex;align-items:center;justify-content:center;font-size:2rem;">🪼</div>')
+    return f"""
+                    <tr style="{row_bg}">
+                        <td style="padding:12px;">{img_html}</td>
+                        <td style="padding:12px;color:#a8c8e8;font-size:0.85rem;">{html.escape(r['Filename'])}{burst_html}{where_html}</td>
+                        <td style="padding:12px;">
+                            <div style="color:#7fffd4;font-weight:700;font-size:0.95rem;">{r['Predicted Species']}</div>
+                            <div style="color:#7ecfea;font-size:0.78rem;font-style:italic;">{r['Scientific Name']}</div>
+                        </td>
+                        <td style="padding:12px;">{badge}{note_html}</td>
+                        <td style="padding:12px;color:#a8c8e8;font-size:0.82rem;">{r['Habitat']}</td>
+                        <td style="padding:12px;color:#a8c8e8;font-size:0.82rem;">{r['Sting Danger']}</td>
+                    </tr>"""
+
+
+def _head_html(results):
+    total = len(results)
+    low = sum(1 for r in results if r["_confidence_raw"] < 0.60)
+    moderate = sum(1 for r in results if 0.60 <= r["_confidence_raw"] < 0.80)
+    high = sum(1 for r in results if r["_confidence_raw"] >= 0.80)
+    ood = sum(1 for r in results if r.get("Status") == "OOD")
+    ood_badge = f"""
+        <div class="badge" style="background:rgba(167,139,250,0.1);color:#a78bfa;border:1px solid #a78bfa;">
+            🚫 Out of Distribution: {ood}
+        </div>""" if ood else ""
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>Jellyfish Classification Report</title>
+    <style>
+        @import url('https://fonts.googleapis.com/css2?family=Syne:wght@700;800&family=DM+Sans:wght@300;400&display=swap');
+        body {{ background: linear-gradient(160deg,#020b18,#041e3a,#062d55);
+               min-height:100vh; font-family:'DM Sans',sans-serif; color:white; margin:0; padding:2rem; }}
+        h1 {{ font-family:'Syne',sans-serif; font-size:2rem; font-weight:800;
+              background:linear-gradient(135deg,#7fffd4,#00bfff,#a78bfa);
+              -webkit-background-clip:text; -webkit-text-fill-color:transparent; margin-bottom:0; }}
+        .sub {{ color:#7ecfea; letter-spacing:3px; text-transform:uppercase; font-size:0.78rem; margin-bottom:2rem; }}
+        .summary {{ display:flex; gap:1rem; margin-bottom:2rem; }}
+        .badge {{ padding:0.6rem 1.2rem; border-radius:12px; font-size:0.85rem; font-weight:600; }}
+        table {{ width:100%; border-collapse:separate; border-spacing:0 6px; }}
+        th {{ background:rgba(0,191,255,0.08); color:#00bfff; font-size:0.7rem;
+              letter-spacing:2px; text-transform:uppercase; padding:10px 12px; text-align:left; }}
+        td {{ vertical-align:middle; }}
+        .footer {{ text-align:center; color:#2a6fa8; font-size:0.75rem; margin-top:2rem; }}
+    </style>
+</head>
+<body>
+    <h1>🪼 Jellyfish Classification Report</h1>
+    <div class="sub">MobileNetV2 · Deep Learning · 6 Species</div>
+    <div class="summary">
+        <div class="badge" style="background:rgba(127,255,212,0.1);color:#7fffd4;border:1px solid #7fffd4;">
+            ✅ High Confidence: {high}
+        </div>
+        <div class="badge" style="background:rgba(230,126,34,0.1);color:#e67e22;border:1px solid #e67e22;">
+            🔶 Moderate: {moderate}
+        </div>
+        <div class="badge" style="background:rgba(231,76,60,0.1);color:#e74c3c;border:1px solid #e74c3c;">
+            ⚠️ Low Confidence: {low}
+        </div>{ood_badge}
+        <div class="badge" style="background:rgba(0,191,255,0.1);color:#00bfff;border:1px solid #00bfff;">
+            📊 Total: {total}
+        </div>
+    </div>
+    <table>
+        <thead>
+            <tr>
+                <th>Image</th><th>Filename</th><th>Species</th>
+                <th>Confidence</th><th>Habitat</th><th>Sting Danger</th>
+            </tr>
+        </thead>
+        <tbody>"""
+
+
+def _tail_html(omitted):
+    note = (f'<div class="footer">{omitted} thumbnail{"s" if omitted != 1 else ""} omitted to keep the report '
+            f'within its size budget</div>') if omitted else ""
+    return f"""</tbody>
+    </table>{note}
+    <div class="footer">Generated by Jellyfish Classifier · MobileNetV2 · Streamlit 🪼</div>
+</body>
+</html>"""
+
+
+def iter_html_report(results, thumbnail, budget_bytes=DEFAULT_BUDGET_BYTES, image_src=None, external=False):
+    """Yield the report as text chunks.
+
+    ``thumbnail(result)`` returns JPEG bytes (or ``None``). ``image_src(i, result, jpeg)``
+    turns them into an ``<img src>``; the default inlines base64. With ``external`` the
+    images are stored outside the page and their bytes count towards the budget
+    separately. Once the output reaches ``budget_bytes``, remaining rows are written
+    without thumbnails.
+    """
+    if image_src is None:
+        image_src = lambda i, r, jpeg: "data:image/jpeg;base64," + base64.b64encode(jpeg).decode()
+    written = 0
+    omitted = 0
+    head = _head_html(results)
+    written += len(head.encode("utf-8"))
+    yield head
+    for i, r in enumerate(results):
+        src = None
+        jpeg = thumbnail(r)
+        if jpeg is not None:
+            # Checked before committing the image to the output; base64 inflates by 4/3
+            size = len(jpeg) if external else len(jpeg) * 4 // 3
+            if budget_bytes is None or written + size + 2048 <= budget_bytes:
+                src = image_src(i, r, jpeg)
+                if external:
+                    written += size
+            else:
+                omitted += 1
+        row = _row_html(r, src)
+        written += len(row.encode("utf-8"))
+        yield row
+    yield _tail_html(omitted)
+
+
+def write_html_report(results, thumbnail, out, budget_bytes=DEFAULT_BUDGET_BYTES):
+    """Write the report as UTF-8 into the binary file ``out``."""
+    for chunk in iter_html_report(results, thumbnail, budget_bytes):
+        out.write(chunk.encode("utf-8"))
+
+
+def write_report_zip(results, thumbnail, out, budget_bytes=DEFAULT_BUDGET_BYTES):
+    """Write ``report.html`` plus a ``thumbnails/`` folder as a zip into the binary file ``out``."""
+    pending = {}
+
+    def image_src(i, r, jpeg):
+        # Repeated uploads of the same image share one thumbnail file
+        name = f"thumbnails/{r.get('_key') or i}.jpg"
+        pending.setdefault(name, r)
+        return name
+
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        # The page streams into its entry first; only one entry can be open for writing,
+        # so the thumbnails it references are fetched again and stored afterwards
+        with zf.open("report.html", "w") as page:
+            for chunk in iter_html_report(results, thumbnail, budget_bytes, image_src, external=True):
+                page.write(chunk.encode("utf-8"))
+        for name, r in pending.items():
+            zf.writestr(zipfile.ZipInfo(name), thumbnail(r), compress_type=zipfile.ZIP_STORED)
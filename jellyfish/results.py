@@ -0,0 +1,128 @@
+"""Per-image result records, shared by the Classifier page, its downloads and the CLI."""
+
+import numpy as np
+
+from jellyfish.species import CLASS_NAMES, JELLYFISH_INFO
+
+# Same columns, same order as the Classifier page CSV download
+CSV_COLUMNS = [
+    "Filename",
+    "Predicted Species",
+    "Confidence (%)",
+    "Status",
+    "Scientific Name",
+    "Habitat",
+    "Size",
+    "Sting Danger",
+    "Note",
+    "Taken",
+    "Latitude",
+    "Longitude",
+]
+
+LOW_CONFIDENCE = 0.60
+HIGH_CONFIDENCE = 0.80
+
+
+def confidence_status(confidence):
+    return "LOW" if confidence < LOW_CONFIDENCE else "MODERATE" if confidence < HIGH_CONFIDENCE else "HIGH"
+
+
+def confidence_note(confidence):
+    if confidence < LOW_CONFIDENCE:
+        return "Verify - may not be a supported species"
+    if confidence < HIGH_CONFIDENCE:
+        return "Consider using a clearer image"
+    return "OK"
+
+
+def ood_note(ood):
+    return (f"Likely not a supported jellyfish - out of distribution (energy {ood['energy']:.2f}, "
+            f"entropy {ood['entropy']:.2f}, centroid distance {ood['distance']:.2f})")
+
+
+def build_result(filename, preds, key=None, ood=None, exif=None):
+    """One record per image: public CSV columns plus ``_``-prefixed fields for rendering.
+
+    ``key`` is the upload's content hash, used to look up cached derivatives such as thumbnails.
+    ``ood`` is a ``jellyfish.ood`` score dict; a flagged image gets Status ``OOD``.
+    ``exif`` is a ``jellyfish.exif.read_exif`` dict; its capture time and position fill the last columns.
+    No decoded image is kept, so a record stays a few hundred bytes however large the upload.
+    """
+    top_idx = int(np.argmax(preds))
+    top_class = CLASS_NAMES[top_idx]
+    confidence = float(preds[top_idx])
+    info = JELLYFISH_INFO.get(top_class, {})
+    flagged = bool(ood and ood["flagged"])
+    exif = exif or {}
+    return {
+        "Filename": filename,
+        "Predicted Species": top_class.replace('_', ' ').title(),
+        "Confidence (%)": f"{confidence*100:.1f}",
+        "Status": "OOD" if flagged else confidence_status(confidence),
+        "Scientific Name": info.get('scientific', ''),
+        "Habitat": info.get('habitat', ''),
+        "Size": info.get('size', ''),
+        "Sting Danger": info.get('danger', '').replace('✅','').replace('⚠️','').replace('🔴','').strip(),
+        "Note": ood_note(ood) if flagged else confidence_note(confidence),
+        "Taken": exif.get("taken") or "",
+        "Latitude": "" if exif.get("lat") is None else exif["lat"],
+        "Longitude": "" if exif.get("lon") is None else exif["lon"],
+        "_confidence_raw": confidence,
+        "_preds": preds,
+        "_top_class": top_class,
+        "_info": info,
+        "_key": key,
+        "_ood": ood,
+        "_exif": exif or None,
+    }
+
+
+def top_predictions(preds, k=3):
+    """``[(class_name, probability), ...]`` for the ``k`` most likely classes."""
+    return [(CLASS_NAMES[i], float(preds[i])) for i in np.argsort(preds)[::-1][:k]]
+
+
+def public_row(result):
+    return {k: v for k, v in result.items() if not k.startswith('_')}
+
+
+# ── Browsing ─────────────────────────────────────────────────
+# Label -> (sort key, descending); None keeps upload order
+SORT_ORDERS = {
+    "Upload order": (None, False),
+    "Confidence (high → low)": (lambda r: r["_confidence_raw"], True),
+    "Confidence (low → high)": (lambda r: r["_confidence_raw"], False),
+    "Species": (lambda r: (r["Predicted Species"], -r["_confidence_raw"]), False),
+    "Filename": (lambda r: r["Filename"].lower(), False),
+}
+
+
+def filter_results(results, species=(), statuses=()):
+    """Records whose species and confidence band are selected; an empty selection keeps everything."""
+    return [r for r in results
+            if (not species or r["Predicted Species"] in species)
+            and (not statuses or r["Status"] in statuses)]
+
+
+def sort_results(results, order="Upload order"):
+    key, descending = SORT_ORDERS[order]
+    return list(results) if key is None else sorted(results, key=key, reverse=descending)
+
+
+def collapse_bursts(results):
+    """One record per near-duplicate burst (its first member), with ``_burst_size`` set."""
+    firsts, sizes = {}, {}
+    for r in results:
+        burst = r.get("_burst") or id(r)
+        sizes[burst] = sizes.get(burst, 0) + 1
+        firsts.setdefault(burst, r)
+    return [dict(r, _burst_size=sizes[burst]) for burst, r in firsts.items()]
+
+
+def page_of(items, page, page_size):
+    """``(items on the 1-based page, page count)``, with ``page`` clamped into range."""
+    n_pages = max(1, -(-len(items) // page_size))
+    page = min(max(1, page), n_pages)
+    start = (page - 1) * page_size
+    return items[start:start + page_size], n_pages
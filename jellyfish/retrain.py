@@ -0,0 +1,352 @@
+"""User corrections and head-only retraining from cached backbone embeddings.
+
+Corrections made on the Classifier page are saved as image files under
+``JELLYFISH_CORRECTIONS_DIR/<true class>/``, the class-per-subfolder layout that
+``evaluate`` and ``calibrate-ood`` already read. ``retrain`` embeds every labelled
+image once with the frozen MobileNetV2 backbone (the penultimate features) and
+keeps the vectors in SQLite, keyed by image content and backbone, so a weekly
+run only embeds images added since the last one. Only the final Dense layer is
+then refit: softmax regression in NumPy, warm-started from the current head and
+pulled back towards it by an L2 penalty, which takes seconds on a CPU for a few
+thousand 1280-d vectors and cannot overfit the backbone the way full fine-tuning
+(Phase 2) did.
+
+Each run saves ``MODELS_DIR/jellyfish_vNNN.keras`` with a ``.json`` sidecar
+(parent, backbone, image counts, held-out accuracy before and after), an
+evaluation artifact with the head's training curves, and an OOD calibration for
+the new file. ``promote`` points ``MODELS_DIR/current`` at a version;
+``inference.model_path`` follows that pointer on the next load and
+``ModelLoader.swap`` switches a running app over without a restart.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from jellyfish import evaluation, ood
+from jellyfish.cache import file_fingerprint
+from jellyfish.embeddings import EmbeddingModel
+from jellyfish.inference import BATCH_SIZE, CURRENT_POINTER, MODELS_DIR
+from jellyfish.pipeline import DEFAULT_WORKERS, IMAGE_EXTENSIONS, PreprocessPipeline, labelled_images
+from jellyfish.species import CLASS_NAMES
+
+CORRECTIONS_DIR = os.environ.get("JELLYFISH_CORRECTIONS_DIR", "corrections")
+FEATURE_DB = os.environ.get("JELLYFISH_FEATURE_DB", os.path.join(".cache", "features.sqlite"))
+CORRECTIONS_LOG = "corrections.jsonl"
+VERSION_PREFIX = "jellyfish_v"
+
+EPOCHS = 200
+LEARNING_RATE = 0.01
+L2 = 1e-3  # towards the parent head's weights, not towards zero
+VALIDATION_SPLIT = 0.2
+MIN_VALIDATION_PER_CLASS = 5  # classes with fewer images are used for training only
+CORRECTION_WEIGHT = 2.0
+
+
+# ── Corrections ──────────────────────────────────────────────
+def save_correction(data, filename, label, predicted=None, model=None, root=CORRECTIONS_DIR):
+    """Store an image under ``root/<label>/``; correcting the same image again moves it. Returns the path."""
+    if label not in CLASS_NAMES:
+        raise ValueError(f"Unknown class {label!r}")
+    ext = os.path.splitext(filename)[1].lower()
+    name = hashlib.sha256(data).hexdigest()[:16] + (ext if ext in IMAGE_EXTENSIONS else ".jpg")
+    for other in CLASS_NAMES:
+        stale = os.path.join(root, other, name)
+        if other != label and os.path.exists(stale):
+            os.remove(stale)
+    path = os.path.join(root, label, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    entry = {"ts": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "filename": filename, "file": os.path.relpath(path, root),
+             "predicted": predicted, "label": label, "model": model}
+    with open(os.path.join(root, CORRECTIONS_LOG), "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return path
+
+
+def correction_counts(root=CORRECTIONS_DIR):
+    """``{class_name: images}`` currently saved as corrections."""
+    counts = dict.fromkeys(CLASS_NAMES, 0)
+    for _, label in labelled_images(root):
+        counts[CLASS_NAMES[label]] += 1
+    return counts
+
+
+# ── Embedding cache ──────────────────────────────────────────
+class FeatureCache:
+    """Backbone feature vectors by ``(backbone fingerprint, image content hash)`` in SQLite."""
+
+    def __init__(self, path=FEATURE_DB):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS features ("
+                         " backbone TEXT NOT NULL, image TEXT NOT NULL, vector BLOB NOT NULL,"
+                         " PRIMARY KEY (backbone, image)) WITHOUT ROWID")
+        self._db.commit()
+
+    def get_many(self, backbone, images):
+        found = {}
+        with self._lock:
+            for start in range(0, len(images), 500):
+                chunk = images[start:start + 500]
+                rows = self._db.execute(f"SELECT image, vector FROM features WHERE backbone = ?"
+                                        f" AND image IN ({','.join('?' * len(chunk))})", (backbone, *chunk))
+                found.update((image, np.frombuffer(vector, dtype=np.float32)) for image, vector in rows)
+        return found
+
+    def put_many(self, backbone, images, vectors):
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO features VALUES (?, ?, ?)",
+                                 [(backbone, image, np.asarray(v, dtype=np.float32).tobytes())
+                                  for image, v in zip(images, vectors)])
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _content_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def labelled_features(embedder, roots, backbone, cache, weights=None, batch_size=BATCH_SIZE,
+                      workers=DEFAULT_WORKERS, progress=None):
+    """``(features, labels, sample_weights, embedded)`` for every labelled image under ``roots``.
+
+    ``weights`` maps a root to the weight its images get (default 1). An image found under
+    several roots counts once, with the label and weight of the last. Only images missing
+    from ``cache`` go through the backbone; ``embedded`` is how many did.
+    """
+    weights = weights or {}
+    items = {}
+    for root in roots:
+        for path, label in labelled_images(root):
+            items[_content_hash(path)] = (path, label, weights.get(root, 1.0))
+    images = list(items)
+    vectors = cache.get_many(backbone, images)
+    missing = [(image, items[image][0]) for image in images if image not in vectors]
+    pipeline = PreprocessPipeline(workers=workers, batch_size=batch_size)
+    for batch in pipeline.batches(missing, source=lambda item: item[1]):
+        for (image, _), _ in batch.errors:
+            items.pop(image)
+        if batch.keys:
+            features, _ = embedder.embed(batch.array)
+            keys = [image for image, _ in batch.keys]
+            cache.put_many(backbone, keys, features)
+            vectors.update(zip(keys, features))
+        if progress:
+            progress(len(vectors), len(items))
+    images = [image for image in images if image in items]
+    if not images:
+        return (np.empty((0, embedder.dim), dtype=np.float32), np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.float32), len(missing))
+    return (np.stack([vectors[image] for image in images]).astype(np.float32),
+            np.array([items[image][1] for image in images]),
+            np.array([items[image][2] for image in images], dtype=np.float32),
+            len(missing))
+
+
+# ── Head training ────────────────────────────────────────────
+def softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    e = np.exp(logits)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+def _loss_accuracy(features, labels, kernel, bias):
+    probs = softmax(features @ kernel + bias)
+    loss = float(-np.log(np.clip(probs[np.arange(len(labels)), labels], 1e-12, 1.0)).mean())
+    return loss, float((probs.argmax(axis=1) == labels).mean()), probs
+
+
+def split_validation(labels, fraction=VALIDATION_SPLIT, seed=0):
+    """``(train_idx, val_idx)``, stratified; small classes stay entirely in training."""
+    rng = np.random.default_rng(seed)
+    train, val = [], []
+    for c in np.unique(labels):
+        idx = rng.permutation(np.flatnonzero(labels == c))
+        n_val = int(len(idx) * fraction) if len(idx) >= MIN_VALIDATION_PER_CLASS else 0
+        val.extend(idx[:n_val])
+        train.extend(idx[n_val:])
+    return np.sort(np.array(train, dtype=np.int64)), np.sort(np.array(val, dtype=np.int64))
+
+
+def fit_head(features, labels, init, sample_weights=None, epochs=EPOCHS, learning_rate=LEARNING_RATE, l2=L2,
+             validation=None):
+    """Full-batch Adam on softmax regression, warm-started at ``init = (kernel, bias)``.
+
+    Classes are balanced by inverse frequency on top of ``sample_weights``. Returns
+    ``(kernel, bias, history)`` with a Keras-style ``History.history`` dict; ``validation``
+    is an optional ``(features, labels)`` pair for the ``val_*`` curves.
+    """
+    kernel0, bias0 = (np.asarray(w, dtype=np.float32) for w in init)
+    kernel, bias = kernel0.copy(), bias0.copy()
+    n, n_classes = len(labels), kernel.shape[1]
+    weights = np.ones(n, dtype=np.float32) if sample_weights is None else np.asarray(sample_weights, np.float32)
+    class_counts = np.bincount(labels, minlength=n_classes).astype(np.float32)
+    weights = weights * (n / (n_classes * np.maximum(class_counts, 1)))[labels]
+    weights /= weights.sum()
+    onehot = np.eye(n_classes, dtype=np.float32)[labels]
+    params = [kernel, bias]
+    m = [np.zeros_like(p) for p in params]
+    v = [np.zeros_like(p) for p in params]
+    beta1, beta2 = 0.9, 0.999
+    history = {"accuracy": [], "val_accuracy": [], "loss": [], "val_loss": []}
+    for step in range(1, epochs + 1):
+        probs = softmax(features @ kernel + bias)
+        grad_logits = (probs - onehot) * weights[:, None]
+        grads = [features.T @ grad_logits + l2 * (kernel - kernel0), grad_logits.sum(axis=0)]
+        for p, g, m_, v_ in zip(params, grads, m, v):
+            m_ *= beta1
+            m_ += (1 - beta1) * g
+            v_ *= beta2
+            v_ += (1 - beta2) * g * g
+            p -= learning_rate * (m_ / (1 - beta1 ** step)) / (np.sqrt(v_ / (1 - beta2 ** step)) + 1e-8)
+        loss, acc, _ = _loss_accuracy(features, labels, kernel, bias)
+        history["loss"].append(loss)
+        history["accuracy"].append(acc)
+        if validation is not None and len(validation[1]):
+            val_loss, val_acc, _ = _loss_accuracy(*validation, kernel, bias)
+        else:
+            val_loss, val_acc = loss, acc
+        history["val_loss"].append(val_loss)
+        history["val_accuracy"].append(val_acc)
+    return kernel, bias, history
+
+
+# ── Versions ─────────────────────────────────────────────────
+def sidecar_path(model_file):
+    return os.path.splitext(model_file)[0] + ".json"
+
+
+def read_sidecar(model_file):
+    try:
+        with open(sidecar_path(model_file), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def backbone_fingerprint(model_file):
+    """Head-only versions share their ancestor's backbone, and so its cached features."""
+    meta = read_sidecar(model_file)
+    return meta["backbone"] if meta and meta.get("backbone") else file_fingerprint(model_file)
+
+
+def versions(models_dir=MODELS_DIR):
+    """Sidecar metadata of every saved version, oldest first, with ``path`` added."""
+    found = []
+    if os.path.isdir(models_dir):
+        for name in sorted(os.listdir(models_dir)):
+            if name.startswith(VERSION_PREFIX) and name.endswith(".keras"):
+                path = os.path.join(models_dir, name)
+                meta = read_sidecar(path)
+                if meta is not None:  # written last, so a half-saved version is skipped
+                    found.append(dict(meta, path=path))
+    return found
+
+
+def promote(path, models_dir=MODELS_DIR):
+    """Make ``path`` the model ``inference.model_path`` returns; ``None`` returns to the original."""
+    pointer = os.path.join(models_dir, CURRENT_POINTER)
+    if path is None:
+        if os.path.exists(pointer):
+            os.remove(pointer)
+        return
+    os.makedirs(models_dir, exist_ok=True)
+    tmp = pointer + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.relpath(path, models_dir) + "\n")
+    os.replace(tmp, pointer)
+
+
+def build_model(classifier, kernel, bias):
+    """A copy of ``classifier`` whose final Dense layer holds the new weights."""
+    import tensorflow as tf
+
+    model = tf.keras.models.clone_model(classifier)
+    model.set_weights(classifier.get_weights())
+    model.layers[-1].set_weights([kernel, bias])
+    return model
+
+
+def retrain(model, model_file, roots, models_dir=MODELS_DIR, cache=None, corrections_dir=CORRECTIONS_DIR,
+            epochs=EPOCHS, learning_rate=LEARNING_RATE, l2=L2, batch_size=BATCH_SIZE, workers=DEFAULT_WORKERS,
+            progress=None):
+    """Fit a new head on the labelled images under ``roots`` and save it as the next version (not promoted).
+
+    Images under ``corrections_dir`` (when it is one of ``roots``) weigh ``CORRECTION_WEIGHT``.
+    Returns the new version's metadata, including ``path``.
+    """
+    start = time.perf_counter()
+    embedder = EmbeddingModel(model)
+    if embedder.head is None:
+        raise ValueError("Head-only retraining needs a final Dense layer fed directly by the features")
+    backbone = backbone_fingerprint(model_file)
+    own_cache = cache is None
+    cache = cache or FeatureCache()
+    try:
+        features, labels, weights, embedded = labelled_features(
+            embedder, roots, backbone, cache, {corrections_dir: CORRECTION_WEIGHT}, batch_size, workers, progress)
+    finally:
+        if own_cache:
+            cache.close()
+    if not len(labels):
+        raise ValueError(f"No labelled images found in {', '.join(roots)}")
+    embed_seconds = time.perf_counter() - start
+
+    # Held-out estimate first, then the shipped head is refit on every image
+    train, val = split_validation(labels)
+    kernel, bias, history = fit_head(features[train], labels[train], embedder.head, weights[train], epochs,
+                                     learning_rate, l2, (features[val], labels[val]))
+    accumulator = evaluation.EvaluationAccumulator()
+    held_out = val if len(val) else train
+    _, parent_accuracy, _ = _loss_accuracy(features[held_out], labels[held_out], *embedder.head)
+    _, accuracy, probs = _loss_accuracy(features[held_out], labels[held_out], kernel, bias)
+    accumulator.update(labels[held_out], probs)
+    kernel, bias, _ = fit_head(features, labels, embedder.head, weights, epochs, learning_rate, l2)
+    train_seconds = time.perf_counter() - start - embed_seconds
+
+    os.makedirs(models_dir, exist_ok=True)
+    number = max([v["version"] for v in versions(models_dir)], default=0) + 1
+    path = os.path.join(models_dir, f"{VERSION_PREFIX}{number:03d}.keras")
+    build_model(embedder.classifier, kernel, bias).save(path)
+    meta = {
+        "version": number,
+        "parent": os.path.basename(model_file),
+        "backbone": backbone,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "images": int(len(labels)),
+        "per_class": {name: int(n) for name, n in zip(CLASS_NAMES, np.bincount(labels, minlength=len(CLASS_NAMES)))},
+        "corrections": int((weights == CORRECTION_WEIGHT).sum()),
+        "validation_images": int(len(val)),
+        "parent_accuracy": parent_accuracy,
+        "accuracy": accuracy,
+        "embedded": embedded,
+        "embed_seconds": embed_seconds,
+        "train_seconds": train_seconds,
+        "epochs": epochs,
+    }
+
+    # Evaluation artifact (held-out split, with the head's curves) and OOD calibration for the new file
+    result = accumulator.result()
+    result.update({"dataset": ", ".join(os.path.abspath(r) for r in roots), "unreadable_images": 0,
+                   "seconds": train_seconds})
+    evaluation.save_artifact(result, path, history=history)
+    ood.OODDetector.fit(features, softmax(features @ kernel + bias), labels, (kernel, bias),
+                        fingerprint=file_fingerprint(path)).save(ood.calibration_path(path))
+    tmp = sidecar_path(path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, sidecar_path(path))
+    return dict(meta, path=path)
@@ -0,0 +1,160 @@
+"""Standalone HTTP inference service: ``python -m jellyfish serve``.
+
+Standard library only. Each request thread decodes its own images, then hands
+them to a shared ``MicroBatcher`` so concurrent requests are predicted together.
+
+    POST /predict   raw image body (Content-Type: image/*) or multipart/form-data
+                    with one or more file parts
+    GET  /health    liveness plus batching counters (and per-model stats when
+                    serving a multi-model ``Deployment``)
+    GET  /metrics   per-stage latency summaries in Prometheus text format
+"""
+
+import json
+from email.parser import BytesParser
+from email.policy import HTTP
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from jellyfish.batching import MicroBatcher
+from jellyfish.inference import predict_batch
+from jellyfish.metrics import METRICS
+from jellyfish.pipeline import load_image
+from jellyfish.registry import Deployment
+from jellyfish.results import build_result, public_row, top_predictions
+
+MAX_BODY_BYTES = 64 * 1024 * 1024
+REQUEST_TIMEOUT = 30.0
+
+
+def prediction_payload(filename, preds, model=None):
+    """The fields the Classifier page shows for one image, as JSON-ready values."""
+    result = build_result(filename, preds)
+    payload = public_row(result)
+    payload.update({
+        "top_class": result["_top_class"],
+        "confidence": result["_confidence_raw"],
+        "top3": [{"class": name, "probability": prob} for name, prob in top_predictions(preds)],
+        "info": result["_info"],
+    })
+    if model is not None:
+        payload["model"] = model
+    return payload
+
+
+def parse_images(content_type, body):
+    """``[(filename, bytes), ...]`` from a raw image body or a multipart form."""
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+        )
+        files = []
+        for part in message.iter_parts():
+            data = part.get_payload(decode=True)
+            if data:
+                files.append((part.get_filename() or part.get_param("name", header="content-disposition") or "", data))
+        return files
+    return [("", body)]
+
+
+class PredictHandler(BaseHTTPRequestHandler):
+    server_version = "JellyfishClassifier/1.0"
+    batcher = None  # set by make_server
+    deployment = None  # set by make_server when serving several models
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            data = METRICS.to_prometheus().encode("utf-8")
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif self.path == "/health":
+            health = {
+                "status": "ok",
+                "batches_run": self.batcher.batches_run,
+                "images_run": self.batcher.images_run,
+            }
+            if self.deployment is not None:
+                health["deployment"] = self.deployment.stats()
+            self._send_json(HTTPStatus.OK, health)
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "invalid Content-Length"})
+            return
+        if length <= 0:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "empty request body"})
+            return
+        if length > MAX_BODY_BYTES:
+            self._send_json(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "request body too large"})
+            return
+        body = self.rfile.read(length)
+
+        files = parse_images(self.headers.get("Content-Type", ""), body)
+        if not files:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "no images in request"})
+            return
+        try:
+            arrays = [load_image(data) for _, data in files]
+        except Exception as e:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": f"could not read image: {e}"})
+            return
+        try:
+            rows = self.batcher.predict(arrays, timeout=REQUEST_TIMEOUT)
+        except Exception as e:
+            self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"inference failed: {e}"})
+            return
+        self._send_json(HTTPStatus.OK, {
+            "predictions": [prediction_payload(name, p, model) for (name, _), (p, model) in zip(files, rows)],
+        })
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class InferenceServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # socketserver's default of 5 resets bursts of concurrent clients
+
+
+def _predict_rows(model, batch):
+    # (softmax row, serving model name or None) per image
+    if isinstance(model, Deployment):
+        probs, served_by = model.predict(batch)
+        return list(zip(probs, served_by))
+    return [(p, None) for p in predict_batch(model, batch)]
+
+
+def make_server(model, host="127.0.0.1", port=8000, max_batch_size=32, max_wait_ms=10):
+    """``model`` is a single model or a ``Deployment`` fanning each batch out to several."""
+    batcher = MicroBatcher(model, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, predict=_predict_rows)
+    deployment = model if isinstance(model, Deployment) else None
+    handler = type("BoundPredictHandler", (PredictHandler,), {"batcher": batcher, "deployment": deployment})
+    httpd = InferenceServer((host, port), handler)
+    return httpd, batcher
+
+
+def serve(model, host="127.0.0.1", port=8000, max_batch_size=32, max_wait_ms=10):
+    httpd, batcher = make_server(model, host, port, max_batch_size, max_wait_ms)
+    print(f"Serving Jellyfish Classifier on http://{host}:{port}/predict", flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        batcher.close()
@@ -0,0 +1,149 @@
+"""Per-session upload records held within a memory budget.
+
+After inference each upload is reduced to its result record (content hash,
+softmax vector, species metadata). Derived bytes such as report thumbnails and
+display previews are made lazily from the uploaded file the first time they are
+needed; once they exceed the session's budget the least recently used ones are
+written to a private temp directory and read back on demand. Session-wide
+downloads such as reports are streamed straight into that directory and only
+read when served.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+
+DEFAULT_BUDGET_BYTES = int(os.environ.get("JELLYFISH_SESSION_BUDGET_MB", "32")) * 1024 * 1024
+
+
+class UploadSession:
+    def __init__(self, budget_bytes=DEFAULT_BUDGET_BYTES, spill_dir=None):
+        self.budget_bytes = budget_bytes
+        self._spill_root = spill_dir
+        self._spill_dir = None
+        self._records = {}  # upload id -> result record
+        self._blobs = OrderedDict()  # (upload id, name) -> bytes, most recently used last
+        self._spilled = {}  # (upload id, name) -> (path, size)
+        self._downloads = {}  # name -> (signature, path, size)
+        self._memory_bytes = 0
+        self._spill_seq = 0
+        self._lock = threading.Lock()
+        self._finalizer = None
+
+    # ── Records ──────────────────────────────────────────────
+    def __contains__(self, upload_id):
+        return upload_id in self._records
+
+    def add(self, upload_id, record):
+        self._records[upload_id] = record
+
+    def record(self, upload_id):
+        return self._records[upload_id]
+
+    def retain(self, upload_ids):
+        """Forget uploads no longer in the uploader, along with their blobs."""
+        keep = set(upload_ids)
+        with self._lock:
+            for upload_id in [u for u in self._records if u not in keep]:
+                del self._records[upload_id]
+            for blob_key in [k for k in self._blobs if k[0] not in keep]:
+                self._memory_bytes -= len(self._blobs.pop(blob_key))
+            for blob_key in [k for k in self._spilled if k[0] not in keep]:
+                path, _ = self._spilled.pop(blob_key)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    # ── Blobs ────────────────────────────────────────────────
+    def blob(self, upload_id, name, make):
+        """Bytes stored under ``name`` for an upload, calling ``make()`` the first time."""
+        blob_key = (upload_id, name)
+        with self._lock:
+            data = self._blobs.get(blob_key)
+            if data is not None:
+                self._blobs.move_to_end(blob_key)
+                return data
+            spilled = self._spilled.get(blob_key)
+        if spilled is not None:
+            with open(spilled[0], "rb") as f:
+                return f.read()
+        data = make()
+        with self._lock:
+            self._blobs[blob_key] = data
+            self._memory_bytes += len(data)
+            self._spill_over_budget()
+        return data
+
+    def _spill_over_budget(self):
+        # The newest blob always stays in memory, even if it alone exceeds the budget
+        while self._memory_bytes > self.budget_bytes and len(self._blobs) > 1:
+            blob_key, data = self._blobs.popitem(last=False)
+            self._memory_bytes -= len(data)
+            self._spill_seq += 1
+            path = os.path.join(self._ensure_spill_dir(), f"{self._spill_seq}-{blob_key[1]}")
+            with open(path, "wb") as f:
+                f.write(data)
+            self._spilled[blob_key] = (path, len(data))
+
+    # ── Downloads ────────────────────────────────────────────
+    def download(self, name, signature, write=None):
+        """Path of the session-wide file ``name`` built for ``signature``.
+
+        If it is missing or was built for another signature, ``write(f)`` streams it
+        into a binary file on disk; without ``write`` the result is ``None`` instead.
+        """
+        with self._lock:
+            stored = self._downloads.get(name)
+            if stored is not None and stored[0] == signature:
+                return stored[1]
+            if write is None:
+                return None
+            self._spill_seq += 1
+            path = os.path.join(self._ensure_spill_dir(), f"{self._spill_seq}-{name}")
+        with open(path, "wb") as f:
+            write(f)
+        with self._lock:
+            previous = self._downloads.get(name)
+            self._downloads[name] = (signature, path, os.path.getsize(path))
+        if previous is not None:
+            try:
+                os.remove(previous[1])
+            except OSError:
+                pass
+        return path
+
+    def _ensure_spill_dir(self):
+        if self._spill_dir is None:
+            if self._spill_root:
+                os.makedirs(self._spill_root, exist_ok=True)
+            self._spill_dir = tempfile.mkdtemp(prefix="jellyfish-session-", dir=self._spill_root)
+            # Removed when the session is garbage collected, even without close()
+            self._finalizer = weakref.finalize(self, shutil.rmtree, self._spill_dir, True)
+        return self._spill_dir
+
+    # ── Housekeeping ─────────────────────────────────────────
+    def stats(self):
+        with self._lock:
+            return {
+                "records": len(self._records),
+                "memory_bytes": self._memory_bytes,
+                "spilled": len(self._spilled),
+                "spilled_bytes": sum(size for _, size in self._spilled.values()),
+                "download_bytes": sum(size for _, _, size in self._downloads.values()),
+            }
+
+    def close(self):
+        with self._lock:
+            self._records.clear()
+            self._blobs.clear()
+            self._spilled.clear()
+            self._downloads.clear()
+            self._memory_bytes = 0
+            if self._finalizer is not None:
+                self._finalizer()
+                self._spill_dir = None
+                self._finalizer = None
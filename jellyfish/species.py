@@ -0,0 +1,66 @@
+"""Species metadata: the class order the model was trained with and per-species facts."""
+
+# Class names — must match your training order!
+CLASS_NAMES = [
+    "Moon_jellyfish",
+    "barrel_jellyfish",
+    "blue_jellyfish",
+    "compass_jellyfish",
+    "lions_mane_jellyfish",
+    "mauve_stinger_jellyfish",
+]
+
+# ── Jellyfish info database ──────────────────────────────────
+JELLYFISH_INFO = {
+    "Moon_jellyfish": {
+        "emoji": "🌙",
+        "scientific": "Aurelia aurita",
+        "habitat": "Worldwide oceans",
+        "size": "Up to 40cm bell diameter",
+        "fun_fact": "The most common jellyfish worldwide. The four pink/purple rings visible through their translucent bell are their reproductive organs.",
+        "danger": "Harmless ✅"
+    },
+    "barrel_jellyfish": {
+        "emoji": "🪼",
+        "scientific": "Rhizostoma pulmo",
+        "habitat": "Atlantic Ocean, Mediterranean Sea",
+        "size": "Up to 90cm bell diameter",
+        "fun_fact": "One of the largest jellyfish in UK waters, they are harmless to humans and are actually a food source for leatherback sea turtles.",
+        "danger": "Low ✅"
+    },
+    "blue_jellyfish": {
+        "emoji": "💙",
+        "scientific": "Cyanea lamarckii",
+        "habitat": "North Atlantic, North Sea",
+        "size": "Up to 30cm bell diameter",
+        "fun_fact": "Their vivid blue or yellow colour fades as they age. They are most commonly spotted in summer months near UK coasts.",
+        "danger": "Mild sting ⚠️"
+    },
+    "compass_jellyfish": {
+        "emoji": "🧭",
+        "scientific": "Chrysaora hysoscella",
+        "habitat": "Eastern Atlantic, Mediterranean",
+        "size": "Up to 30cm bell diameter",
+        "fun_fact": "Named after the brown compass-like markings on their bell. They are an active predator, catching small fish and crustaceans.",
+        "danger": "Moderate sting ⚠️"
+    },
+    "lions_mane_jellyfish": {
+        "emoji": "🦁",
+        "scientific": "Cyanea capillata",
+        "habitat": "Arctic, North Atlantic, North Pacific",
+        "size": "Up to 2m bell — world's largest jellyfish!",
+        "fun_fact": "The world's largest known jellyfish species. Their tentacles can extend over 30 meters — longer than a blue whale!",
+        "danger": "Strong sting 🔴"
+    },
+    "mauve_stinger_jellyfish": {
+        "emoji": "💜",
+        "scientific": "Pelagia noctiluca",
+        "habitat": "Mediterranean, Atlantic, Indo-Pacific",
+        "size": "Up to 10cm bell diameter",
+        "fun_fact": "They are bioluminescent — they glow blue-green at night when disturbed. Despite being small, their sting is surprisingly painful.",
+        "danger": "Painful sting 🔴"
+    }
+}
+
+# Species whose sting the safety team maps by beach (🔴 in the danger field)
+STING_RISK = [name for name, info in JELLYFISH_INFO.items() if "🔴" in info.get("danger", "")]
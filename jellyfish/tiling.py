@@ -0,0 +1,265 @@
+"""Tiled multi-instance inference for wide shots holding several jellyfish.
+
+Each image is decoded once at a working resolution and cut into overlapping
+square tiles at several scales. Flat background water is dropped before any
+tile is resized: a tile's grey standard deviation is read in O(1) from
+integral images of a small thumbnail, so the work grows with content rather
+than pixel count. The surviving tiles of a group of images are stacked and
+classified together, ``max_tiles`` per ``predict_on_batch`` call. Per-tile
+softmax is splatted onto a coarse grid (finer tiles weigh more), and connected
+cells whose top class clears the confidence threshold become labelled
+regions, counted per species.
+"""
+
+import io
+import os
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from jellyfish.inference import BATCH_SIZE, IMAGE_SIZE, predict_batch
+from jellyfish.metrics import timer
+from jellyfish.pipeline import DEFAULT_WORKERS
+from jellyfish.species import CLASS_NAMES
+
+# Tile sides as fractions of the image's short edge
+DEFAULT_SCALES = tuple(float(s) for s in os.environ.get("JELLYFISH_TILE_SCALES", "0.5,0.25").split(","))
+DEFAULT_OVERLAP = 0.25
+# Grey-level standard deviation (0–1) below which a tile is treated as empty water
+MIN_TILE_STD = float(os.environ.get("JELLYFISH_TILE_MIN_STD", "0.04"))
+DEFAULT_MIN_CONFIDENCE = 0.60
+WORKING_SIZE = 1600  # long side tiles are cut from; larger photos are draft-decoded down to it
+THUMBNAIL_SIZE = 256  # long side of the grey image the variance filter reads
+GRID_CELLS = 48  # long side of the heatmap grid
+MIN_REGION_CELLS = 4  # smaller connected areas are edge noise, not a jellyfish
+MAX_TILES = BATCH_SIZE * 4
+
+CLASS_COLORS = ((127, 255, 212), (0, 191, 255), (255, 165, 0), (231, 76, 60), (167, 139, 250), (46, 204, 113))
+
+
+# ── Tiles ────────────────────────────────────────────────────
+def _starts(length, side, stride):
+    starts = list(range(0, max(1, length - side + 1), stride))
+    if starts[-1] + side < length:
+        starts.append(length - side)  # last tile flush with the edge
+    return starts
+
+
+def tile_boxes(width, height, scales=DEFAULT_SCALES, overlap=DEFAULT_OVERLAP):
+    """``(boxes, scales)``: ``(n, 4)`` int ``x0, y0, x1, y1`` squares and the scale each came from."""
+    boxes, tile_scales = [], []
+    for scale in scales:
+        side = max(1, min(width, height, round(scale * min(width, height))))
+        stride = max(1, round(side * (1 - overlap)))
+        for y in _starts(height, side, stride):
+            for x in _starts(width, side, stride):
+                boxes.append((x, y, x + side, y + side))
+                tile_scales.append(scale)
+    return np.array(boxes, dtype=np.int64).reshape(-1, 4), np.array(tile_scales, dtype=np.float32)
+
+
+def tile_std(grey, boxes, factor):
+    """Grey-level standard deviation inside each box, ``factor`` mapping box to ``grey`` coordinates."""
+    g = grey.astype(np.float64)
+    s1 = np.pad(g.cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+    s2 = np.pad((g * g).cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+    h, w = g.shape
+    x0 = np.clip(np.floor(boxes[:, 0] * factor).astype(int), 0, w - 1)
+    y0 = np.clip(np.floor(boxes[:, 1] * factor).astype(int), 0, h - 1)
+    x1 = np.clip(np.ceil(boxes[:, 2] * factor).astype(int), x0 + 1, w)
+    y1 = np.clip(np.ceil(boxes[:, 3] * factor).astype(int), y0 + 1, h)
+    area = (x1 - x0) * (y1 - y0)
+
+    def box_sum(s):
+        return s[y1, x1] - s[y0, x1] - s[y1, x0] + s[y0, x0]
+
+    mean = box_sum(s1) / area
+    return np.sqrt(np.maximum(box_sum(s2) / area - mean * mean, 0.0))
+
+
+def grid_shape(size, grid_cells=GRID_CELLS):
+    width, height = size
+    return max(1, round(grid_cells * height / max(size))), max(1, round(grid_cells * width / max(size)))
+
+
+def _cell_boxes(size, shape):
+    gh, gw = shape
+    xs, ys = np.linspace(0, size[0], gw + 1), np.linspace(0, size[1], gh + 1)
+    return np.array([(xs[c], ys[r], xs[c + 1], ys[r + 1]) for r in range(gh) for c in range(gw)])
+
+
+def cut_tiles(source, scales=DEFAULT_SCALES, overlap=DEFAULT_OVERLAP, min_std=MIN_TILE_STD,
+              working_size=WORKING_SIZE):
+    """Decode ``source`` once and return its non-empty tiles as ``(n, 224, 224, 3)`` uint8 plus their boxes.
+
+    ``content`` marks heatmap cells with texture (dilated by one cell), so regions
+    never spread from a large tile into the open water around its jellyfish.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    with timer("tiles.cut"), Image.open(source) as img:
+        img.draft("RGB", (working_size, working_size))
+        img = img.convert("RGB")
+        if max(img.size) > working_size:
+            img.thumbnail((working_size, working_size))
+        width, height = img.size
+        boxes, tile_scales = tile_boxes(width, height, scales, overlap)
+        small = img.convert("L")
+        small.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        grey = np.asarray(small, dtype=np.float32) / 255.0
+        keep = tile_std(grey, boxes, small.width / width) >= min_std
+        shape = grid_shape((width, height))
+        content = (tile_std(grey, _cell_boxes((width, height), shape), small.width / width) >= min_std).reshape(shape)
+        content = np.pad(content, 1)
+        content = (content[1:-1, 1:-1] | content[:-2, 1:-1] | content[2:, 1:-1]
+                   | content[1:-1, :-2] | content[1:-1, 2:])
+        crops = np.stack([np.asarray(img.resize(IMAGE_SIZE, box=tuple(map(int, box)))) for box in boxes[keep]]) \
+            if keep.any() else np.empty((0, *IMAGE_SIZE, 3), dtype=np.uint8)
+    return {"size": (width, height), "boxes": boxes[keep], "scales": tile_scales[keep], "tiles": len(boxes),
+            "crops": crops, "content": content}
+
+
+# ── Merging ──────────────────────────────────────────────────
+def _components(labels):
+    """4-connected components of equal non-negative labels: ``[(label, [(row, col), ...]), ...]``."""
+    seen = np.zeros(labels.shape, dtype=bool)
+    components = []
+    for r, c in zip(*np.nonzero(labels >= 0)):
+        if seen[r, c]:
+            continue
+        label, cells, todo = labels[r, c], [], deque([(r, c)])
+        seen[r, c] = True
+        while todo:
+            y, x = todo.popleft()
+            cells.append((y, x))
+            for ny, nx in ((y - 1, x), (y + 1, x), (y, x - 1), (y, x + 1)):
+                if 0 <= ny < labels.shape[0] and 0 <= nx < labels.shape[1] and not seen[ny, nx] \
+                        and labels[ny, nx] == label:
+                    seen[ny, nx] = True
+                    todo.append((ny, nx))
+        components.append((int(label), cells))
+    return components
+
+
+def merge_tiles(size, boxes, scales, probs, min_confidence=DEFAULT_MIN_CONFIDENCE, content=None,
+                grid_cells=GRID_CELLS):
+    """Per-region labels and per-species counts from tile softmax rows.
+
+    Returns ``{"grid", "labels", "regions", "counts"}``: ``grid`` is the weighted mean
+    softmax per heatmap cell (NaN where every tile was skipped), ``labels`` the class
+    index of each confident cell (-1 elsewhere), and each region carries its
+    species, pixel box, mean and peak confidence. Cells outside the optional
+    ``content`` mask are never labelled.
+    """
+    width, height = size
+    gh, gw = content.shape if content is not None else grid_shape(size, grid_cells)
+    acc = np.zeros((gh, gw, len(CLASS_NAMES)), dtype=np.float32)
+    weight = np.zeros((gh, gw), dtype=np.float32)
+    for (x0, y0, x1, y1), scale, p in zip(boxes, scales, probs):
+        c0, c1 = int(x0 * gw // width), max(int(x0 * gw // width) + 1, int(-(-x1 * gw // width)))
+        r0, r1 = int(y0 * gh // height), max(int(y0 * gh // height) + 1, int(-(-y1 * gh // height)))
+        acc[r0:r1, c0:c1] += p / scale  # a small tile localises better than a large one
+        weight[r0:r1, c0:c1] += 1.0 / scale
+    with np.errstate(invalid="ignore", divide="ignore"):
+        grid = acc / weight[..., None]
+    confidence = np.nan_to_num(grid.max(axis=2), nan=0.0)
+    confident = confidence >= min_confidence
+    if content is not None:
+        confident &= content
+    labels = np.where(confident, np.nan_to_num(grid, nan=0.0).argmax(axis=2), -1)
+    regions = []
+    for label, cells in _components(labels):
+        if len(cells) < MIN_REGION_CELLS:
+            labels[tuple(np.array(cells).T)] = -1
+            continue
+        rows, cols = np.array(cells).T
+        regions.append({
+            "class": label,
+            "species": CLASS_NAMES[label],
+            "box": (int(cols.min() * width / gw), int(rows.min() * height / gh),
+                    int(-(-(cols.max() + 1) * width // gw)), int(-(-(rows.max() + 1) * height // gh))),
+            "confidence": float(confidence[rows, cols].mean()),
+            "peak": float(confidence[rows, cols].max()),
+            "cells": len(cells),
+        })
+    regions.sort(key=lambda r: -r["confidence"])
+    return {"grid": grid.astype(np.float16), "labels": labels.astype(np.int8), "regions": regions,
+            "counts": dict(Counter(r["species"] for r in regions))}
+
+
+# ── Inference ────────────────────────────────────────────────
+def classify_tiled(model, items, source=lambda item: item, scales=DEFAULT_SCALES, overlap=DEFAULT_OVERLAP,
+                   min_std=MIN_TILE_STD, min_confidence=DEFAULT_MIN_CONFIDENCE, workers=DEFAULT_WORKERS,
+                   max_tiles=MAX_TILES):
+    """Yield ``(item, result, error)`` per item, in order; exactly one of ``result``/``error`` is set.
+
+    Images are cut in parallel a group at a time; the group's tiles share
+    ``predict_on_batch`` calls of up to ``max_tiles`` rows. ``result`` is the
+    ``merge_tiles`` dict plus ``size``, ``tiles`` and ``classified`` counts.
+    """
+    items = list(items)
+    group = max(1, workers) * 2
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="jellyfish-tiles") as pool:
+        for start in range(0, len(items), group):
+            chunk = items[start:start + group]
+            futures = [pool.submit(cut_tiles, source(item), scales, overlap, min_std) for item in chunk]
+            cut, errors = [], {}
+            for i, future in enumerate(futures):
+                try:
+                    cut.append(future.result())
+                except Exception as e:
+                    cut.append(None)
+                    errors[i] = e
+            crops = [c["crops"] for c in cut if c is not None]
+            stacked = np.concatenate(crops) if crops else np.empty((0, *IMAGE_SIZE, 3), dtype=np.uint8)
+            probs = [predict_batch(model, stacked[s:s + max_tiles].astype(np.float32) / 255.0)
+                     for s in range(0, len(stacked), max_tiles)]
+            probs = np.concatenate(probs) if probs else np.empty((0, len(CLASS_NAMES)), dtype=np.float32)
+            offset = 0
+            for i, (item, c) in enumerate(zip(chunk, cut)):
+                if c is None:
+                    yield item, None, errors[i]
+                    continue
+                n = len(c["crops"])
+                with timer("tiles.merge"):
+                    result = merge_tiles(c["size"], c["boxes"], c["scales"], probs[offset:offset + n], min_confidence,
+                                         c["content"])
+                offset += n
+                result.update(size=c["size"], tiles=c["tiles"], classified=n)
+                yield item, result, None
+
+
+# ── Overlay ──────────────────────────────────────────────────
+def heatmap_overlay(source, result, width=640, quality=80):
+    """WebP bytes of the image with the confident heatmap cells tinted and regions boxed and labelled."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    with timer("tiles.overlay"), Image.open(source) as img:
+        img.draft("RGB", (width, width))
+        img = img.convert("RGB")
+        img.thumbnail((width, width))
+        grid = np.nan_to_num(result["grid"].astype(np.float32), nan=0.0)
+        confidence = grid.max(axis=2)
+        colors = np.array(CLASS_COLORS, dtype=np.uint8)[grid.argmax(axis=2)]
+        alpha = np.where(result["labels"] >= 0, confidence * 140, 0).astype(np.uint8)
+        tint = Image.fromarray(np.dstack([colors, alpha]), "RGBA").resize(img.size, Image.BILINEAR)
+        canvas = Image.alpha_composite(img.convert("RGBA"), tint)
+        draw = ImageDraw.Draw(canvas)
+        sx, sy = img.width / result["size"][0], img.height / result["size"][1]
+        for region in result["regions"]:
+            x0, y0, x1, y1 = region["box"]
+            color = CLASS_COLORS[region["class"]]
+            draw.rectangle((x0 * sx, y0 * sy, x1 * sx, y1 * sy), outline=color, width=2)
+            label = f"{region['species'].replace('_', ' ')} {region['confidence']*100:.0f}%"
+            draw.text((x0 * sx + 4, y0 * sy + 2), label, fill=color)
+        buf = io.BytesIO()
+        canvas.convert("RGB").save(buf, format="WEBP", quality=quality)
+        return buf.getvalue()
+
+
+def count_summary(counts):
+    """``"3 × Moon Jellyfish · 1 × Compass Jellyfish"``, most numerous first."""
+    return " · ".join(f"{n} × {species.replace('_', ' ').title()}"
+                      for species, n in sorted(counts.items(), key=lambda kv: -kv[1]))
@@ -0,0 +1,96 @@
+"""Test-time augmentation: average the softmax over several views of each image.
+
+All views of a batch come from one fancy-indexing gather over precomputed
+crop/flip index grids plus a broadcast brightness multiply, so augmenting
+costs a single NumPy op, and every view of an image goes through the same
+``predict_on_batch`` call. ``refine`` re-scores only the rows whose first-pass
+confidence falls in the chosen bands.
+"""
+
+import os
+import time
+
+import numpy as np
+
+from jellyfish.inference import BATCH_SIZE, predict_batch
+from jellyfish.metrics import METRICS
+from jellyfish.results import confidence_status
+
+# (centre-crop fraction, horizontal flip, brightness); the first view is the untouched image
+VIEWS = (
+    (1.0, False, 1.0),
+    (1.0, True, 1.0),
+    (0.875, False, 1.0),
+    (0.875, True, 1.0),
+    (1.0, False, 1.2),
+    (1.0, False, 0.85),
+    (0.75, False, 1.0),
+    (0.875, True, 1.15),
+)
+DEFAULT_VIEWS = int(os.environ.get("JELLYFISH_TTA_VIEWS", "8"))
+MODES = ("off", "auto", "all")
+AUTO_BANDS = ("LOW", "MODERATE")
+
+
+def _index_grids(views, size):
+    rows, cols = [], []
+    for crop, flip, _ in views:
+        span = [max(1, round(s * crop)) for s in size]
+        offset = [(s - n) // 2 for s, n in zip(size, span)]
+        # Nearest-neighbour resize of the centre crop back to full size
+        r = offset[0] + np.arange(size[0]) * span[0] // size[0]
+        c = offset[1] + np.arange(size[1]) * span[1] // size[1]
+        rows.append(r)
+        cols.append(c[::-1] if flip else c)
+    return np.stack(rows)[:, :, None], np.stack(cols)[:, None, :]
+
+
+def augment_batch(batch, k=DEFAULT_VIEWS, views=VIEWS):
+    """``(n, h, w, 3)`` → ``(n * k, h, w, 3)``, the ``k`` views of each image adjacent."""
+    views = views[:k]
+    rows, cols = _index_grids(views, batch.shape[1:3])
+    brightness = np.array([b for _, _, b in views], dtype=batch.dtype)[None, :, None, None, None]
+    out = batch[:, rows, cols] * brightness  # (n, k, h, w, 3)
+    np.clip(out, 0.0, 1.0, out=out)
+    return out.reshape(-1, *batch.shape[1:])
+
+
+def predict_tta(model, batch, k=DEFAULT_VIEWS, max_rows=BATCH_SIZE * 2):
+    """Softmax averaged over ``k`` views, plus the seconds spent on each image."""
+    k = max(1, min(k, len(VIEWS)))
+    per_call = max(1, max_rows // k)
+    probs, costs = [], []
+    for start in range(0, len(batch), per_call):
+        chunk = batch[start:start + per_call]
+        t0 = time.perf_counter()
+        with METRICS.timer("tta.augment"):
+            views = augment_batch(chunk, k)
+        p = predict_batch(model, views).reshape(len(chunk), k, -1).mean(axis=1)
+        elapsed = time.perf_counter() - t0
+        probs.append(p)
+        costs.extend([elapsed / len(chunk)] * len(chunk))
+        for _ in chunk:
+            METRICS.observe("tta.per_image", elapsed / len(chunk))
+    return np.concatenate(probs, axis=0), np.array(costs)
+
+
+def select(probs, mode="auto", bands=AUTO_BANDS):
+    """Row indices that ``mode`` sends through TTA, judged on first-pass confidence."""
+    if mode == "off":
+        return []
+    return [i for i, p in enumerate(probs) if mode == "all" or confidence_status(float(np.max(p))) in bands]
+
+
+def refine(model, batch, probs, mode="auto", k=DEFAULT_VIEWS, bands=AUTO_BANDS):
+    """``(probs, costs)`` with TTA applied per ``mode``; ``costs`` is 0 for untouched rows."""
+    probs = np.array(probs, dtype=np.float32)
+    costs = np.zeros(len(probs))
+    selected = np.array(select(probs, mode, bands), dtype=int)
+    if len(selected):
+        probs[selected], costs[selected] = predict_tta(model, batch[selected], k)
+    return probs, costs
+
+
+def tag(k=DEFAULT_VIEWS):
+    """Suffix for prediction-cache keys so TTA results never mix with plain ones."""
+    return f":tta{k}"
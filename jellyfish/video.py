@@ -0,0 +1,358 @@
+"""Video and camera-stream classification with adaptive frame sampling.
+
+``FrameReader`` decodes frames on a background thread (OpenCV for video files,
+camera indices and stream URLs; Pillow for animated GIFs) into a small queue.
+A live source never waits for the model: when the queue is full the oldest
+frame is dropped. ``FrameSampler`` compares a 32×32 grey thumbnail of each
+frame with the last sampled one and skips near-static frames, keeping one
+every ``max_gap`` seconds regardless; on a live source it also stretches the
+minimum interval between samples to the measured model cost so classification
+keeps up with real time. Sampled frames go through the usual
+``PreprocessPipeline`` and ``predict_on_batch``; ``TemporalSmoother`` applies a
+time-constant exponential moving average to the softmax, and
+``detect_segments`` turns runs of the same smoothed top class into detections.
+"""
+
+import math
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+from jellyfish.inference import predict_batch
+from jellyfish.metrics import METRICS, timer
+from jellyfish.pipeline import PreprocessPipeline
+from jellyfish.species import CLASS_NAMES, JELLYFISH_INFO
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".webm", ".gif")
+# Mean absolute grey-level change (0–1) against the last sampled frame that counts as motion
+DEFAULT_MOTION_THRESHOLD = float(os.environ.get("JELLYFISH_VIDEO_MOTION", "0.02"))
+DEFAULT_MAX_GAP = 2.0  # seconds; a static scene is still re-checked this often
+DEFAULT_SMOOTHING = 1.0  # seconds; time constant of the softmax moving average
+DEFAULT_MIN_CONFIDENCE = 0.60
+DEFAULT_MIN_DURATION = 0.5  # seconds; shorter detections are treated as flicker
+STREAM_BATCH_SIZE = 8  # small batches keep latency low on a live source
+REALTIME_BUDGET = 0.8  # share of wall time the model may use on a live source
+THUMBNAIL_SIZE = 32
+
+Frame = namedtuple("Frame", ["index", "time", "image"])
+
+_DONE = object()
+
+
+def is_live(source):
+    """Camera indices and stream URLs (``rtsp://``, ``http://``…) are live; file paths are not."""
+    return isinstance(source, int) or str(source).isdigit() or "://" in str(source)
+
+
+# ── Decode ───────────────────────────────────────────────────
+def _gif_frames(path):
+    with Image.open(path) as img:
+        t = 0.0
+        for frame in ImageSequence.Iterator(img):
+            yield t, np.asarray(frame.convert("RGB"))
+            t += frame.info.get("duration", 100) / 1000
+
+
+def _opencv_frames(source, live):
+    try:
+        import cv2
+    except ImportError as e:
+        raise RuntimeError("Video decoding needs OpenCV: pip install opencv-python-headless") from e
+    capture = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+    if not capture.isOpened():
+        raise OSError(f"Could not open video source {source}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+    start = time.perf_counter()
+    try:
+        index = 0
+        while True:
+            ok, bgr = capture.read()
+            if not ok:
+                return
+            if live:
+                t = time.perf_counter() - start
+            else:
+                # Container timestamps when the file has them, else the nominal frame rate
+                t = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000 or (index / fps if fps else 0.0)
+            yield t, cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+            index += 1
+    finally:
+        capture.release()
+
+
+def decode_frames(source, live=False):
+    """Yield ``(seconds, (h, w, 3) uint8 RGB)`` for every frame of ``source``."""
+    if str(source).lower().endswith(".gif"):
+        return _gif_frames(source)
+    return _opencv_frames(source, live)
+
+
+class FrameReader:
+    """Iterates ``Frame`` tuples decoded one step ahead on a background thread.
+
+    ``replay_fps`` replays a file at a fixed frame rate with live-source
+    semantics (paced frames, drops when the consumer lags), standing in for a camera.
+    """
+
+    def __init__(self, source, replay_fps=None, max_queue=STREAM_BATCH_SIZE * 2):
+        self.source = source
+        self.replay_fps = replay_fps
+        self.live = bool(replay_fps) or is_live(source)
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.last_time = 0.0
+        self._q = queue.Queue(maxsize=max(1, max_queue))
+        self._stop = threading.Event()
+
+    def __iter__(self):
+        reader = threading.Thread(target=self._run, name="jellyfish-video", daemon=True)
+        reader.start()
+        try:
+            while True:
+                item = self._q.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self._stop.set()
+            reader.join()
+
+    def ready(self):
+        """Frames decoded and waiting, i.e. available without blocking."""
+        return self._q.qsize()
+
+    def _run(self):
+        try:
+            start = time.perf_counter()
+            frames = iter(decode_frames(self.source, live=self.live and not self.replay_fps))
+            index = 0
+            while not self._stop.is_set():
+                with timer("video.decode"):
+                    decoded = next(frames, None)
+                if decoded is None:
+                    return
+                t, image = decoded
+                if self.replay_fps:
+                    t = index / self.replay_fps
+                    delay = start + t - time.perf_counter()
+                    if delay > 0 and self._stop.wait(delay):
+                        return
+                frame = Frame(index, t, image)
+                index += 1
+                self.frames_read += 1
+                self.last_time = t
+                if self.live:
+                    self._put_latest(frame)
+                elif not self._put(frame):
+                    return
+        except BaseException as e:
+            self._put(e)
+        finally:
+            self._put(_DONE)
+
+    def _put(self, value):
+        # Blocks while the queue is full but gives up once the consumer has gone
+        while not self._stop.is_set():
+            try:
+                self._q.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _put_latest(self, frame):
+        # A live source never waits for the model: the oldest queued frame makes room
+        while True:
+            try:
+                self._q.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self._q.get_nowait()
+                    self.frames_dropped += 1
+                except queue.Empty:
+                    pass
+
+
+# ── Sampling ─────────────────────────────────────────────────
+def thumbnail(image, size=THUMBNAIL_SIZE):
+    """Strided ``size``×``size``-ish grey thumbnail in ``[0, 1]``; no resampling, so it costs microseconds."""
+    h, w = image.shape[:2]
+    small = image[::max(1, h // size), ::max(1, w // size)]
+    return small.mean(axis=2, dtype=np.float32) / 255.0
+
+
+class FrameSampler:
+    def __init__(self, threshold=DEFAULT_MOTION_THRESHOLD, max_gap=DEFAULT_MAX_GAP, min_interval=0.0):
+        self.threshold = threshold
+        self.max_gap = max_gap
+        self.base_interval = min_interval
+        self.min_interval = min_interval
+        self.sampled = 0
+        self.skipped = 0
+        self._last = None
+        self._last_time = None
+        self._cost = None
+
+    def accept(self, frame):
+        """``(sample?, motion)`` for one frame, judged against the last sampled frame."""
+        thumb = thumbnail(frame.image)
+        if self._last is None or thumb.shape != self._last.shape:
+            motion, keep = 1.0, True
+        else:
+            dt = frame.time - self._last_time
+            motion = float(np.abs(thumb - self._last).mean())
+            keep = dt >= self.min_interval and (motion >= self.threshold or dt >= self.max_gap)
+        if keep:
+            self._last, self._last_time = thumb, frame.time
+            self.sampled += 1
+        else:
+            self.skipped += 1
+        return keep, motion
+
+    def pace(self, seconds_per_frame):
+        """Space samples so the model needs at most ``REALTIME_BUDGET`` of wall time (live sources)."""
+        self._cost = seconds_per_frame if self._cost is None else 0.8 * self._cost + 0.2 * seconds_per_frame
+        self.min_interval = max(self.base_interval, self._cost / REALTIME_BUDGET)
+
+
+# ── Smoothing and segments ───────────────────────────────────
+class TemporalSmoother:
+    """Exponential moving average of softmax rows with a time constant, so uneven sampling is handled."""
+
+    def __init__(self, tau=DEFAULT_SMOOTHING):
+        self.tau = tau
+        self._state = None
+        self._time = None
+
+    def update(self, t, probs):
+        probs = np.asarray(probs, dtype=np.float32)
+        if self._state is None or self.tau <= 0:
+            self._state = probs.copy()
+        else:
+            alpha = 1.0 - math.exp(-max(0.0, t - self._time) / self.tau)
+            self._state = self._state + alpha * (probs - self._state)
+        self._time = t
+        return self._state
+
+
+def classify_stream(model, reader, sampler=None, smoother=None, pipeline=None):
+    """Yield one row per classified frame: ``{frame, time, motion, probs, smoothed}``.
+
+    Skipped frames produce no row; their scene is covered by the last sampled frame.
+    """
+    sampler = sampler or FrameSampler()
+    smoother = smoother or TemporalSmoother()
+    pipeline = pipeline or PreprocessPipeline(workers=2, batch_size=STREAM_BATCH_SIZE)
+
+    def sampled_batches():
+        # A live source never waits for a full batch: whatever has been sampled when
+        # the reader runs dry goes to the model, so latency stays at one frame interval
+        chunk = []
+        for frame in reader:
+            keep, motion = sampler.accept(frame)
+            if keep:
+                chunk.append((frame, motion))
+            if chunk and (len(chunk) >= pipeline.batch_size or (reader.live and not reader.ready())):
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    for batch in pipeline.batches(sampled_batches(), source=lambda item: item[0].image, grouped=True):
+        if not batch.keys:
+            continue
+        t0 = time.perf_counter()
+        probs = predict_batch(model, batch.array)
+        elapsed = time.perf_counter() - t0
+        METRICS.observe("video.per_frame", elapsed / len(batch.keys))
+        if reader.live:
+            sampler.pace(elapsed / len(batch.keys))
+        for (frame, motion), p in zip(batch.keys, probs):
+            yield {"frame": frame.index, "time": frame.time, "motion": motion, "probs": p,
+                   "smoothed": smoother.update(frame.time, p)}
+
+
+def detect_segments(rows, min_confidence=DEFAULT_MIN_CONFIDENCE, min_duration=DEFAULT_MIN_DURATION, end_time=None):
+    """Runs of one smoothed top class above ``min_confidence`` lasting at least ``min_duration`` seconds.
+
+    A segment lasts until the next sampled frame that changes the class (or
+    ``end_time``); same-species segments split only by flicker are merged.
+    """
+    runs = []
+    for row in rows:
+        top = int(np.argmax(row["smoothed"]))
+        confidence = float(row["smoothed"][top])
+        label = top if confidence >= min_confidence else None
+        if runs and runs[-1]["class"] == label:
+            run = runs[-1]
+            run["frames"] += 1
+            run["confidence_sum"] += confidence
+            run["peak"] = max(run["peak"], confidence)
+        else:
+            if runs:
+                runs[-1]["end"] = row["time"]
+            runs.append({"class": label, "start": row["time"], "end": row["time"], "frames": 1,
+                         "confidence_sum": confidence, "peak": confidence})
+    if runs:
+        runs[-1]["end"] = max(runs[-1]["end"], end_time if end_time is not None else runs[-1]["end"])
+    segments = []
+    for run in runs:
+        if run["class"] is None or run["end"] - run["start"] < min_duration:
+            continue
+        previous = segments[-1] if segments else None
+        if previous and previous["class"] == run["class"] and run["start"] - previous["end"] <= min_duration:
+            previous["end"] = run["end"]
+            previous["frames"] += run["frames"]
+            previous["confidence_sum"] += run["confidence_sum"]
+            previous["peak"] = max(previous["peak"], run["peak"])
+        else:
+            segments.append(dict(run))
+    for segment in segments:
+        segment["species"] = CLASS_NAMES[segment["class"]]
+        segment["confidence"] = segment.pop("confidence_sum") / segment["frames"]
+    return segments
+
+
+# ── Output rows ──────────────────────────────────────────────
+FRAME_COLUMNS = ["Time (s)", "Frame", "Motion", "Predicted Species", "Confidence (%)",
+                 "Smoothed Species", "Smoothed Confidence (%)"]
+SEGMENT_COLUMNS = ["Start (s)", "End (s)", "Duration (s)", "Species", "Scientific Name",
+                   "Mean Confidence (%)", "Peak Confidence (%)", "Frames"]
+
+
+def _species(index):
+    return CLASS_NAMES[index].replace('_', ' ').title()
+
+
+def frame_row(row):
+    top, smoothed_top = int(np.argmax(row["probs"])), int(np.argmax(row["smoothed"]))
+    return {
+        "Time (s)": f"{row['time']:.2f}",
+        "Frame": row["frame"],
+        "Motion": f"{row['motion']:.3f}",
+        "Predicted Species": _species(top),
+        "Confidence (%)": f"{row['probs'][top]*100:.1f}",
+        "Smoothed Species": _species(smoothed_top),
+        "Smoothed Confidence (%)": f"{row['smoothed'][smoothed_top]*100:.1f}",
+    }
+
+
+def segment_row(segment):
+    return {
+        "Start (s)": f"{segment['start']:.2f}",
+        "End (s)": f"{segment['end']:.2f}",
+        "Duration (s)": f"{segment['end'] - segment['start']:.2f}",
+        "Species": _species(segment["class"]),
+        "Scientific Name": JELLYFISH_INFO.get(segment["species"], {}).get("scientific", ""),
+        "Mean Confidence (%)": f"{segment['confidence']*100:.1f}",
+        "Peak Confidence (%)": f"{segment['peak']*100:.1f}",
+        "Frames": segment["frames"],
+    }